@@ -9,6 +9,62 @@ class Settings(BaseSettings):
     # MQTT
     MQTT_BROKER: str
     MQTT_PORT: int = 1883
+    MQTT_QOS: int = 1
+    MQTT_OUTBOX_SIZE: int = 10000
+    # Publicaciones QoS 1 esperando PUBACK a la vez
+    MQTT_MAX_INFLIGHT: int = 32
+    # Segundos que un comando a un actuador espera conexión antes de descartarse
+    MQTT_COMMAND_TTL: float = 60.0
+    MQTT_RECONNECT_MIN: float = 0.5
+    MQTT_RECONNECT_MAX: float = 30.0
+    # Varios workers: MQTT_SHARED_GROUP reparte la ingesta con una suscripción
+    # compartida (MQTT v5, $share/<grupo>/...) y MQTT_LIVE_TOPIC lleva las
+    # lecturas a los WebSocket de todos los workers (y en /config y /sensors
+    # las invalidaciones de las cachés). Vacíos = un solo worker.
+    # La unión de tramas y el descarte de duplicados son por worker: el broker
+    # reparte cada mensaje a cualquiera del grupo, así que parciales y
+    # reenvíos de una misma trama pueden caer en workers distintos.
+    MQTT_SHARED_GROUP: str = ""
+    MQTT_LIVE_TOPIC: str = ""
+
+    # Ingesta
+    INGEST_BATCH_SIZE: int = 500
+    INGEST_FLUSH_INTERVAL: float = 1.0
+    INGEST_MAX_PENDING: int = 50000
+    FRAME_MERGE_WINDOW: float = 0.5
+    FRAME_DEDUP_TTL: float = 60.0
+
+    # Pipeline (policies: block | drop_oldest | spill)
+    PIPELINE_PERSIST_QUEUE_SIZE: int = 10000
+    PIPELINE_PERSIST_POLICY: str = "spill"
+    PIPELINE_BROADCAST_QUEUE_SIZE: int = 1000
+    PIPELINE_BROADCAST_POLICY: str = "drop_oldest"
+    PIPELINE_SPILL_DIR: str = "spill"
+    # Espera máxima al apagar para vaciar cada etapa (con spill, el resto queda en disco)
+    PIPELINE_DRAIN_TIMEOUT: float = 10.0
+
+    # Lecturas recientes en memoria (por serie device/sensor)
+    RECENT_READINGS_CAPACITY: int = 200
+
+    # WebSocket (slow client policy: conflate | evict)
+    WS_QUEUE_SIZE: int = 100
+    WS_SEND_TIMEOUT: float = 5.0
+    WS_SLOW_CLIENT_POLICY: str = "conflate"
+
+    # Logs (escritos por un hilo aparte). LOG_LEVELS: niveles por módulo,
+    # p. ej. "app.services.mqtt_service=DEBUG,aiomqtt=WARNING".
+    # LOG_DEBUG_SAMPLE_RATE: 1 de cada N registros DEBUG por línea de código.
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: str = ""
+    LOG_FORMAT: str = "text"
+    LOG_DEBUG_SAMPLE_RATE: int = 100
+    LOG_QUEUE_SIZE: int = 10000
+
+    # Métricas con varios workers: cada uno vuelca las suyas (etiqueta
+    # `worker`) en METRICS_DIR cada METRICS_SYNC_INTERVAL s y /metrics las
+    # devuelve todas, responda el worker que responda. Vacío = un solo worker.
+    METRICS_DIR: str = ""
+    METRICS_SYNC_INTERVAL: float = 5.0
 
     # Auth
     SECRET_KEY: str
@@ -9,70 +9,70 @@ INSERT INTO device_configuration(device_configuration_id, device_id, actuador, v
 (2,1,'servo',90),
 (3,1,'motor',1);
 
-INSERT INTO device_sensor(device_sensor_id, device_id, sensor_id, value, event_date, event_time) VALUES
-(1,1,1,23.95,'2025-11-28','20:07:20.008913'),
-(2,1,1,23.95,'2025-11-28','20:07:20.026416'),
-(3,1,2,1.0,'2025-11-28','20:07:20.026416'),
-(4,1,1,23.95,'2025-11-28','20:07:20.029146'),
-(5,1,2,1.0,'2025-11-28','20:07:20.029146'),
-(6,1,3,41.03,'2025-11-28','20:07:20.029146'),
-(7,1,1,24.44,'2025-11-28','20:07:24.022065'),
-(8,1,1,24.44,'2025-11-28','20:07:24.064805'),
-(9,1,2,62.0,'2025-11-28','20:07:24.064805'),
-(10,1,1,24.44,'2025-11-28','20:07:24.077360'),
-(11,1,2,62.0,'2025-11-28','20:07:24.077360'),
-(12,1,3,41.23,'2025-11-28','20:07:24.077360'),
-(13,1,1,24.44,'2025-11-28','20:07:27.936546'),
-(14,1,1,24.44,'2025-11-28','20:07:27.939522'),
-(15,1,2,63.0,'2025-11-28','20:07:27.939522'),
-(16,1,1,24.44,'2025-11-28','20:07:27.942636'),
-(17,1,2,63.0,'2025-11-28','20:07:27.942636'),
-(18,1,3,41.73,'2025-11-28','20:07:27.942636'),
-(19,1,1,24.44,'2025-11-28','20:07:31.951333'),
-(20,1,1,24.44,'2025-11-28','20:07:31.954599'),
-(21,1,2,62.0,'2025-11-28','20:07:31.954599'),
-(22,1,1,24.44,'2025-11-28','20:07:31.957634'),
-(23,1,2,62.0,'2025-11-28','20:07:31.957634'),
-(24,1,3,42.14,'2025-11-28','20:07:31.957634'),
-(25,1,1,24.44,'2025-11-28','20:07:35.965815'),
-(26,1,1,24.44,'2025-11-28','20:07:35.970368'),
-(27,1,2,68.0,'2025-11-28','20:07:35.970368'),
-(28,1,1,24.44,'2025-11-28','20:07:35.975276'),
-(29,1,2,68.0,'2025-11-28','20:07:35.975276'),
-(30,1,3,42.11,'2025-11-28','20:07:35.975276'),
-(31,1,1,24.44,'2025-11-28','20:07:39.980380'),
-(32,1,1,24.44,'2025-11-28','20:07:39.983365'),
-(33,1,2,66.0,'2025-11-28','20:07:39.983365'),
-(34,1,1,24.44,'2025-11-28','20:07:39.985458'),
-(35,1,2,66.0,'2025-11-28','20:07:39.985458'),
-(36,1,3,42.14,'2025-11-28','20:07:39.985458'),
-(37,1,1,24.44,'2025-11-28','20:07:43.998327'),
-(38,1,1,24.44,'2025-11-28','20:07:44.002394'),
-(39,1,2,61.0,'2025-11-28','20:07:44.002394'),
-(40,1,1,24.44,'2025-11-28','20:07:44.007152'),
-(41,1,2,61.0,'2025-11-28','20:07:44.007152'),
-(42,1,3,42.31,'2025-11-28','20:07:44.007152'),
-(43,1,1,24.44,'2025-11-28','20:07:48.012846'),
-(44,1,1,24.44,'2025-11-28','20:07:48.015624'),
-(45,1,2,61.0,'2025-11-28','20:07:48.015624'),
-(46,1,1,24.44,'2025-11-28','20:07:48.019133'),
-(47,1,2,61.0,'2025-11-28','20:07:48.019133'),
-(48,1,3,42.65,'2025-11-28','20:07:48.019133'),
-(49,1,1,24.44,'2025-11-28','20:07:52.026916'),
-(50,1,1,24.44,'2025-11-28','20:07:52.030956'),
-(51,1,2,61.0,'2025-11-28','20:07:52.030956'),
-(52,1,1,24.44,'2025-11-28','20:07:52.033990'),
-(53,1,2,61.0,'2025-11-28','20:07:52.033990'),
-(54,1,3,42.92,'2025-11-28','20:07:52.033990'),
-(55,1,1,24.44,'2025-11-28','20:07:55.941991'),
-(56,1,1,24.44,'2025-11-28','20:07:55.945064'),
-(57,1,2,1.0,'2025-11-28','20:07:55.945064'),
-(58,1,1,24.44,'2025-11-28','20:07:55.948593'),
-(59,1,2,1.0,'2025-11-28','20:07:55.948593'),
-(60,1,3,43.08,'2025-11-28','20:07:55.948593'),
-(61,1,1,24.44,'2025-11-28','20:07:59.954910'),
-(62,1,1,24.44,'2025-11-28','20:07:59.959169'),
-(63,1,2,1.0,'2025-11-28','20:07:59.959169'),
-(64,1,1,24.44,'2025-11-28','20:07:59.964040'),
-(65,1,2,1.0,'2025-11-28','20:07:59.964040'),
-(66,1,3,42.92,'2025-11-28','20:07:59.964040');
+INSERT INTO device_sensor(device_sensor_id, device_id, sensor_id, value, event_ts) VALUES
+(1,1,1,23.95,'2025-11-28 20:07:20.008913'),
+(2,1,1,23.95,'2025-11-28 20:07:20.026416'),
+(3,1,2,1.0,'2025-11-28 20:07:20.026416'),
+(4,1,1,23.95,'2025-11-28 20:07:20.029146'),
+(5,1,2,1.0,'2025-11-28 20:07:20.029146'),
+(6,1,3,41.03,'2025-11-28 20:07:20.029146'),
+(7,1,1,24.44,'2025-11-28 20:07:24.022065'),
+(8,1,1,24.44,'2025-11-28 20:07:24.064805'),
+(9,1,2,62.0,'2025-11-28 20:07:24.064805'),
+(10,1,1,24.44,'2025-11-28 20:07:24.077360'),
+(11,1,2,62.0,'2025-11-28 20:07:24.077360'),
+(12,1,3,41.23,'2025-11-28 20:07:24.077360'),
+(13,1,1,24.44,'2025-11-28 20:07:27.936546'),
+(14,1,1,24.44,'2025-11-28 20:07:27.939522'),
+(15,1,2,63.0,'2025-11-28 20:07:27.939522'),
+(16,1,1,24.44,'2025-11-28 20:07:27.942636'),
+(17,1,2,63.0,'2025-11-28 20:07:27.942636'),
+(18,1,3,41.73,'2025-11-28 20:07:27.942636'),
+(19,1,1,24.44,'2025-11-28 20:07:31.951333'),
+(20,1,1,24.44,'2025-11-28 20:07:31.954599'),
+(21,1,2,62.0,'2025-11-28 20:07:31.954599'),
+(22,1,1,24.44,'2025-11-28 20:07:31.957634'),
+(23,1,2,62.0,'2025-11-28 20:07:31.957634'),
+(24,1,3,42.14,'2025-11-28 20:07:31.957634'),
+(25,1,1,24.44,'2025-11-28 20:07:35.965815'),
+(26,1,1,24.44,'2025-11-28 20:07:35.970368'),
+(27,1,2,68.0,'2025-11-28 20:07:35.970368'),
+(28,1,1,24.44,'2025-11-28 20:07:35.975276'),
+(29,1,2,68.0,'2025-11-28 20:07:35.975276'),
+(30,1,3,42.11,'2025-11-28 20:07:35.975276'),
+(31,1,1,24.44,'2025-11-28 20:07:39.980380'),
+(32,1,1,24.44,'2025-11-28 20:07:39.983365'),
+(33,1,2,66.0,'2025-11-28 20:07:39.983365'),
+(34,1,1,24.44,'2025-11-28 20:07:39.985458'),
+(35,1,2,66.0,'2025-11-28 20:07:39.985458'),
+(36,1,3,42.14,'2025-11-28 20:07:39.985458'),
+(37,1,1,24.44,'2025-11-28 20:07:43.998327'),
+(38,1,1,24.44,'2025-11-28 20:07:44.002394'),
+(39,1,2,61.0,'2025-11-28 20:07:44.002394'),
+(40,1,1,24.44,'2025-11-28 20:07:44.007152'),
+(41,1,2,61.0,'2025-11-28 20:07:44.007152'),
+(42,1,3,42.31,'2025-11-28 20:07:44.007152'),
+(43,1,1,24.44,'2025-11-28 20:07:48.012846'),
+(44,1,1,24.44,'2025-11-28 20:07:48.015624'),
+(45,1,2,61.0,'2025-11-28 20:07:48.015624'),
+(46,1,1,24.44,'2025-11-28 20:07:48.019133'),
+(47,1,2,61.0,'2025-11-28 20:07:48.019133'),
+(48,1,3,42.65,'2025-11-28 20:07:48.019133'),
+(49,1,1,24.44,'2025-11-28 20:07:52.026916'),
+(50,1,1,24.44,'2025-11-28 20:07:52.030956'),
+(51,1,2,61.0,'2025-11-28 20:07:52.030956'),
+(52,1,1,24.44,'2025-11-28 20:07:52.033990'),
+(53,1,2,61.0,'2025-11-28 20:07:52.033990'),
+(54,1,3,42.92,'2025-11-28 20:07:52.033990'),
+(55,1,1,24.44,'2025-11-28 20:07:55.941991'),
+(56,1,1,24.44,'2025-11-28 20:07:55.945064'),
+(57,1,2,1.0,'2025-11-28 20:07:55.945064'),
+(58,1,1,24.44,'2025-11-28 20:07:55.948593'),
+(59,1,2,1.0,'2025-11-28 20:07:55.948593'),
+(60,1,3,43.08,'2025-11-28 20:07:55.948593'),
+(61,1,1,24.44,'2025-11-28 20:07:59.954910'),
+(62,1,1,24.44,'2025-11-28 20:07:59.959169'),
+(63,1,2,1.0,'2025-11-28 20:07:59.959169'),
+(64,1,1,24.44,'2025-11-28 20:07:59.964040'),
+(65,1,2,1.0,'2025-11-28 20:07:59.964040'),
+(66,1,3,42.92,'2025-11-28 20:07:59.964040');
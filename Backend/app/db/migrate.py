@@ -0,0 +1,20 @@
+import logging
+from pathlib import Path
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+log = logging.getLogger(__name__)
+
+# Clave del advisory lock: con varios workers todos migran al arrancar
+MIGRATION_LOCK_ID = 0x5347_0001
+
+
+async def run_migrations(conn):
+    # Dura hasta el fin de la transacción: el primer worker migra (y crea las
+    # tablas) y los demás esperan y encuentran todo hecho
+    await conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_ID})")
+
+    # Cada archivo es una única sentencia idempotente (bloque DO)
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        await conn.exec_driver_sql(path.read_text(encoding="utf-8"))
+        log.info("Migración aplicada: %s", path.name)
@@ -0,0 +1,26 @@
+-- event_date + event_time -> event_ts (timestamptz) con índice (device_id, sensor_id, event_ts DESC).
+-- Idempotente: se ejecuta en cada arranque antes de create_all.
+-- Las filas antiguas se guardaron en hora local del API; se interpretan con el
+-- TimeZone de la sesión, así que conviene que coincida con el del servidor del API.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'device_sensor' AND column_name = 'event_date'
+    ) THEN
+        ALTER TABLE device_sensor ADD COLUMN IF NOT EXISTS event_ts timestamptz;
+        UPDATE device_sensor
+            SET event_ts = (event_date + event_time)::timestamptz
+            WHERE event_ts IS NULL;
+        ALTER TABLE device_sensor ALTER COLUMN event_ts SET NOT NULL;
+        ALTER TABLE device_sensor DROP COLUMN event_date, DROP COLUMN event_time;
+        RAISE NOTICE 'device_sensor migrada a event_ts';
+    END IF;
+
+    IF to_regclass('device_sensor') IS NOT NULL THEN
+        CREATE INDEX IF NOT EXISTS ix_device_sensor_device_sensor_ts
+            ON device_sensor (device_id, sensor_id, event_ts DESC)
+            INCLUDE (value, device_sensor_id);
+    END IF;
+END
+$$;
@@ -0,0 +1,11 @@
+-- Índice (device_id, event_ts, device_sensor_id) para exportar todos los
+-- sensores de un dispositivo: sin él cada página keyset ordena el rango entero.
+-- create_all sólo crea índices de tablas nuevas.
+DO $$
+BEGIN
+    IF to_regclass('device_sensor') IS NOT NULL THEN
+        CREATE INDEX IF NOT EXISTS ix_device_sensor_device_ts
+            ON device_sensor (device_id, event_ts, device_sensor_id);
+    END IF;
+END
+$$;
@@ -1,11 +1,13 @@
 from app.db.database import Base
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from datetime import date, time
+from datetime import date, time, datetime
 
 from sqlalchemy import (
     Identity,
     String,
+    DateTime,
+    Index,
     PrimaryKeyConstraint,
     ForeignKeyConstraint,
 )
@@ -50,8 +52,7 @@ class DeviceSensor(Base):
     sensor_id: Mapped[int] = mapped_column(nullable=False)
 
     value: Mapped[float] = mapped_column(nullable=False)
-    event_date: Mapped[date] = mapped_column(nullable=False)
-    event_time: Mapped[time] = mapped_column(nullable=False)
+    event_ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
 
     __table_args__ = (
         PrimaryKeyConstraint("device_sensor_id"),
@@ -63,6 +64,66 @@ class DeviceSensor(Base):
             ["sensor_id"],
             ["sensor.sensor_id"],
         ),
+        # "Últimas N lecturas" e históricos por rango: index-only scan ordenado
+        Index(
+            "ix_device_sensor_device_sensor_ts",
+            "device_id",
+            "sensor_id",
+            event_ts.desc(),
+            postgresql_include=["value", "device_sensor_id"],
+        ),
+        # Exportación de todos los sensores de un dispositivo, en orden keyset
+        Index(
+            "ix_device_sensor_device_ts",
+            "device_id",
+            "event_ts",
+            "device_sensor_id",
+        ),
+    )
+
+    # Compatibilidad con la API anterior (fecha y hora locales por separado)
+    @property
+    def event_date(self) -> date:
+        return self.event_ts.astimezone().date()
+
+    @property
+    def event_time(self) -> time:
+        return self.event_ts.astimezone().time()
+
+class DeviceSensorRollupMinute(Base):
+    __tablename__ = "device_sensor_rollup_minute"
+
+    device_id: Mapped[int] = mapped_column(nullable=False)
+    sensor_id: Mapped[int] = mapped_column(nullable=False)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    min_value: Mapped[float] = mapped_column(nullable=False)
+    max_value: Mapped[float] = mapped_column(nullable=False)
+    sum_value: Mapped[float] = mapped_column(nullable=False)
+    count: Mapped[int] = mapped_column(nullable=False)
+    last_value: Mapped[float] = mapped_column(nullable=False)
+    last_event: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("device_id", "sensor_id", "bucket_start"),
+    )
+
+class DeviceSensorRollupHour(Base):
+    __tablename__ = "device_sensor_rollup_hour"
+
+    device_id: Mapped[int] = mapped_column(nullable=False)
+    sensor_id: Mapped[int] = mapped_column(nullable=False)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    min_value: Mapped[float] = mapped_column(nullable=False)
+    max_value: Mapped[float] = mapped_column(nullable=False)
+    sum_value: Mapped[float] = mapped_column(nullable=False)
+    count: Mapped[int] = mapped_column(nullable=False)
+    last_value: Mapped[float] = mapped_column(nullable=False)
+    last_event: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("device_id", "sensor_id", "bucket_start"),
     )
 
 class Sensor(Base):
@@ -1,38 +1,158 @@
-from contextlib import asynccontextmanager
 import asyncio
-from fastapi import FastAPI
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from app.system.routes import router
-from app.services.mqtt_service import mqtt_listener
+from app.services.mqtt_service import mqtt_listener, pipeline_stages, frame_merger
+from app.services.mqtt_client import mqtt, WORKER_ID
+from app.services.ingest_buffer import sensor_buffer
+from app.services.sensor_catalog import sensor_catalog
+from app.services.recent_readings import recent_readings
+from app.services.device_config_cache import device_configs
+from app.services.device_registry import device_registry
+from app.services.websocket import manager
+from app.services import metrics
+from app.services.rollup_service import backfill_rollups
 from app.core.config import settings
+from common import logs
 from app.db.database import async_engine, Base
 from app.db import models
-import aiomqtt
+from app.db.migrate import run_migrations
+
+log = logging.getLogger(__name__)
+
+# Métricas que ya llevan otros servicios: se leen al momento del scrape
+metrics.registry.collected(
+    "smartgarden_websocket_clients", "Clientes WebSocket conectados", "gauge",
+    lambda: len(manager),
+)
+metrics.registry.collected(
+    "smartgarden_mqtt_connected", "1 si la conexión MQTT está activa", "gauge",
+    lambda: int(mqtt.connected.is_set()),
+)
+metrics.registry.collected(
+    "smartgarden_mqtt_reconnects_total", "Reconexiones al broker MQTT", "counter",
+    lambda: mqtt.reconnects,
+)
+metrics.registry.collected(
+    "smartgarden_mqtt_outbox", "Mensajes MQTT esperando publicación", "gauge",
+    lambda: mqtt.stats()["outbox"],
+)
+metrics.registry.collected(
+    "smartgarden_mqtt_commands", "Comandos MQTT esperando publicación", "gauge",
+    lambda: mqtt.stats()["commands"],
+)
+metrics.registry.collected(
+    "smartgarden_mqtt_inflight", "Publicaciones MQTT esperando PUBACK", "gauge",
+    lambda: mqtt.stats()["inflight"],
+)
+metrics.registry.collected(
+    "smartgarden_mqtt_dropped_total", "Mensajes MQTT descartados por cola llena", "counter",
+    lambda: mqtt.dropped,
+)
+metrics.registry.collected(
+    "smartgarden_mqtt_expired_total", "Comandos MQTT caducados sin publicar", "counter",
+    lambda: mqtt.expired,
+)
+metrics.registry.collected(
+    "smartgarden_pipeline_depth", "Elementos en cola por etapa del pipeline", "gauge",
+    lambda: {(stage.name,): stage.stats()["depth"] for stage in pipeline_stages},
+    labels=("stage",),
+)
+metrics.registry.collected(
+    "smartgarden_pipeline_dropped_total", "Elementos descartados por etapa del pipeline", "counter",
+    lambda: {(stage.name,): stage.dropped for stage in pipeline_stages},
+    labels=("stage",),
+)
+metrics.registry.collected(
+    "smartgarden_ingest_pending_rows", "Lecturas esperando commit en el buffer", "gauge",
+    lambda: sensor_buffer.pending,
+)
+metrics.registry.collected(
+    "smartgarden_log_dropped_total", "Registros de log descartados por cola llena", "counter",
+    logs.dropped,
+)
+
+async def sync_metrics():
+    # Instantánea periódica: el scrape puede caer en cualquier worker
+    while True:
+        await asyncio.sleep(settings.METRICS_SYNC_INTERVAL)
+        try:
+            metrics.registry.dump()
+        except OSError as e:
+            log.warning("No se pudieron volcar las métricas: %s", e)
+
+async def fill_rollups():
+    try:
+        await backfill_rollups()
+    except Exception:
+        # Las consultas siguen funcionando: sólo faltan los rollups del historial
+        log.exception("No se pudieron rellenar los rollups")
 
 async def create_tables():
     _ = models
     async with async_engine.begin() as conn:
+        await run_migrations(conn)
         await conn.run_sync(Base.metadata.create_all)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
 
+    # Los registros se escriben desde un hilo: el event loop no espera a stdout
+    logs.setup_logging(
+        level=settings.LOG_LEVEL,
+        levels=settings.LOG_LEVELS,
+        fmt=settings.LOG_FORMAT,
+        debug_sample_rate=settings.LOG_DEBUG_SAMPLE_RATE,
+        queue_size=settings.LOG_QUEUE_SIZE,
+    )
     await create_tables()
-    async with aiomqtt.Client(settings.MQTT_BROKER, settings.MQTT_PORT) as client:
-        print(" >>> Cliente MQTT (Publisher) Conectado.")
-        app.state.mqtt = client
+    # Bases migradas: el historial no tiene rollups hasta que se rellenan
+    rollup_task = asyncio.create_task(fill_rollups())
+    await sensor_catalog.refresh()
+    await device_configs.refresh()
+    await device_registry.refresh()
+    await recent_readings.warm()
+    sensor_buffer.start()
+    for stage in pipeline_stages:
+        stage.start()
+
+    # Una sola conexión MQTT (suscripción de sensores + publicación de comandos)
+    mqtt_listener()
+    mqtt.start()
+
+    metrics_task = None
+    if settings.METRICS_DIR:
+        metrics.registry.share(settings.METRICS_DIR, WORKER_ID, 3 * settings.METRICS_SYNC_INTERVAL)
+        metrics.registry.dump()
+        metrics_task = asyncio.create_task(sync_metrics())
 
-        listener_task = asyncio.create_task(mqtt_listener())
+    yield
 
-        yield
+    log.info("Apagando servicios...")
+    rollup_task.cancel()
+    if metrics_task is not None:
+        metrics_task.cancel()
+        metrics.registry.unshare()
+    await mqtt.stop()
+    log.info("Cliente MQTT desconectado.")
 
-        print(" >>> Apagando servicios...")
-        listener_task.cancel()
+    # Tramas a medio unir -> colas -> buffer -> DB
+    await frame_merger.flush()
+    for stage in pipeline_stages:
         try:
-            await listener_task
-        except asyncio.CancelledError:
-            pass
+            await asyncio.wait_for(stage.stop(), settings.PIPELINE_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            # DB caída: el consumidor de persist está esperando lugar en el buffer
+            log.warning("La etapa %s no se vació a tiempo", stage.name)
+            await stage.stop(drain=False)
 
-    print(" >>> Cliente MQTT desconectado.")
+    # Volcamos las lecturas pendientes antes de cerrar
+    await sensor_buffer.stop()
+    log.info("Buffer de ingesta vaciado.")
+    logs.shutdown_logging()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -41,6 +161,30 @@ app = FastAPI(
 
 app.include_router(router, prefix="/system")
 
+@app.middleware("http")
+async def measure_system_routes(request: Request, call_next):
+    if not request.url.path.startswith("/system/"):
+        return await call_next(request)
+
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Plantilla de la ruta (/system/controllers/{device_id}) y no la URL:
+        # así la cantidad de series queda acotada
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, request.method, path, status
+        )
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/")
 def read_root():
     return {"status": "online", "system": "RAK IoT Receiver"}
@@ -0,0 +1,74 @@
+import struct
+import sys
+from array import array
+
+MEDIA_TYPE = "application/vnd.smartgarden.columnar"
+
+MAGIC = b"SGC1"
+VERSION = 1
+DTYPES = {"float32": (1, "f"), "float64": (2, "d")}
+
+# Cabecera: magic, versión, dtype, reservado, número de series
+_HEADER = struct.Struct("<4sBBHI")
+# Por serie: sensor_id, número de puntos, número de columnas de valores
+_SERIES = struct.Struct("<IIB")
+
+
+class ColumnarSeries:
+    """Una serie en columnas: timestamps int64 (µs desde epoch) + N columnas de valores."""
+
+    __slots__ = ("sensor_id", "timestamps", "columns")
+
+    def __init__(self, sensor_id: int, names: list[str], typecode: str):
+        self.sensor_id = sensor_id
+        self.timestamps = array("q")
+        self.columns = {name: array(typecode) for name in names}
+
+
+def series_from_rows(rows, names: list[str], dtype: str = "float64") -> list[ColumnarSeries]:
+    """
+    Agrupa filas (sensor_id, epoch_us, *valores) ordenadas por sensor_id.
+
+    Las filas son tuplas tal cual vienen de la DB: sin modelos por fila.
+    """
+    _, typecode = DTYPES[dtype]
+    series: dict[int, ColumnarSeries] = {}
+
+    for sensor_id, epoch_us, *values in rows:
+        current = series.get(sensor_id)
+        if current is None:
+            current = series[sensor_id] = ColumnarSeries(sensor_id, names, typecode)
+        current.timestamps.append(int(epoch_us))
+        for name, value in zip(names, values):
+            current.columns[name].append(float(value))
+
+    return list(series.values())
+
+
+def encode(series: list[ColumnarSeries], dtype: str = "float64") -> bytes:
+    """
+    Formato (little-endian):
+
+        "SGC1" | u8 versión | u8 dtype (1=float32, 2=float64) | u16 0 | u32 n_series
+        por serie:
+            u32 sensor_id | u32 n_puntos | u8 n_columnas
+            por columna: u8 largo + nombre ASCII
+            int64[n_puntos] timestamps (µs desde epoch, UTC)
+            por columna: dtype[n_puntos]
+    """
+    dtype_id, _ = DTYPES[dtype]
+    parts = [_HEADER.pack(MAGIC, VERSION, dtype_id, 0, len(series))]
+
+    for item in series:
+        parts.append(_SERIES.pack(item.sensor_id, len(item.timestamps), len(item.columns)))
+        for name in item.columns:
+            encoded = name.encode("ascii")
+            parts.append(struct.pack("<B", len(encoded)) + encoded)
+
+        for column in (item.timestamps, *item.columns.values()):
+            if sys.byteorder == "big":
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+
+    return b"".join(parts)
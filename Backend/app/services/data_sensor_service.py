@@ -1,22 +1,60 @@
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
-from sqlalchemy import BinaryExpression, and_
+from sqlalchemy import BinaryExpression, BigInteger, and_, or_, func, extract, cast, literal, union_all
 
-from app.db.models import DeviceSensor, DeviceConfiguration
+from app.db.models import DeviceSensor
+from app.services.downsampling import lttb
+from app.services.columnar import series_from_rows, encode
+from app.services.rollup_service import rollup_for, snap_bucket, truncate
+from app.services.recent_readings import recent_readings
+from app.services.device_config_cache import device_configs
 from app.system.schemas import (
+    DeviceSensorSchema,
     DeviceSensorListSchema,
     DeviceConfigurationListSchema,
+    SensorBucketSchema,
+    SensorBucketListSchema,
+    SensorPointSchema,
+    SensorPointListSchema,
 )
 
+
+def _aware(value: datetime | None) -> datetime | None:
+    # Fechas sin zona = hora local del servidor
+    if value is not None:
+        return value.astimezone()
+    return value
+
+
+def _from_epoch(epoch: float) -> datetime:
+    return datetime.fromtimestamp(float(epoch), tz=timezone.utc)
+
+
+def _recent_schema(device_id, sensor_id, reading_id, timestamp, value) -> DeviceSensorSchema:
+    event_ts = _from_epoch(timestamp)
+    local = event_ts.astimezone()
+    return DeviceSensorSchema(
+        device_sensor_id=reading_id,
+        device_id=device_id,
+        sensor_id=sensor_id,
+        value=value,
+        event_ts=event_ts,
+        event_date=local.date(),
+        event_time=local.time(),
+    )
+
 class DataSensorService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    async def read_data_sensors(
+    def _history_filter(
         self,
         device_id: int,
-        sensor_id: int = None
+        sensor_id: int = None,
+        start: datetime = None,
+        end: datetime = None,
     ):
         base_filter: list[BinaryExpression] = []
         base_filter.append(DeviceSensor.device_id == device_id)
@@ -24,81 +62,370 @@ class DataSensorService:
         if sensor_id is not None:
             base_filter.append(DeviceSensor.sensor_id == sensor_id)
 
-        filter = (
-            and_(*base_filter)
-        )
+        if start is not None:
+            base_filter.append(DeviceSensor.event_ts >= _aware(start))
+
+        if end is not None:
+            base_filter.append(DeviceSensor.event_ts < _aware(end))
 
-        stmt = select(DeviceSensor).where(filter).limit(20)
+        return and_(*base_filter)
+
+    async def read_data_sensors(
+        self,
+        device_id: int,
+        sensor_id: int = None,
+        start: datetime = None,
+        end: datetime = None,
+        limit: int = 20,
+    ):
+        if start is None and end is None:
+            # "Lo más reciente" sale del ring buffer, sin tocar la DB
+            cached = recent_readings.latest(device_id, sensor_id, limit)
+            if cached is not None:
+                return DeviceSensorListSchema(
+                    device_sensors=[
+                        _recent_schema(*reading) for reading in cached
+                    ]
+                )
+
+        filter = self._history_filter(device_id, sensor_id, start, end)
+
+        # Últimas `limit` por el índice (device_id, sensor_id, event_ts DESC),
+        # devueltas en orden cronológico para graficar
+        stmt = (
+            select(DeviceSensor)
+            .where(filter)
+            .order_by(DeviceSensor.event_ts.desc(), DeviceSensor.device_sensor_id.desc())
+            .limit(limit)
+        )
 
         result = await self.db.execute(stmt)
 
-        device_sensors = result.scalars().all()
+        device_sensors = result.scalars().all()[::-1]
 
         return DeviceSensorListSchema(
             device_sensors=device_sensors
         )
 
-    async def read_configuration_by_sensor(
+    async def read_data_sensors_columnar(
         self,
         device_id: int,
-        actuador: str,
+        sensor_id: int = None,
+        start: datetime = None,
+        end: datetime = None,
+        limit: int = 20,
+        dtype: str = "float64",
+    ) -> bytes:
+        filter = self._history_filter(device_id, sensor_id, start, end)
+
+        # Epoch en µs calculado en la DB: ni datetimes ni modelos por fila
+        stmt = (
+            select(
+                DeviceSensor.sensor_id,
+                cast(extract("epoch", DeviceSensor.event_ts) * 1000000, BigInteger),
+                DeviceSensor.value,
+            )
+            .where(filter)
+            .order_by(DeviceSensor.event_ts.desc(), DeviceSensor.device_sensor_id.desc())
+            .limit(limit)
+        )
+
+        result = await self.db.execute(stmt)
+        series = series_from_rows(result.all(), ["value"], dtype)
+
+        # Venían de la más nueva a la más vieja
+        for item in series:
+            item.timestamps.reverse()
+            item.columns["value"].reverse()
+
+        return encode(series, dtype)
+
+    async def _bucket_rows(
+        self,
+        device_id: int,
+        sensor_id: int,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int,
     ):
+        rollup = rollup_for(bucket_seconds)
+        if rollup is None:
+            return await self._raw_bucket_rows(device_id, sensor_id, start, end, bucket_seconds)
+
+        # El bucket es múltiplo de un rollup: agregamos sobre la tabla más gruesa
+        # posible, pero sólo con los buckets del rollup que caen enteros en
+        # [start, end). Los bordes parciales salen de los datos crudos.
+        rollup_seconds, model = rollup
+        start, end = _aware(start), _aware(end)
+        inner_start = truncate(start, rollup_seconds)
+        if inner_start < start:
+            inner_start += timedelta(seconds=rollup_seconds)
+        inner_end = truncate(end, rollup_seconds)
+        if inner_start >= inner_end:
+            return await self._raw_bucket_rows(device_id, sensor_id, start, end, bucket_seconds)
+
         base_filter: list[BinaryExpression] = []
-        base_filter.append(DeviceConfiguration.device_id == device_id)
-        base_filter.append(DeviceConfiguration.actuador == actuador)
+        base_filter.append(model.device_id == device_id)
+        base_filter.append(model.bucket_start >= inner_start)
+        base_filter.append(model.bucket_start < inner_end)
+
+        if sensor_id is not None:
+            base_filter.append(model.sensor_id == sensor_id)
+
+        rollup_bucket = (
+            func.floor(extract("epoch", model.bucket_start) / bucket_seconds) * bucket_seconds
+        )
+        parts = [
+            select(
+                model.sensor_id.label("sensor_id"),
+                rollup_bucket.label("bucket"),
+                model.min_value.label("min_value"),
+                model.max_value.label("max_value"),
+                model.sum_value.label("sum_value"),
+                model.count.label("count"),
+            ).where(and_(*base_filter))
+        ]
 
-        filter = (
-            and_(*base_filter)
+        edges = []
+        if start < inner_start:
+            edges.append(self._history_filter(device_id, sensor_id, start, inner_start))
+        if inner_end < end:
+            edges.append(self._history_filter(device_id, sensor_id, inner_end, end))
+        if edges:
+            raw_bucket = (
+                func.floor(extract("epoch", DeviceSensor.event_ts) / bucket_seconds) * bucket_seconds
+            )
+            parts.append(
+                select(
+                    DeviceSensor.sensor_id,
+                    raw_bucket,
+                    DeviceSensor.value,
+                    DeviceSensor.value,
+                    DeviceSensor.value,
+                    literal(1),
+                ).where(or_(*edges))
+            )
+
+        rows = union_all(*parts).subquery()
+        stmt = (
+            select(
+                rows.c.sensor_id,
+                rows.c.bucket,
+                func.min(rows.c.min_value),
+                func.max(rows.c.max_value),
+                func.sum(rows.c.sum_value) / func.sum(rows.c.count),
+                func.sum(rows.c.count),
+            )
+            .group_by(rows.c.sensor_id, rows.c.bucket)
+            .order_by(rows.c.sensor_id, rows.c.bucket)
         )
 
-        stmt = select(DeviceConfiguration).where(filter)
         result = await self.db.execute(stmt)
-        configuration = result.scalars().first()
-        return configuration
+        return result.all()
 
-    async def update_controller_value(
+    async def _raw_bucket_rows(
         self,
         device_id: int,
-        actuador: str,
-        value: int,
-        admin: bool = False
+        sensor_id: int,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int,
     ):
-        base_filter: list[BinaryExpression] = []
-        base_filter.append(DeviceConfiguration.device_id == device_id)
-        base_filter.append(DeviceConfiguration.actuador == actuador)
+        filter = self._history_filter(device_id, sensor_id, start, end)
 
-        filter = (
-            and_(*base_filter)
+        # Agregación en la DB: sólo viaja una fila por bucket
+        bucket = (
+            func.floor(extract("epoch", DeviceSensor.event_ts) / bucket_seconds) * bucket_seconds
+        ).label("bucket")
+
+        stmt = (
+            select(
+                DeviceSensor.sensor_id,
+                bucket,
+                func.min(DeviceSensor.value),
+                func.max(DeviceSensor.value),
+                func.avg(DeviceSensor.value),
+                func.count(),
+            )
+            .where(filter)
+            .group_by(DeviceSensor.sensor_id, bucket)
+            .order_by(DeviceSensor.sensor_id, bucket)
         )
 
-        stmt = select(DeviceConfiguration).where(filter)
         result = await self.db.execute(stmt)
-        configuration = result.scalars().first()
+        return result.all()
 
-        if configuration:
-            if actuador != "servo" or admin:
-                configuration.value = value
-                self.db.add(configuration)
-                await self.db.commit()
-                await self.db.refresh(configuration)
+    async def read_data_sensor_buckets(
+        self,
+        device_id: int,
+        sensor_id: int,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int,
+    ):
+        rows = await self._bucket_rows(device_id, sensor_id, start, end, bucket_seconds)
 
-        return configuration
+        return SensorBucketListSchema(
+            bucket_seconds=bucket_seconds,
+            buckets=[
+                SensorBucketSchema(
+                    sensor_id=row_sensor_id,
+                    bucket_start=_from_epoch(epoch),
+                    min=min_value,
+                    max=max_value,
+                    avg=avg_value,
+                    count=count,
+                )
+                for row_sensor_id, epoch, min_value, max_value, avg_value, count in rows
+            ],
+        )
 
-    async def read_configuration_by_device(
+    async def read_data_sensor_buckets_columnar(
         self,
         device_id: int,
+        sensor_id: int,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int,
+        dtype: str = "float64",
+    ) -> bytes:
+        rows = await self._bucket_rows(device_id, sensor_id, start, end, bucket_seconds)
+
+        series = series_from_rows(
+            (
+                (row_sensor_id, float(epoch) * 1000000, *values)
+                for row_sensor_id, epoch, *values in rows
+            ),
+            ["min", "max", "avg", "count"],
+            dtype,
+        )
+        return encode(series, dtype)
+
+    async def _lttb_series(
+        self,
+        device_id: int,
+        sensor_id: int,
+        start: datetime,
+        end: datetime,
+        points: int,
+    ) -> dict[int, list[tuple[float, float]]]:
+        # Pre-agregamos en la DB a ~4x la resolución pedida y aplicamos LTTB
+        # sobre esos promedios: la forma se conserva sin traer millones de filas.
+        span = (end - start).total_seconds()
+        bucket_seconds = snap_bucket(max(1, int(span // (points * 4))))
+        rows = await self._bucket_rows(device_id, sensor_id, start, end, bucket_seconds)
+
+        series: dict[int, list[tuple[float, float]]] = {}
+        for row_sensor_id, epoch, _, _, avg_value, _ in rows:
+            series.setdefault(row_sensor_id, []).append(
+                (float(epoch) + bucket_seconds / 2, float(avg_value))
+            )
+
+        return {
+            series_sensor_id: lttb(values, points)
+            for series_sensor_id, values in series.items()
+        }
+
+    async def read_data_sensor_lttb(
+        self,
+        device_id: int,
+        sensor_id: int,
+        start: datetime,
+        end: datetime,
+        points: int,
     ):
-        base_filter: list[BinaryExpression] = []
-        base_filter.append(DeviceConfiguration.device_id == device_id)
+        series = await self._lttb_series(device_id, sensor_id, start, end, points)
 
-        filter = (
-            and_(*base_filter)
+        return SensorPointListSchema(
+            points=[
+                SensorPointSchema(
+                    sensor_id=series_sensor_id,
+                    timestamp=_from_epoch(x),
+                    value=y,
+                )
+                for series_sensor_id, values in series.items()
+                for x, y in values
+            ]
         )
 
-        stmt = select(DeviceConfiguration).where(filter)
-        result = await self.db.execute(stmt)
-        configurations = result.scalars().all()
+    async def read_data_sensor_lttb_columnar(
+        self,
+        device_id: int,
+        sensor_id: int,
+        start: datetime,
+        end: datetime,
+        points: int,
+        dtype: str = "float64",
+    ) -> bytes:
+        series = await self._lttb_series(device_id, sensor_id, start, end, points)
+
+        return encode(
+            series_from_rows(
+                (
+                    (series_sensor_id, x * 1000000, y)
+                    for series_sensor_id, values in series.items()
+                    for x, y in values
+                ),
+                ["value"],
+                dtype,
+            ),
+            dtype,
+        )
+
+    async def read_configuration_by_sensor(
+        self,
+        device_id: int,
+        actuador: str,
+    ):
+        # Sale de la caché: sin ida a la DB
+        return await device_configs.get(device_id, actuador)
+
+    async def update_controller_value(
+        self,
+        device_id: int,
+        actuador: str,
+        value: int,
+        admin: bool = False
+    ):
+        if actuador == "servo" and not admin:
+            return await device_configs.get(device_id, actuador)
+
+        # Un único UPDATE ... RETURNING; la caché se actualiza con el resultado
+        return await device_configs.set_value(device_id, actuador, value)
+
+    async def update_controller_values(
+        self,
+        commands: list[tuple[int, str, int]],
+        admin: bool = False
+    ):
+        # Misma regla que update_controller_value: el servo sólo se mueve con toggle
+        if not admin:
+            commands = [command for command in commands if command[1] != "servo"]
+        return await device_configs.set_many(commands)
+
+    async def update_controller_fleet(
+        self,
+        actuador: str,
+        value: int,
+        device_ids: list[int] | None = None,
+        admin: bool = False
+    ):
+        if actuador == "servo" and not admin:
+            return []
+        return await device_configs.set_fleet(actuador, value, device_ids)
+
+    async def toggle_servo(
+        self,
+        device_id: int,
+        actuador: str = "servo",
+    ):
+        return await device_configs.toggle(device_id, actuador)
+
+    async def read_configuration_by_device(
+        self,
+        device_id: int,
+    ):
+        configurations = await device_configs.get_device(device_id)
         return DeviceConfigurationListSchema(
             device_configurations=configurations
         )
-
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import AsyncExitStack
+
+from sqlalchemy import select, update, case, and_, values, column, Integer, String
+from app.db.models import DeviceConfiguration
+from app.core.config import settings
+from app.db.database import async_engine
+from app.services.mqtt_client import mqtt, WORKER_ID
+from app.system.schemas import DeviceConfigurationSchema
+
+log = logging.getLogger(__name__)
+
+# Posiciones del servo: cada pulsación alterna entre ambas
+SERVO_TOGGLE = (90, 180)
+
+_COLUMNS = (
+    DeviceConfiguration.device_configuration_id,
+    DeviceConfiguration.device_id,
+    DeviceConfiguration.actuador,
+    DeviceConfiguration.value,
+)
+
+
+class DeviceConfigCache:
+    """
+    Caché write-through de `device_configuration` (device_id -> actuador -> config).
+
+    Las lecturas salen de memoria; cada escritura es un único UPDATE ...
+    RETURNING y su resultado reemplaza la entrada. Las escrituras de un mismo
+    dispositivo se serializan para que la caché quede en el orden de la DB.
+
+    Con varios workers cada escritura se anuncia en `<MQTT_LIVE_TOPIC>/config`
+    y los demás olvidan esos dispositivos: la próxima lectura los recarga.
+    """
+
+    def __init__(self):
+        self._by_device: dict[int, dict[str, DeviceConfigurationSchema]] = {}
+        self._locks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._refresh_lock = asyncio.Lock()
+
+    @staticmethod
+    def _schema(row) -> DeviceConfigurationSchema:
+        return DeviceConfigurationSchema(
+            device_configuration_id=row.device_configuration_id,
+            device_id=row.device_id,
+            actuador=row.actuador,
+            value=row.value,
+        )
+
+    def _store(self, config: DeviceConfigurationSchema):
+        # Copia y reemplazo: los lectores nunca ven un dict a medias
+        device = dict(self._by_device.get(config.device_id, {}))
+        device[config.actuador] = config
+        self._by_device[config.device_id] = device
+
+    def invalidate(self):
+        self._by_device = {}
+
+    def forget(self, device_ids: list[int]):
+        """Descarta los dispositivos que otro worker modificó."""
+        forgotten = set(device_ids)
+        self._by_device = {
+            device_id: device
+            for device_id, device in self._by_device.items()
+            if device_id not in forgotten
+        }
+
+    def _announce(self, configs: list[DeviceConfigurationSchema]):
+        if settings.MQTT_LIVE_TOPIC and configs:
+            # Cola de comandos: una invalidación perdida deja la caché vieja
+            mqtt.publish(
+                f"{settings.MQTT_LIVE_TOPIC}/config",
+                json.dumps({
+                    "origin": WORKER_ID,
+                    "device_ids": sorted({config.device_id for config in configs}),
+                }),
+                command=True,
+                expire=False,
+            )
+
+    async def refresh(self):
+        async with self._refresh_lock:
+            async with async_engine.connect() as conn:
+                result = await conn.execute(select(*_COLUMNS))
+                by_device: dict[int, dict[str, DeviceConfigurationSchema]] = {}
+                for row in result:
+                    by_device.setdefault(row.device_id, {})[row.actuador] = self._schema(row)
+            self._by_device = by_device
+
+        log.info("Configuraciones cargadas: %d", sum(len(d) for d in by_device.values()))
+
+    async def _load_device(self, device_id: int) -> dict[str, DeviceConfigurationSchema]:
+        # Dispositivo nuevo o caché invalidada: una consulta y queda cacheado
+        async with async_engine.connect() as conn:
+            result = await conn.execute(
+                select(*_COLUMNS).where(DeviceConfiguration.device_id == device_id)
+            )
+            device = {row.actuador: self._schema(row) for row in result}
+
+        if device:
+            self._by_device[device_id] = device
+        return device
+
+    async def get_device(self, device_id: int) -> list[DeviceConfigurationSchema]:
+        device = self._by_device.get(device_id)
+        if device is None:
+            device = await self._load_device(device_id)
+        return list(device.values())
+
+    async def get(self, device_id: int, actuador: str) -> DeviceConfigurationSchema | None:
+        device = self._by_device.get(device_id)
+        if device is None:
+            device = await self._load_device(device_id)
+        return device.get(actuador)
+
+    async def set_value(self, device_id: int, actuador: str, value: int) -> DeviceConfigurationSchema | None:
+        stmt = (
+            update(DeviceConfiguration)
+            .where(and_(
+                DeviceConfiguration.device_id == device_id,
+                DeviceConfiguration.actuador == actuador,
+            ))
+            .values(value=value)
+            .returning(*_COLUMNS)
+        )
+
+        async with self._locks[device_id]:
+            async with async_engine.begin() as conn:
+                row = (await conn.execute(stmt)).first()
+            if row is None:
+                return None
+            config = self._schema(row)
+            self._store(config)
+        self._announce([config])
+        return config
+
+    async def set_many(self, commands: list[tuple[int, str, int]]) -> list[DeviceConfigurationSchema]:
+        """
+        Aplica (device_id, actuador, valor) en un solo UPDATE ... FROM (VALUES ...)
+        RETURNING: resolución y escritura en una ida a la DB. Con comandos
+        repetidos para el mismo actuador, gana el último.
+        """
+        latest = {(device_id, actuador): value for device_id, actuador, value in commands}
+        if not latest:
+            return []
+
+        batch = values(
+            column("device_id", Integer),
+            column("actuador", String),
+            column("value", Integer),
+            name="batch",
+        ).data([(device_id, actuador, value) for (device_id, actuador), value in latest.items()])
+
+        stmt = (
+            update(DeviceConfiguration)
+            .where(and_(
+                DeviceConfiguration.device_id == batch.c.device_id,
+                DeviceConfiguration.actuador == batch.c.actuador,
+            ))
+            .values(value=batch.c.value)
+            .returning(*_COLUMNS)
+        )
+        return await self._write_many(stmt, [device_id for device_id, _ in latest])
+
+    async def set_fleet(self, actuador: str, value: int, device_ids: list[int] | None = None) -> list[DeviceConfigurationSchema]:
+        """Mismo valor para `actuador` en `device_ids` (o en todos los dispositivos)."""
+        base_filter = [DeviceConfiguration.actuador == actuador]
+        if device_ids is not None:
+            base_filter.append(DeviceConfiguration.device_id.in_(device_ids))
+        else:
+            # Hace falta saber qué dispositivos se tocan para tomar sus locks
+            async with async_engine.connect() as conn:
+                result = await conn.execute(
+                    select(DeviceConfiguration.device_id.distinct()).where(and_(*base_filter))
+                )
+                device_ids = list(result.scalars())
+
+        stmt = (
+            update(DeviceConfiguration)
+            .where(and_(*base_filter))
+            .values(value=value)
+            .returning(*_COLUMNS)
+        )
+        return await self._write_many(stmt, device_ids)
+
+    async def _write_many(self, stmt, device_ids: list[int]) -> list[DeviceConfigurationSchema]:
+        # Una transacción para todo el lote, con los locks de los dispositivos
+        # afectados (en orden fijo, así dos lotes no se bloquean entre sí):
+        # la caché queda en el mismo orden que la DB que las escrituras sueltas
+        async with AsyncExitStack() as stack:
+            for device_id in sorted(set(device_ids)):
+                await stack.enter_async_context(self._locks[device_id])
+
+            async with async_engine.begin() as conn:
+                rows = (await conn.execute(stmt)).all()
+
+            configs = [self._schema(row) for row in rows]
+            for config in configs:
+                self._store(config)
+        self._announce(configs)
+        return configs
+
+    async def toggle(self, device_id: int, actuador: str) -> tuple[int, DeviceConfigurationSchema] | None:
+        """
+        Alterna el servo en la DB (90 -> 180, cualquier otro -> 90) de forma
+        atómica. Devuelve (valor anterior, configuración nueva).
+        """
+        low, high = SERVO_TOGGLE
+        previous = (
+            select(DeviceConfiguration.device_configuration_id, DeviceConfiguration.value)
+            .where(and_(
+                DeviceConfiguration.device_id == device_id,
+                DeviceConfiguration.actuador == actuador,
+            ))
+            .with_for_update()
+            .cte("previous")
+        )
+        stmt = (
+            update(DeviceConfiguration)
+            .where(DeviceConfiguration.device_configuration_id == previous.c.device_configuration_id)
+            .values(value=case((previous.c.value == low, high), else_=low))
+            .returning(*_COLUMNS, previous.c.value.label("previous_value"))
+        )
+
+        async with self._locks[device_id]:
+            async with async_engine.begin() as conn:
+                row = (await conn.execute(stmt)).first()
+            if row is None:
+                return None
+            config = self._schema(row)
+            self._store(config)
+        self._announce([config])
+        return row.previous_value, config
+
+
+device_configs = DeviceConfigCache()
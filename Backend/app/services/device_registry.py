@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select
+from app.db.models import Device
+from app.db.database import async_engine
+
+log = logging.getLogger(__name__)
+
+# Cuánto se recuerda que un device_id no existe antes de volver a consultar
+UNKNOWN_TTL = 30.0
+
+
+class DeviceRegistry:
+    """
+    device_ids registrados en la tabla `device`.
+
+    La ingesta descarta lecturas de dispositivos desconocidos antes de
+    encolarlas: una sola fila con device_id inexistente hace fallar todo el
+    INSERT multi-fila. Un id que no está en memoria se consulta una vez en la
+    DB; si tampoco está, se recuerda como desconocido durante UNKNOWN_TTL.
+    """
+
+    def __init__(self):
+        self._known: set[int] = set()
+        self._unknown: dict[int, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        async with async_engine.connect() as conn:
+            result = await conn.execute(select(Device.device_id))
+            self._known = set(result.scalars())
+        self._unknown = {}
+        log.info("Dispositivos cargados: %d", len(self._known))
+
+    async def exists(self, device_id: int) -> bool:
+        if device_id in self._known:
+            return True
+
+        expires = self._unknown.get(device_id)
+        if expires is not None and expires > time.monotonic():
+            return False
+
+        async with self._lock:
+            async with async_engine.connect() as conn:
+                found = (await conn.execute(
+                    select(Device.device_id).where(Device.device_id == device_id)
+                )).first() is not None
+
+        if found:
+            self._known.add(device_id)
+            self._unknown.pop(device_id, None)
+        else:
+            self._unknown[device_id] = time.monotonic() + UNKNOWN_TTL
+        return found
+
+
+device_registry = DeviceRegistry()
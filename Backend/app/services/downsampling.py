@@ -0,0 +1,42 @@
+def lttb(points: list[tuple[float, float]], threshold: int) -> list[tuple[float, float]]:
+    """
+    Largest-Triangle-Three-Buckets.
+
+    Reduce una serie (x, y) ordenada por x a `threshold` puntos conservando
+    la forma visual (picos y valles). Siempre mantiene el primer y el último punto.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Promedio del bucket siguiente (tercer vértice del triángulo)
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_count = next_end - next_start
+        avg_x = sum(p[0] for p in points[next_start:next_end]) / next_count
+        avg_y = sum(p[1] for p in points[next_start:next_end]) / next_count
+
+        # Punto del bucket actual que forma el triángulo de mayor área
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a]
+
+        max_area = -1.0
+        chosen = start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+
+        sampled.append(points[chosen])
+        a = chosen
+
+    sampled.append(points[-1])
+    return sampled
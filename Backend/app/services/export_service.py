@@ -0,0 +1,136 @@
+import csv
+import io
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+
+from sqlalchemy import select, tuple_, and_, BinaryExpression
+from app.db.models import DeviceSensor
+from app.db.database import async_engine
+
+# Filas por consulta (keyset) y por lote leído del cursor del servidor
+PAGE_SIZE = 50000
+FETCH_SIZE = 5000
+
+CSV_HEADER = ["device_sensor_id", "device_id", "sensor_id", "event_ts", "value"]
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def make_token(event_ts: datetime, device_sensor_id: int) -> str:
+    # Microsegundos desde epoch: se puede pegar tal cual en la URL
+    # (el "+00:00" de isoformat llega como espacio)
+    micros = (event_ts - EPOCH) // timedelta(microseconds=1)
+    return f"{micros},{device_sensor_id}"
+
+
+def parse_token(token: str) -> tuple[datetime, int]:
+    """`after` = "<event_ts>,<device_sensor_id>" de la última fila recibida."""
+    event_ts, device_sensor_id = token.rsplit(",", 1)
+    if event_ts.lstrip("-").isdigit():
+        ts = EPOCH + timedelta(microseconds=int(event_ts))
+    else:
+        # Formato anterior (ISO 8601); el "+" de la zona puede llegar como espacio
+        ts = datetime.fromisoformat(event_ts.replace(" ", "+"))
+    return ts.astimezone(), int(device_sensor_id)
+
+
+def _ndjson(rows) -> str:
+    # Formateo manual: sin json.dumps ni modelos por fila
+    return "".join(
+        f'{{"device_sensor_id":{row_id},"device_id":{device_id},"sensor_id":{sensor_id},'
+        f'"event_ts":"{event_ts.isoformat()}","value":{value!r}}}\n'
+        for row_id, device_id, sensor_id, event_ts, value in rows
+    )
+
+
+def _csv(rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        (row_id, device_id, sensor_id, event_ts.isoformat(), value)
+        for row_id, device_id, sensor_id, event_ts, value in rows
+    )
+    return buffer.getvalue()
+
+
+async def stream_device_sensors(
+    device_id: int,
+    sensor_id: int | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after: tuple[datetime, int] | None = None,
+    fmt: str = "ndjson",
+    limit: int | None = None,
+) -> AsyncIterator[str]:
+    """
+    Exporta `device_sensor` en orden (event_ts, device_sensor_id).
+
+    Cada página es una consulta keyset independiente (sin OFFSET ni
+    transacciones largas) leída con un cursor del servidor en lotes de
+    FETCH_SIZE, así la memoria no depende del tamaño del rango. Sin
+    `sensor_id` las páginas recorren el índice (device_id, event_ts,
+    device_sensor_id); con `sensor_id`, el de (device_id, sensor_id, event_ts).
+    """
+    render = _csv if fmt == "csv" else _ndjson
+    if fmt == "csv":
+        yield ",".join(CSV_HEADER) + "\n"
+
+    base_filter: list[BinaryExpression] = []
+    base_filter.append(DeviceSensor.device_id == device_id)
+
+    if sensor_id is not None:
+        base_filter.append(DeviceSensor.sensor_id == sensor_id)
+
+    if start is not None:
+        base_filter.append(DeviceSensor.event_ts >= start.astimezone())
+
+    if end is not None:
+        base_filter.append(DeviceSensor.event_ts < end.astimezone())
+
+    sent = 0
+    last = after
+
+    while limit is None or sent < limit:
+        page_size = PAGE_SIZE if limit is None else min(PAGE_SIZE, limit - sent)
+
+        page_filter = list(base_filter)
+        if last is not None:
+            page_filter.append(
+                tuple_(DeviceSensor.event_ts, DeviceSensor.device_sensor_id) > tuple_(*last)
+            )
+
+        stmt = (
+            select(
+                DeviceSensor.device_sensor_id,
+                DeviceSensor.device_id,
+                DeviceSensor.sensor_id,
+                DeviceSensor.event_ts,
+                DeviceSensor.value,
+            )
+            .where(and_(*page_filter))
+            .order_by(DeviceSensor.event_ts, DeviceSensor.device_sensor_id)
+            .limit(page_size)
+            .execution_options(yield_per=FETCH_SIZE)
+        )
+
+        page_rows = 0
+        async with async_engine.connect() as conn:
+            result = await conn.stream(stmt)
+            async for rows in result.partitions():
+                yield render(rows)
+                page_rows += len(rows)
+                row_id, _, _, event_ts, _ = rows[-1]
+                last = (event_ts, row_id)
+
+        sent += page_rows
+        if page_rows < page_size:
+            return
+
+    # Se alcanzó `limit`: indicamos cómo continuar
+    if last is not None:
+        token = make_token(*last)
+        if fmt == "csv":
+            yield f"# next={token}\n"
+        else:
+            yield f'{{"next":"{token}"}}\n'
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+# Campos del payload que identifican la trama (si el gateway los envía)
+FRAME_ID_KEYS = ("frame_id", "seq")
+# Campos que no son lecturas: no cuentan al comparar duplicados (el gateway
+# pone `ts` en cada trama, así que un reenvío nunca sería idéntico)
+META_KEYS = ("ts", "device_id") + FRAME_ID_KEYS
+
+
+class PendingFrame:
+    __slots__ = ("data", "timer")
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class FrameMerger:
+    """
+    Une los payloads parciales de una misma trama LoRa y descarta duplicados.
+
+    Una trama se identifica por (device_id, frame_id) si el payload trae
+    `frame_id`/`seq`; si no, por device_id dentro de una ventana de `window`
+    segundos. Se emite en cuanto trae todas las claves esperadas, o al vencer
+    la ventana con lo que haya llegado. Las claves esperadas son las del
+    catálogo o, si el dispositivo ya emitió tramas, las que suele mandar: un
+    nodo que no tiene todos los sensores del catálogo no espera la ventana.
+
+    Duplicados: una trama con frame_id ya emitida se ignora durante
+    `dedup_ttl` si además sus lecturas coinciden con las emitidas (un nodo que
+    se reinicia vuelve a numerar desde 0 con lecturas nuevas); sin frame_id,
+    se ignoran los parciales iguales a la última emisión del dispositivo que
+    lleguen dentro de la ventana.
+
+    El estado es del proceso: sólo une y deduplica lo que recibe este worker.
+    Con una suscripción compartida (MQTT_SHARED_GROUP) el broker reparte los
+    mensajes sin mirar el dispositivo, y una trama oída por dos radios o
+    reenviada puede guardarse dos veces.
+    """
+
+    def __init__(
+        self,
+        emit: Callable[[object, dict], Awaitable[None]],
+        expected_keys: Callable[[], list[str]],
+        window: float,
+        dedup_ttl: float,
+    ):
+        self.emit = emit
+        self.expected_keys = expected_keys
+        self.window = window
+        self.dedup_ttl = dedup_ttl
+
+        self._pending: dict[tuple, PendingFrame] = {}
+        # (device_id, frame_id) ya emitidos -> (instante de expiración, datos)
+        self._seen: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        # device_id -> (instante, datos) de la última trama sin frame_id
+        self._last: dict[object, tuple[float, dict]] = {}
+        # device_id -> claves que traen sus tramas
+        self._keys: dict[object, set] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+        self.merged = 0
+        self.duplicates = 0
+
+    @staticmethod
+    def _same_readings(seen: dict, data: dict) -> bool:
+        return all(seen.get(k) == v for k, v in data.items() if k not in META_KEYS)
+
+    @staticmethod
+    def _frame_id(data: dict):
+        for key in FRAME_ID_KEYS:
+            if data.get(key) is not None:
+                return data[key]
+        return None
+
+    def _is_duplicate(self, device_id, frame_id, data: dict, now: float) -> bool:
+        while self._seen:
+            key, (expires, _) = next(iter(self._seen.items()))
+            if expires > now:
+                break
+            self._seen.popitem(last=False)
+
+        if frame_id is not None:
+            seen = self._seen.get((device_id, frame_id))
+            return seen is not None and self._same_readings(seen[1], data)
+
+        # Sin frame_id sólo podemos descartar restos de la trama recién emitida:
+        # lecturas iguales en tramas distintas son datos legítimos.
+        last = self._last.get(device_id)
+        if last is None or now - last[0] > self.window:
+            return False
+        return self._same_readings(last[1], data)
+
+    async def add(self, device_id, data: dict):
+        now = time.monotonic()
+        frame_id = self._frame_id(data)
+
+        if self._is_duplicate(device_id, frame_id, data, now):
+            self.duplicates += 1
+            return
+
+        key = (device_id, frame_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = PendingFrame(dict(data))
+            pending.timer = asyncio.get_running_loop().call_later(
+                self.window, self._expire, key
+            )
+        else:
+            pending.data.update(data)
+            self.merged += 1
+
+        if self._complete(device_id, pending.data):
+            await self._release(key)
+
+    def _complete(self, device_id, data: dict) -> bool:
+        keys = self._keys.get(device_id)
+        if keys is not None and keys.issubset(data):
+            return True
+        return all(k in data for k in self.expected_keys())
+
+    def _expire(self, key: tuple):
+        task = asyncio.create_task(self._release(key, expired=True))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _release(self, key: tuple, expired: bool = False):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+
+        if pending.timer is not None:
+            pending.timer.cancel()
+
+        device_id, frame_id = key
+        if expired:
+            # No llegó lo que esperábamos: el nodo dejó de mandar algún sensor
+            self._keys[device_id] = set(pending.data)
+        else:
+            self._keys.setdefault(device_id, set()).update(pending.data)
+
+        now = time.monotonic()
+        if frame_id is not None:
+            self._seen[key] = (now + self.dedup_ttl, pending.data)
+            self._seen.move_to_end(key)
+        else:
+            self._last[device_id] = (now, pending.data)
+
+        await self.emit(device_id, pending.data)
+
+    async def flush(self):
+        for key in list(self._pending):
+            await self._release(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending_frames": len(self._pending),
+            "frames_merged": self.merged,
+            "duplicates_dropped": self.duplicates,
+        }
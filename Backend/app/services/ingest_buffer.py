@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+from sqlalchemy import insert
+from app.core.config import settings
+from app.db.models import DeviceSensor
+from app.db.database import async_engine
+from app.services.rollup_service import upsert_rollups
+from app.services.recent_readings import recent_readings
+from app.services.mqtt_client import mqtt, WORKER_ID
+from app.services import metrics
+
+log = logging.getLogger(__name__)
+
+
+def is_bad_data(error: Exception) -> bool:
+    """
+    Error causado por los datos del lote (SQLSTATE 22: tipo/valor inválido,
+    23: FK/NOT NULL/UNIQUE) y no por la conexión: reintentar no lo arregla.
+    """
+    sqlstate = getattr(getattr(error, "orig", None), "sqlstate", None) or ""
+    return sqlstate[:2] in ("22", "23")
+
+
+class SensorWriteBuffer:
+    """
+    Buffer write-behind para lecturas de sensores.
+
+    Acumula filas de muchos mensajes y las inserta en una sola transacción
+    cuando se alcanza `batch_size` o pasan `flush_interval` segundos.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._rows: list[dict] = []
+        # Últimas filas que la DB rechazó, para inspección
+        self.rejected: deque[tuple[dict, str]] = deque(maxlen=100)
+        self._full = asyncio.Event()
+        # Hay lugar por debajo de max_pending (ver put)
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def add(self, rows: list[dict]):
+        if not rows:
+            return
+
+        self._rows.extend(rows)
+
+        overflow = len(self._rows) - self.max_pending
+        if overflow > 0:
+            # Sin DB por mucho tiempo: descartamos lo más antiguo
+            del self._rows[:overflow]
+            log.warning("Buffer de ingesta lleno, descartadas %d lecturas", overflow)
+
+        if len(self._rows) >= self.batch_size:
+            self._full.set()
+
+    def _requeue(self, rows: list[dict]):
+        # Delante, para reintentar en el próximo ciclo sin perder el orden
+        self._rows[:0] = rows
+        overflow = len(self._rows) - self.max_pending
+        if overflow > 0:
+            del self._rows[:overflow]
+
+    async def _commit(self, rows: list[dict]):
+        start = time.perf_counter()
+        async with async_engine.begin() as conn:
+            # executemany -> INSERT multi-fila (insertmanyvalues)
+            result = await conn.execute(
+                insert(DeviceSensor).returning(
+                    DeviceSensor.device_sensor_id,
+                    sort_by_parameter_order=True,
+                ),
+                rows,
+            )
+            ids = result.scalars().all()
+            # Rollups por minuto/hora en la misma transacción
+            await upsert_rollups(conn, rows)
+        metrics.DB_COMMIT_SECONDS.observe(time.perf_counter() - start)
+        metrics.ROWS_PER_COMMIT.observe(len(rows))
+        metrics.ROWS_INSERTED.inc(len(rows))
+
+        log.debug("Commit exitoso (%d lecturas)", len(rows))
+        readings = recent_readings.readings(rows, ids)
+        recent_readings.add_readings(readings)
+        if settings.MQTT_LIVE_TOPIC:
+            # Los demás workers no ven estas filas: les mandamos las lecturas
+            mqtt.publish(
+                f"{settings.MQTT_LIVE_TOPIC}/rows",
+                json.dumps({"origin": WORKER_ID, "readings": readings}),
+            )
+
+    async def _commit_isolating(self, rows: list[dict]):
+        """
+        Lote rechazado por la DB (FK, tipos): se parte por mitades hasta aislar
+        las filas culpables, que se apartan. El resto se guarda igual.
+        """
+        mid = len(rows) // 2
+        parts = [rows[mid:], rows[:mid]]
+        while parts:
+            part = parts.pop()
+            try:
+                await self._commit(part)
+            except Exception as e:
+                if is_bad_data(e):
+                    if len(part) == 1:
+                        self._reject(part[0], e)
+                    else:
+                        mid = len(part) // 2
+                        parts += [part[mid:], part[:mid]]
+                    continue
+
+                metrics.DB_COMMIT_ERRORS.inc()
+                log.exception("Falló el guardado en DB (%d lecturas): %s", len(part), e)
+                # DB caída a mitad: lo que no se guardó vuelve a la cola
+                self._requeue(part + [row for pending in reversed(parts) for row in pending])
+                return
+
+    def _reject(self, row: dict, error: Exception):
+        self.rejected.append((row, str(getattr(error, "orig", error))))
+        metrics.ROWS_REJECTED.inc()
+        log.error("Lectura apartada (%s): %s", getattr(error, "orig", error), row)
+
+    async def put(self, rows: list[dict]):
+        """
+        Como add(), pero espera mientras el buffer está lleno (DB lenta o
+        caída). Así la cola de la etapa persist se llena y aplica su política
+        (block / drop_oldest / spill) en vez de truncar acá.
+        """
+        while len(self._rows) >= self.max_pending:
+            self._space.clear()
+            self._full.set()
+            await self._space.wait()
+        self.add(rows)
+
+    async def flush(self):
+        try:
+            await self._flush()
+        finally:
+            if len(self._rows) < self.max_pending:
+                self._space.set()
+
+    async def _flush(self):
+        async with self._flush_lock:
+            if not self._rows:
+                return
+
+            rows = self._rows
+            self._rows = []
+
+            try:
+                await self._commit(rows)
+            except Exception as e:
+                metrics.DB_COMMIT_ERRORS.inc()
+                if is_bad_data(e):
+                    # Una fila mala no puede bloquear el lote (ni los siguientes)
+                    log.warning("Lote rechazado por la DB, aislando filas: %s", getattr(e, "orig", e))
+                    await self._commit_isolating(rows)
+                    return
+                log.exception("Falló el guardado en DB (%d lecturas): %s", len(rows), e)
+                self._requeue(rows)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._full.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # No cancelamos: dejamos que un flush en curso termine su commit
+        self._stopping = True
+        self._full.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+        await self.flush()
+
+
+sensor_buffer = SensorWriteBuffer(
+    batch_size=settings.INGEST_BATCH_SIZE,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL,
+    max_pending=settings.INGEST_MAX_PENDING,
+)
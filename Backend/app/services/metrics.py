@@ -0,0 +1,249 @@
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+# Buckets por defecto (segundos): de 0.1 ms a 10 s
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        # Sin etiquetas la serie existe desde el arranque (0 y no ausente)
+        self._values: dict[tuple, float] = {} if labels else {(): 0}
+
+    def inc(self, amount: float = 1, *labels):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self, const: tuple[tuple[str, str], ...] = ()) -> Iterable[str]:
+        names = tuple(name for name, _ in const) + self.label_names
+        prefix = tuple(value for _, value in const)
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(names, prefix + labels)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # labels -> [conteos por bucket (no acumulados), suma, total]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self, const: tuple[tuple[str, str], ...] = ()) -> Iterable[str]:
+        names = tuple(name for name, _ in const) + self.label_names
+        prefix = tuple(value for _, value in const)
+        for labels, (counts, total, count) in self._series.items():
+            labels = prefix + labels
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_labels(names + ('le',), labels + (_number(bound),))} {cumulative}"
+            yield f"{self.name}_sum{_labels(names, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(names, labels)} {count}"
+
+
+class Collected:
+    """Métrica leída al momento del scrape (contadores/colas que ya existen en otros objetos)."""
+
+    def __init__(self, name: str, help: str, kind: str, collect: Callable[[], float | dict[tuple, float]], labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = labels
+        self.collect = collect
+
+    def samples(self, const: tuple[tuple[str, str], ...] = ()) -> Iterable[str]:
+        names = tuple(name for name, _ in const) + self.label_names
+        prefix = tuple(value for _, value in const)
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(names, prefix + labels)} {_number(value)}"
+
+
+class MetricsRegistry:
+    """
+    Registro mínimo con salida en formato de texto de Prometheus.
+
+    Sin locks: todas las métricas se actualizan desde el event loop.
+
+    Con varios workers (`share()`) cada proceso etiqueta sus series con
+    `worker` y vuelca una instantánea en un directorio común; `render()`
+    devuelve las de todos los workers vivos, así da igual a cuál le toque
+    el scrape.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram | Collected] = {}
+        self._const: tuple[tuple[str, str], ...] = ()
+        self._directory: str | None = None
+        self._snapshot: str | None = None
+        self._max_age = 0.0
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS, labels: tuple[str, ...] = ()) -> Histogram:
+        return self._add(Histogram(name, help, buckets, labels))
+
+    def collected(self, name: str, help: str, kind: str, collect, labels: tuple[str, ...] = ()) -> Collected:
+        return self._add(Collected(name, help, kind, collect, labels))
+
+    def share(self, directory: str, worker: str, max_age: float):
+        """
+        Publica las métricas de este worker en `directory`. Las instantáneas
+        con más de `max_age` segundos son de workers muertos y se ignoran.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._const = (("worker", worker),)
+        self._directory = directory
+        self._snapshot = os.path.join(directory, worker.replace(os.sep, "_") + ".json")
+        self._max_age = max_age
+
+    def _samples(self) -> dict[str, list[str]]:
+        return {name: list(metric.samples(self._const)) for name, metric in self._metrics.items()}
+
+    def dump(self) -> dict[str, list[str]]:
+        """Escribe la instantánea de este worker (reemplazo atómico) y la devuelve."""
+        samples = self._samples()
+        if self._snapshot is not None:
+            tmp = f"{self._snapshot}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(samples, f)
+            os.replace(tmp, self._snapshot)
+        return samples
+
+    def unshare(self):
+        if self._snapshot is not None:
+            try:
+                os.remove(self._snapshot)
+            except FileNotFoundError:
+                pass
+
+    def _others(self) -> list[dict[str, list[str]]]:
+        others = []
+        now = time.time()
+        for entry in os.scandir(self._directory):
+            if not entry.name.endswith(".json") or entry.path == self._snapshot:
+                continue
+            try:
+                if now - entry.stat().st_mtime > self._max_age:
+                    continue
+                with open(entry.path, encoding="utf-8") as f:
+                    others.append(json.load(f))
+            except (OSError, ValueError):
+                # Worker que murió o escribe justo ahora: queda para el próximo scrape
+                continue
+        return others
+
+    def render(self) -> str:
+        own = self.dump() if self._directory is not None else self._samples()
+        others = self._others() if self._directory is not None else []
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(own[metric.name])
+            for samples in others:
+                lines.extend(samples.get(metric.name, ()))
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = MetricsRegistry()
+
+# Ingesta
+MQTT_MESSAGES = registry.counter(
+    "smartgarden_mqtt_messages_total", "Mensajes de sensores recibidos por MQTT"
+)
+MESSAGES_REJECTED = registry.counter(
+    "smartgarden_messages_rejected_total", "Mensajes de sensores descartados antes de encolarse",
+    labels=("reason",),
+)
+MESSAGE_PARSE_SECONDS = registry.histogram(
+    "smartgarden_message_parse_seconds", "Tiempo de parseo de un mensaje de sensores"
+)
+DB_COMMIT_SECONDS = registry.histogram(
+    "smartgarden_db_commit_seconds", "Duración de la transacción de un lote de lecturas"
+)
+ROWS_PER_COMMIT = registry.histogram(
+    "smartgarden_rows_per_commit", "Filas insertadas por transacción",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+ROWS_INSERTED = registry.counter(
+    "smartgarden_rows_inserted_total", "Lecturas insertadas en device_sensor"
+)
+DB_COMMIT_ERRORS = registry.counter(
+    "smartgarden_db_commit_errors_total", "Lotes de lecturas que fallaron al guardarse"
+)
+ROWS_REJECTED = registry.counter(
+    "smartgarden_rows_rejected_total", "Lecturas apartadas por violar restricciones de la DB"
+)
+
+# Broadcast
+BROADCAST_SECONDS = registry.histogram(
+    "smartgarden_broadcast_seconds", "Tiempo de fan-out de una lectura a los WebSocket"
+)
+
+# HTTP
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "smartgarden_http_request_seconds", "Latencia de las rutas /system/*",
+    labels=("method", "route", "status"),
+)
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+import aiomqtt
+from app.core.config import settings
+
+# Identifica a este proceso entre los workers que comparten el broker
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+log = logging.getLogger(__name__)
+
+# (topic, payload, qos, comando, vencimiento monotónico o None)
+Item = tuple[str, str, int, bool, float | None]
+
+
+class MqttConnection:
+    """
+    Conexión MQTT única del backend (publicación y suscripciones).
+
+    - Se reconecta sola con backoff exponencial y vuelve a suscribirse.
+    - `publish()` no bloquea: encola y vuelve. Una tarea escritora vacía la
+      cola cuando hay conexión, con hasta `max_inflight` publicaciones
+      esperando su PUBACK a la vez. Si la conexión cae, lo que estaba en
+      vuelo vuelve al frente de su cola y se reintenta al reconectar.
+    - Los comandos (`command=True`) van en su propia cola, sin límite, y
+      salen antes que el resto. Caducan a los `command_ttl` segundos: tras
+      una caída larga no se reenvían órdenes viejas a los actuadores. Lo que
+      no puede perderse (invalidaciones de caché) se encola con `expire=False`.
+    - La cola de datos en vivo es acotada: con el broker caído mucho tiempo
+      se descartan los mensajes más antiguos.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        qos: int = 1,
+        outbox_size: int = 10000,
+        max_inflight: int = 32,
+        command_ttl: float = 60.0,
+        reconnect_min: float = 0.5,
+        reconnect_max: float = 30.0,
+        protocol: aiomqtt.ProtocolVersion | None = None,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.qos = qos
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.protocol = protocol
+        self.max_inflight = max_inflight
+        self.command_ttl = command_ttl
+
+        self._commands: deque[Item] = deque()
+        self._outbox: deque[Item] = deque(maxlen=outbox_size)
+        self._inflight = 0
+        self._pending = asyncio.Event()
+        self._handlers: dict[str, Callable[[aiomqtt.Message], Awaitable[None]]] = {}
+        self._task: asyncio.Task | None = None
+        self.connected = asyncio.Event()
+
+        self.published = 0
+        self.dropped = 0
+        self.expired = 0
+        self.reconnects = 0
+
+    def subscribe(self, topic: str, handler: Callable[[aiomqtt.Message], Awaitable[None]]):
+        """
+        Registra un handler; la suscripción se (re)hace en cada conexión.
+        `topic` puede ser una suscripción compartida ($share/<grupo>/...).
+        """
+        self._handlers[topic] = handler
+
+    def publish(
+        self,
+        topic: str,
+        payload: str,
+        qos: int | None = None,
+        command: bool = False,
+        expire: bool = True,
+    ):
+        expires = time.monotonic() + self.command_ttl if command and expire else None
+        item = (topic, payload, self.qos if qos is None else qos, command, expires)
+        if command:
+            self._commands.append(item)
+        else:
+            if len(self._outbox) == self._outbox.maxlen:
+                self.dropped += 1
+            self._outbox.append(item)
+        self._pending.set()
+
+    def _next(self) -> Item | None:
+        now = time.monotonic()
+        while self._commands:
+            item = self._commands.popleft()
+            if item[4] is None or item[4] > now:
+                return item
+            self.expired += 1
+            log.warning("Comando MQTT caducado sin publicar (%s): %s", item[0], item[1])
+        if self._outbox:
+            return self._outbox.popleft()
+        return None
+
+    def _requeue(self, item: Item):
+        if item[3]:
+            self._commands.appendleft(item)
+        elif len(self._outbox) == self._outbox.maxlen:
+            # Cola llena mientras estaba en vuelo: es el más antiguo
+            self.dropped += 1
+        else:
+            self._outbox.appendleft(item)
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected.is_set(),
+            "outbox": len(self._outbox),
+            "commands": len(self._commands),
+            "inflight": self._inflight,
+            "published": self.published,
+            "dropped": self.dropped,
+            "expired": self.expired,
+            "reconnects": self.reconnects,
+        }
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0):
+        # Damos un momento para vaciar la cola antes de cortar
+        if (self._outbox or self._commands or self._inflight) and self.connected.is_set():
+            try:
+                await asyncio.wait_for(self._drained(), timeout)
+            except asyncio.TimeoutError:
+                log.warning(
+                    "%d mensajes sin publicar al apagar",
+                    len(self._outbox) + len(self._commands) + self._inflight,
+                )
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _drained(self):
+        while self._outbox or self._commands or self._inflight:
+            await asyncio.sleep(0.05)
+
+    async def _run(self):
+        delay = self.reconnect_min
+        first = True
+        while True:
+            try:
+                client = aiomqtt.Client(
+                    self.hostname,
+                    self.port,
+                    protocol=self.protocol,
+                    max_inflight_messages=self.max_inflight,
+                )
+                # Las publicaciones en vuelo son intencionales: sin aviso por cada una
+                client.pending_calls_threshold = self.max_inflight
+                async with client:
+                    if not first:
+                        self.reconnects += 1
+                    first = False
+                    delay = self.reconnect_min
+
+                    for topic in self._handlers:
+                        await client.subscribe(topic, qos=self.qos)
+                    self.connected.set()
+                    log.info("MQTT conectado (%s:%s)", self.hostname, self.port)
+
+                    reader = asyncio.create_task(self._reader(client))
+                    writer = asyncio.create_task(self._writer(client))
+                    try:
+                        done, _ = await asyncio.wait(
+                            {reader, writer}, return_when=asyncio.FIRST_EXCEPTION
+                        )
+                        for task in done:
+                            task.result()
+                    finally:
+                        for task in (reader, writer):
+                            task.cancel()
+                        await asyncio.gather(reader, writer, return_exceptions=True)
+
+            except aiomqtt.MqttError as e:
+                log.warning("Error en MQTT: %s. Reintentando en %.1fs...", e, delay)
+            except Exception:
+                # Cualquier otro fallo tampoco puede cortar el bucle de reconexión
+                log.exception("Error inesperado en MQTT. Reintentando en %.1fs...", delay)
+            finally:
+                self.connected.clear()
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max)
+
+    async def _writer(self, client: aiomqtt.Client):
+        # Con QoS 1 cada publish() espera su PUBACK: varias en vuelo a la vez
+        # para no pagar una ida y vuelta al broker por mensaje
+        inflight: dict[asyncio.Task, Item] = {}
+        try:
+            while True:
+                while len(inflight) < self.max_inflight:
+                    item = self._next()
+                    if item is None:
+                        break
+                    topic, payload, qos, _, _ = item
+                    inflight[asyncio.create_task(client.publish(topic, payload, qos=qos))] = item
+                self._inflight = len(inflight)
+
+                waiting = set(inflight)
+                wake = None
+                if len(inflight) < self.max_inflight:
+                    # Las colas quedaron vacías: despertamos con el próximo publish()
+                    self._pending.clear()
+                    wake = asyncio.create_task(self._pending.wait())
+                    waiting.add(wake)
+
+                try:
+                    done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    if wake is not None:
+                        wake.cancel()
+
+                for task in done:
+                    if task is wake:
+                        continue
+                    # Un fallo corta la conexión; el mensaje vuelve a la cola abajo
+                    task.result()
+                    del inflight[task]
+                    self.published += 1
+                self._inflight = len(inflight)
+        finally:
+            # Sólo sale de las colas lo confirmado: lo demás vuelve al frente, en orden
+            for task, item in reversed(list(inflight.items())):
+                task.cancel()
+                self._requeue(item)
+            self._inflight = 0
+
+    async def _reader(self, client: aiomqtt.Client):
+        async for message in client.messages:
+            for topic, handler in self._handlers.items():
+                if message.topic.matches(topic):
+                    try:
+                        await handler(message)
+                    except Exception as e:
+                        log.exception("Procesando mensaje de %s: %s", message.topic, e)
+
+
+mqtt = MqttConnection(
+    settings.MQTT_BROKER,
+    settings.MQTT_PORT,
+    qos=settings.MQTT_QOS,
+    outbox_size=settings.MQTT_OUTBOX_SIZE,
+    max_inflight=settings.MQTT_MAX_INFLIGHT,
+    command_ttl=settings.MQTT_COMMAND_TTL,
+    reconnect_min=settings.MQTT_RECONNECT_MIN,
+    reconnect_max=settings.MQTT_RECONNECT_MAX,
+    # Las suscripciones compartidas son de MQTT v5
+    protocol=aiomqtt.ProtocolVersion.V5 if settings.MQTT_SHARED_GROUP else None,
+)
@@ -1,87 +1,221 @@
-import asyncio
 import json
+import logging
 import aiomqtt
-from datetime import datetime
-import traceback
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import select, insert
 from app.core.config import settings
 from app.services.websocket import manager
-from app.db.models import Sensor, DeviceSensor
-from app.db.database import async_engine
+from app.services.ingest_buffer import sensor_buffer
+from app.services.sensor_catalog import sensor_catalog
+from app.services.pipeline import BoundedStage
+from app.services.frame_merger import FrameMerger
+from app.services.mqtt_client import mqtt, WORKER_ID
+from app.services.recent_readings import recent_readings
+from app.services.device_registry import device_registry
+from app.services.device_config_cache import device_configs
+from app.services import metrics
 
+SENSOR_TOPIC = "invernadero/sensores"
 
-async def save_sensor_data(device_id: int, data: dict):
-    now = datetime.now()
-    try:
-        async with async_engine.begin() as conn:
-            for key in ["temperatura", "humedad", "luz"]:
-                value = data.get(key)
-                if value is None:
-                    print(f"[WARN] No se recibió valor para '{key}'")
-                    continue
-
-                try:
-                    value = float(value)
-                except (ValueError, TypeError):
-                    print(f"[ERROR] Valor inválido para '{key}': {value}")
-                    continue
-
-                result = await conn.execute(
-                    select(Sensor.sensor_id).where(Sensor.name == key)
-                )
-                sensor_id = result.scalar()
-
-                if sensor_id is None:
-                    print(f"[ERROR] Sensor '{key}' no encontrado en la DB.")
-                    continue
-
-                print(f"[DB] Insertando → {key} | valor={value} | sensor_id={sensor_id} | device_id={device_id}")
-
-                await conn.execute(
-                    insert(DeviceSensor).values(
-                        device_id=device_id,
-                        sensor_id=sensor_id,
-                        value=value,
-                        event_date=now.date(),
-                        event_time=now.time(),
-                    )
-                )
-
-        print("[DB] Commit exitoso")
-
-    except Exception as e:
-        print(f"[ERROR] Falló el guardado en DB: {e}")
-        traceback.print_exc()
-
-
-async def mqtt_listener():
-    while True:
-        try:
-            async with aiomqtt.Client(settings.MQTT_BROKER, settings.MQTT_PORT) as client:
-                await client.subscribe("invernadero/sensores")
-                async for message in client.messages:
-                    payload = message.payload.decode()
-                    print(f"Recibido: {payload}")
-                    try:
-                        data = json.loads(payload)
+log = logging.getLogger(__name__)
 
-                        temp = data.get("temperatura")
-                        hum = data.get("humedad")
-                        luz = data.get("luz")
 
-                        print(f" ➤ Temperatura procesada: {temp} °C")
-                        print(f" ➤ Humedad procesada: {hum} %")
-                        print(f" ➤ Luz procesada: {luz}")
+# Tolerancia para relojes de gateway adelantados
+MAX_CLOCK_SKEW = timedelta(minutes=5)
 
-                        device_id = data.get("device_id", 1)
 
-                        await save_sensor_data(device_id, data)
-                        await manager.broadcast(payload)
+def event_time(data: dict) -> datetime:
+    """
+    Hora del evento: `ts` del payload si viene (el gateway la fija al recibir
+    la trama, y se conserva cuando el mensaje se reenvía desde su spool), o
+    la hora de llegada.
+    """
+    now = datetime.now(timezone.utc)
+    ts = data.get("ts")
+    if not isinstance(ts, str):
+        return now
+
+    try:
+        event_ts = datetime.fromisoformat(ts)
+    except ValueError:
+        log.warning("ts inválido en el payload: %s", ts)
+        return now
+
+    if event_ts.tzinfo is None:
+        event_ts = event_ts.replace(tzinfo=timezone.utc)
+    if event_ts > now + MAX_CLOCK_SKEW:
+        return now
+    return event_ts
 
-                    except json.JSONDecodeError:
-                        print(" [Error] JSON inválido recibido")
 
-        except Exception as e:
-            print(f"Error en MQTT: {e}. Reintentando en 5s...")
-            await asyncio.sleep(5)
+async def save_sensor_data(device_id: int, data: dict):
+    now = event_time(data)
+    rows = []
+
+    # El catálogo decide qué claves del payload se ingieren
+    for key, sensor_id in sensor_catalog.items():
+        value = data.get(key)
+        if value is None:
+            log.debug("No se recibió valor para '%s' (device_id=%s)", key, device_id)
+            continue
+
+        try:
+            value = float(value)
+        except (ValueError, TypeError):
+            log.error("Valor inválido para '%s': %r (device_id=%s)", key, value, device_id)
+            continue
+
+        log.debug("Encolando %s valor=%s sensor_id=%s device_id=%s", key, value, sensor_id, device_id)
+
+        rows.append({
+            "device_id": device_id,
+            "sensor_id": sensor_id,
+            "value": value,
+            "event_ts": now,
+        })
+
+    # El commit lo hace el buffer write-behind en lotes; si está lleno se
+    # espera y la contrapresión llega a la cola de la etapa persist
+    await sensor_buffer.put(rows)
+
+
+async def _persist(item: list):
+    device_id, data = item
+    await save_sensor_data(device_id, data)
+
+
+async def _broadcast(item: list):
+    device_id, data, payload = item
+    with metrics.BROADCAST_SECONDS.time():
+        await manager.broadcast(device_id, data, raw=payload)
+
+
+persist_stage = BoundedStage(
+    "persist",
+    _persist,
+    maxsize=settings.PIPELINE_PERSIST_QUEUE_SIZE,
+    policy=settings.PIPELINE_PERSIST_POLICY,
+    spill_dir=settings.PIPELINE_SPILL_DIR,
+)
+
+broadcast_stage = BoundedStage(
+    "broadcast",
+    _broadcast,
+    maxsize=settings.PIPELINE_BROADCAST_QUEUE_SIZE,
+    policy=settings.PIPELINE_BROADCAST_POLICY,
+    spill_dir=settings.PIPELINE_SPILL_DIR,
+)
+
+pipeline_stages = [persist_stage, broadcast_stage]
+
+
+async def _fan_out(device_id, data: dict):
+    if settings.MQTT_LIVE_TOPIC:
+        # Varios workers: cada uno difunde a sus sockets lo que llega por el
+        # tópico en vivo (este worker incluido)
+        mqtt.publish(
+            settings.MQTT_LIVE_TOPIC,
+            json.dumps({"device_id": device_id, "data": data}),
+            qos=0,
+        )
+    else:
+        await broadcast_stage.put([device_id, data, json.dumps(data)])
+    await persist_stage.put([device_id, data])
+
+
+frame_merger = FrameMerger(
+    _fan_out,
+    expected_keys=sensor_catalog.names,
+    window=settings.FRAME_MERGE_WINDOW,
+    dedup_ttl=settings.FRAME_DEDUP_TTL,
+)
+
+
+def parse_sensor_message(payload: str) -> tuple[int, dict] | None:
+    try:
+        data = json.loads(payload)
+    except json.JSONDecodeError:
+        log.error("JSON inválido recibido: %.200s", payload)
+        return None
+
+    if not isinstance(data, dict):
+        log.error("El payload no es un objeto JSON: %.200s", payload)
+        return None
+
+    device_id = data.get("device_id", 1)
+    # asyncpg rechaza un "3": un device_id no entero tiraría el lote entero
+    if not isinstance(device_id, int) or isinstance(device_id, bool):
+        log.error("device_id inválido: %r", device_id)
+        metrics.MESSAGES_REJECTED.inc(1, "invalid_device_id")
+        return None
+    return device_id, data
+
+
+async def on_sensor_message(message: aiomqtt.Message):
+    # recepción -> parseo -> unión de tramas -> fan-out a persistencia y
+    # broadcast (colas independientes)
+    metrics.MQTT_MESSAGES.inc()
+    payload = message.payload.decode()
+    log.debug("Recibido: %s", payload)
+
+    with metrics.MESSAGE_PARSE_SECONDS.time():
+        parsed = parse_sensor_message(payload)
+    if parsed is None:
+        return
+
+    device_id, data = parsed
+    if not await device_registry.exists(device_id):
+        log.warning("Lectura de un dispositivo no registrado: %s", device_id)
+        metrics.MESSAGES_REJECTED.inc(1, "unknown_device")
+        return
+    await frame_merger.add(device_id, data)
+
+
+async def on_live_message(message: aiomqtt.Message):
+    item = json.loads(message.payload)
+    data = item["data"]
+    await broadcast_stage.put([item["device_id"], data, json.dumps(data)])
+
+
+async def on_live_rows(message: aiomqtt.Message):
+    # Lecturas insertadas por otro worker: mantienen fresco nuestro buffer reciente
+    item = json.loads(message.payload)
+    if item["origin"] != WORKER_ID:
+        recent_readings.add_readings([tuple(reading) for reading in item["readings"]])
+
+
+async def on_live_config(message: aiomqtt.Message):
+    # Otro worker cambió configuraciones: las recargamos de la DB al leerlas
+    item = json.loads(message.payload)
+    if item["origin"] != WORKER_ID:
+        device_configs.forget(item["device_ids"])
+
+
+async def on_live_sensors(message: aiomqtt.Message):
+    item = json.loads(message.payload)
+    if item["origin"] != WORKER_ID:
+        await sensor_catalog.refresh()
+
+
+def mqtt_listener():
+    # La conexión (y la reconexión) las maneja el cliente compartido
+    if settings.MQTT_SHARED_GROUP:
+        # Cada mensaje lo recibe un solo worker del grupo: sin inserciones repetidas
+        mqtt.subscribe(f"$share/{settings.MQTT_SHARED_GROUP}/{SENSOR_TOPIC}", on_sensor_message)
+        log.warning(
+            "MQTT_SHARED_GROUP activo: la unión de tramas y el descarte de "
+            "duplicados sólo valen dentro de cada worker"
+        )
+    else:
+        mqtt.subscribe(SENSOR_TOPIC, on_sensor_message)
+
+    if settings.MQTT_LIVE_TOPIC:
+        mqtt.subscribe(settings.MQTT_LIVE_TOPIC, on_live_message)
+        mqtt.subscribe(f"{settings.MQTT_LIVE_TOPIC}/rows", on_live_rows)
+        mqtt.subscribe(f"{settings.MQTT_LIVE_TOPIC}/config", on_live_config)
+        mqtt.subscribe(f"{settings.MQTT_LIVE_TOPIC}/sensors", on_live_sensors)
+    elif settings.MQTT_SHARED_GROUP:
+        log.warning(
+            "MQTT_SHARED_GROUP sin MQTT_LIVE_TOPIC: los workers no comparten "
+            "lecturas en vivo ni cambios de configuración/sensores"
+        )
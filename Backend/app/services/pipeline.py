@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import os
+from enum import Enum
+from typing import Any, Awaitable, Callable
+
+log = logging.getLogger(__name__)
+
+
+class OverflowPolicy(str, Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    SPILL = "spill"
+
+
+class BoundedStage:
+    """
+    Etapa del pipeline: una cola acotada + un consumidor dedicado.
+
+    Cuando la cola está llena se aplica `policy`:
+      - block: el productor espera (backpressure).
+      - drop_oldest: se descarta el elemento más antiguo.
+      - spill: los elementos van a un archivo JSONL y se reinyectan en orden
+        cuando la cola se vacía. Requiere elementos serializables a JSON.
+        Lo ya reinyectado se anota en `<name>.jsonl.offset`: tras una caída
+        se retoma desde ahí y no se repiten filas.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[None]],
+        maxsize: int,
+        policy: OverflowPolicy = OverflowPolicy.BLOCK,
+        spill_dir: str = "spill",
+    ):
+        self.name = name
+        self.handler = handler
+        self.policy = OverflowPolicy(policy)
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._task: asyncio.Task | None = None
+
+        self._spill_path = os.path.join(spill_dir, f"{name}.jsonl")
+        self._offset_path = f"{self._spill_path}.offset"
+        self._spill_offset = 0
+        self._spill_pending = 0
+
+        self.processed = 0
+        self.dropped = 0
+        self.spilled = 0
+
+    async def put(self, item: Any):
+        if self.policy == OverflowPolicy.BLOCK:
+            await self._queue.put(item)
+            return
+
+        if self.policy == OverflowPolicy.SPILL and (self._spill_pending or self._queue.full()):
+            # Una vez que empezamos a derramar, todo va al archivo para no romper el orden
+            self._spill(item)
+            return
+
+        if self._queue.full():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+
+        self._queue.put_nowait(item)
+
+    def _spill(self, item: Any):
+        os.makedirs(os.path.dirname(self._spill_path) or ".", exist_ok=True)
+        with open(self._spill_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(item) + "\n")
+        self._spill_pending += 1
+        self.spilled += 1
+
+    def _unspill(self, limit: int) -> list:
+        items = []
+        with open(self._spill_path, "r", encoding="utf-8") as f:
+            f.seek(self._spill_offset)
+            while len(items) < limit:
+                line = f.readline()
+                if not line:
+                    break
+                items.append(json.loads(line))
+            self._spill_offset = f.tell()
+
+        self._spill_pending -= len(items)
+        if self._spill_pending <= 0:
+            self._remove_spill()
+        else:
+            self._save_offset()
+
+        return items
+
+    def _save_offset(self):
+        # Reemplazo atómico: tras una caída el offset es el viejo o el nuevo
+        tmp = f"{self._offset_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(self._spill_offset))
+        os.replace(tmp, self._offset_path)
+
+    def _load_offset(self) -> int:
+        try:
+            with open(self._offset_path, "r", encoding="utf-8") as f:
+                offset = int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+        # Un offset más allá del final es de otro archivo
+        return offset if offset <= os.path.getsize(self._spill_path) else 0
+
+    def _remove_spill(self):
+        for path in (self._spill_path, self._offset_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._spill_offset = 0
+        self._spill_pending = 0
+
+    def _refill(self):
+        if self._queue.empty() and self._spill_pending:
+            for item in self._unspill(self._queue.maxsize or 1000):
+                self._queue.put_nowait(item)
+
+    async def _run(self):
+        while True:
+            self._refill()
+            item = await self._queue.get()
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                log.exception("[%s] Error procesando elemento: %s", self.name, e)
+            finally:
+                # Reinyectar antes de task_done para que join() no termine con spill pendiente
+                self._refill()
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "policy": self.policy.value,
+            "depth": self._queue.qsize(),
+            "maxsize": self._queue.maxsize,
+            "spill_depth": self._spill_pending,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+        }
+
+    def start(self):
+        if self._task is None:
+            if self.policy == OverflowPolicy.SPILL and os.path.exists(self._spill_path):
+                # Restos de una ejecución anterior: se reinyectan primero,
+                # desde donde había quedado la reinyección
+                self._spill_offset = self._load_offset()
+                with open(self._spill_path, "r", encoding="utf-8") as f:
+                    f.seek(self._spill_offset)
+                    self._spill_pending = sum(1 for _ in f)
+                if not self._spill_pending:
+                    self._remove_spill()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain: bool = True):
+        if self._task is None:
+            return
+
+        if drain:
+            # El consumidor reinyecta el archivo de spill por sí mismo
+            while True:
+                await self._queue.join()
+                if not self._spill_pending:
+                    break
+                await asyncio.sleep(0)
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        if self.policy == OverflowPolicy.SPILL and not self._queue.empty():
+            # Sin drenar: lo encolado va al archivo (delante) para el próximo arranque
+            self._spill_front()
+
+    def _spill_front(self):
+        items = []
+        while not self._queue.empty():
+            items.append(self._queue.get_nowait())
+            self._queue.task_done()
+
+        rest = []
+        if self._spill_pending:
+            with open(self._spill_path, "r", encoding="utf-8") as f:
+                f.seek(self._spill_offset)
+                rest = f.readlines()
+
+        os.makedirs(os.path.dirname(self._spill_path) or ".", exist_ok=True)
+        with open(self._spill_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(item) + "\n" for item in items)
+            f.writelines(rest)
+        self._spill_offset = 0
+        self._save_offset()
+        self._spill_pending = len(items) + len(rest)
+        self.spilled += len(items)
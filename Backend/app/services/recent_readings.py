@@ -0,0 +1,145 @@
+import logging
+from array import array
+
+from sqlalchemy import select, true
+from app.core.config import settings
+from app.db.models import Device, DeviceSensor, Sensor
+from app.db.database import async_engine
+
+log = logging.getLogger(__name__)
+
+
+class SeriesRing:
+    """
+    Últimas `capacity` lecturas de una serie (device_id, sensor_id).
+
+    Tres arrays planos preasignados (id, epoch, valor): 24 bytes por lectura,
+    sin objetos Python por lectura.
+    """
+
+    __slots__ = ("capacity", "ids", "timestamps", "values", "head", "size")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ids = array("q", bytes(8 * capacity))
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.head = 0
+        self.size = 0
+
+    def append(self, reading_id: int, timestamp: float, value: float):
+        self.ids[self.head] = reading_id
+        self.timestamps[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def latest(self, n: int) -> list[tuple[int, float, float]]:
+        """Las `n` lecturas más recientes, en orden cronológico."""
+        n = min(n, self.size)
+        start = (self.head - n) % self.capacity
+        readings = [
+            (self.ids[i], self.timestamps[i], self.values[i])
+            for i in ((start + k) % self.capacity for k in range(n))
+        ]
+        # Con varios workers los lotes pueden llegar desordenados
+        readings.sort(key=lambda r: (r[1], r[0]))
+        return readings
+
+
+class RecentReadings:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.warmed = False
+        self._series: dict[tuple[int, int], SeriesRing] = {}
+
+    def add(self, rows: list[dict], ids: list[int]):
+        self.add_readings(self.readings(rows, ids))
+
+    @staticmethod
+    def readings(rows: list[dict], ids: list[int]) -> list[tuple]:
+        """Filas insertadas -> (device_id, sensor_id, id, epoch, valor)."""
+        return [
+            (int(row["device_id"]), row["sensor_id"], reading_id, row["event_ts"].timestamp(), row["value"])
+            for row, reading_id in zip(rows, ids)
+        ]
+
+    def add_readings(self, readings: list[tuple]):
+        for device_id, sensor_id, reading_id, timestamp, value in readings:
+            key = (device_id, sensor_id)
+            ring = self._series.get(key)
+            if ring is None:
+                ring = self._series[key] = SeriesRing(self.capacity)
+            ring.append(reading_id, timestamp, value)
+
+    def latest(self, device_id: int, sensor_id: int | None, n: int):
+        """
+        (device_id, sensor_id, id, epoch, valor) de las últimas `n` lecturas, o
+        None si no podemos responder sin ir a la DB.
+        """
+        if not self.warmed or n > self.capacity:
+            return None
+
+        if sensor_id is not None:
+            ring = self._series.get((device_id, sensor_id))
+            readings = [(device_id, sensor_id, *r) for r in ring.latest(n)] if ring else []
+            return readings
+
+        readings = [
+            (device_id, series_sensor_id, *r)
+            for (series_device_id, series_sensor_id), ring in self._series.items()
+            if series_device_id == device_id
+            for r in ring.latest(n)
+        ]
+        readings.sort(key=lambda r: (r[3], r[2]))
+        return readings[-n:]
+
+    async def warm(self):
+        # Un LATERAL por serie: cada uno es un index scan sobre
+        # (device_id, sensor_id, event_ts DESC), sin recorrer la tabla.
+        latest = (
+            select(
+                DeviceSensor.device_sensor_id,
+                DeviceSensor.event_ts,
+                DeviceSensor.value,
+            )
+            .where(
+                DeviceSensor.device_id == Device.device_id,
+                DeviceSensor.sensor_id == Sensor.sensor_id,
+            )
+            .order_by(DeviceSensor.event_ts.desc())
+            .limit(self.capacity)
+            .lateral()
+        )
+
+        stmt = (
+            select(Device.device_id, Sensor.sensor_id, latest)
+            .select_from(Device)
+            .join(Sensor, true())
+            .join(latest, true())
+            .order_by(Device.device_id, Sensor.sensor_id, latest.c.event_ts)
+        )
+
+        series: dict[tuple[int, int], SeriesRing] = {}
+        async with async_engine.connect() as conn:
+            result = await conn.execute(stmt)
+            for device_id, sensor_id, reading_id, event_ts, value in result:
+                ring = series.get((device_id, sensor_id))
+                if ring is None:
+                    ring = series[(device_id, sensor_id)] = SeriesRing(self.capacity)
+                ring.append(reading_id, event_ts.timestamp(), value)
+
+        # Lo que haya llegado por ingesta durante la carga es más nuevo
+        for key, ring in self._series.items():
+            target = series.setdefault(key, SeriesRing(self.capacity))
+            for reading_id, timestamp, value in ring.latest(ring.size):
+                if reading_id not in target.ids:
+                    target.append(reading_id, timestamp, value)
+
+        self._series = series
+        self.warmed = True
+        log.info("Buffer caliente: %d series x %d lecturas", len(series), self.capacity)
+
+
+recent_readings = RecentReadings(settings.RECENT_READINGS_CAPACITY)
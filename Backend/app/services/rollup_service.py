@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, delete, func, case, Float, insert, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert, aggregate_order_by, ARRAY
+
+from app.db.models import DeviceSensor, DeviceSensorRollupMinute, DeviceSensorRollupHour
+from app.db.database import async_engine
+
+# (segundos, tabla), de la más gruesa a la más fina
+ROLLUPS = [
+    (3600, DeviceSensorRollupHour),
+    (60, DeviceSensorRollupMinute),
+]
+
+KEY_COLUMNS = ["device_id", "sensor_id", "bucket_start"]
+
+# Advisory lock del relleno al arrancar: con varios workers lo hace uno solo
+BACKFILL_LOCK_ID = 0x5347_0002
+
+log = logging.getLogger(__name__)
+
+
+def rollup_for(bucket_seconds: int):
+    """Tabla más gruesa cuyo tamaño de bucket divide al pedido (None = datos crudos)."""
+    for seconds, model in ROLLUPS:
+        if bucket_seconds % seconds == 0:
+            return seconds, model
+    return None
+
+
+def snap_bucket(bucket_seconds: int) -> int:
+    """Redondea un bucket calculado hacia arriba a un múltiplo de la resolución de un rollup."""
+    for seconds, _ in ROLLUPS:
+        if bucket_seconds >= seconds:
+            return math.ceil(bucket_seconds / seconds) * seconds
+    return bucket_seconds
+
+
+def truncate(ts: datetime, seconds: int) -> datetime:
+    # Los buckets se alinean en UTC (igual que _utc_trunc en la DB)
+    ts = ts.astimezone(timezone.utc)
+    if seconds == 3600:
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(second=0, microsecond=0)
+
+
+def aggregate_rows(rows: list[dict], seconds: int) -> list[dict]:
+    acc: dict[tuple, dict] = {}
+
+    for row in rows:
+        ts = row["event_ts"]
+        key = (row["device_id"], row["sensor_id"], truncate(ts, seconds))
+        value = row["value"]
+
+        bucket = acc.get(key)
+        if bucket is None:
+            acc[key] = {
+                "device_id": key[0],
+                "sensor_id": key[1],
+                "bucket_start": key[2],
+                "min_value": value,
+                "max_value": value,
+                "sum_value": value,
+                "count": 1,
+                "last_value": value,
+                "last_event": ts,
+            }
+            continue
+
+        bucket["min_value"] = min(bucket["min_value"], value)
+        bucket["max_value"] = max(bucket["max_value"], value)
+        bucket["sum_value"] += value
+        bucket["count"] += 1
+        if ts >= bucket["last_event"]:
+            bucket["last_value"] = value
+            bucket["last_event"] = ts
+
+    return list(acc.values())
+
+
+def _utc_trunc(unit: str, ts):
+    return func.timezone("UTC", func.date_trunc(unit, func.timezone("UTC", ts)))
+
+
+def _merge_statement(model):
+    stmt = pg_insert(model)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={
+            "min_value": func.least(model.min_value, excluded.min_value),
+            "max_value": func.greatest(model.max_value, excluded.max_value),
+            "sum_value": model.sum_value + excluded.sum_value,
+            "count": model.count + excluded.count,
+            "last_value": case(
+                (excluded.last_event >= model.last_event, excluded.last_value),
+                else_=model.last_value,
+            ),
+            "last_event": func.greatest(model.last_event, excluded.last_event),
+        },
+    )
+
+
+async def upsert_rollups(conn, rows: list[dict]):
+    """Actualiza los rollups con un lote de lecturas, dentro de la transacción del lote."""
+    for seconds, model in ROLLUPS:
+        values = aggregate_rows(rows, seconds)
+        # Orden fijo de claves: evita deadlocks entre lotes concurrentes de varios workers
+        values.sort(key=lambda v: (v["device_id"], v["sensor_id"], v["bucket_start"]))
+        if values:
+            await conn.execute(_merge_statement(model), values)
+
+
+async def rebuild_rollups(start: datetime | None = None, end: datetime | None = None, step: timedelta = timedelta(days=1)):
+    """
+    Recalcula los rollups desde `device_sensor`, por tramos de `step` (una
+    transacción cada uno). Cada tramo bloquea las inserciones en
+    `device_sensor` mientras dura: con ingesta en vivo conviene un `step` chico.
+    """
+    event_ts = DeviceSensor.event_ts
+
+    if start is None or end is None:
+        async with async_engine.connect() as conn:
+            result = await conn.execute(select(func.min(event_ts), func.max(event_ts)))
+            min_ts, max_ts = result.one()
+
+        if min_ts is None:
+            log.info("device_sensor vacía, nada que recalcular")
+            return
+
+        start = start or min_ts
+        end = end or max_ts + timedelta(seconds=1)
+
+    # Alineamos a horas completas para que el rollup horario sea exacto
+    cursor = truncate(start, 3600)
+    if truncate(end, 3600) != end:
+        end = truncate(end, 3600) + timedelta(hours=1)
+    step = max(step, timedelta(hours=1))
+
+    while cursor < end:
+        chunk_end = min(truncate(cursor + step, 3600), end)
+
+        async with async_engine.begin() as conn:
+            # Sin esto, un lote de la ingesta que se confirma entre el DELETE y
+            # el INSERT crea un bucket del tramo y el INSERT falla por clave
+            # duplicada (o cuenta sus filas dos veces). SHARE espera a los
+            # lotes en curso y frena los nuevos hasta el fin del tramo; la
+            # ingesta los retiene en su buffer mientras tanto.
+            await conn.execute(text("LOCK TABLE device_sensor IN SHARE MODE"))
+
+            for _, model in ROLLUPS:
+                await conn.execute(
+                    delete(model).where(
+                        model.bucket_start >= cursor,
+                        model.bucket_start < chunk_end,
+                    )
+                )
+
+            minute = _utc_trunc("minute", event_ts)
+            await conn.execute(
+                insert(DeviceSensorRollupMinute).from_select(
+                    KEY_COLUMNS + ["min_value", "max_value", "sum_value", "count", "last_value", "last_event"],
+                    select(
+                        DeviceSensor.device_id,
+                        DeviceSensor.sensor_id,
+                        minute,
+                        func.min(DeviceSensor.value),
+                        func.max(DeviceSensor.value),
+                        func.sum(DeviceSensor.value),
+                        func.count(),
+                        func.array_agg(
+                            aggregate_order_by(DeviceSensor.value, event_ts.desc()),
+                            type_=ARRAY(Float),
+                        )[1],
+                        func.max(event_ts),
+                    )
+                    .where(event_ts >= cursor, event_ts < chunk_end)
+                    .group_by(DeviceSensor.device_id, DeviceSensor.sensor_id, minute),
+                )
+            )
+
+            # El horario se deriva del rollup por minuto (mucho menos filas)
+            hour = _utc_trunc("hour", DeviceSensorRollupMinute.bucket_start)
+            await conn.execute(
+                insert(DeviceSensorRollupHour).from_select(
+                    KEY_COLUMNS + ["min_value", "max_value", "sum_value", "count", "last_value", "last_event"],
+                    select(
+                        DeviceSensorRollupMinute.device_id,
+                        DeviceSensorRollupMinute.sensor_id,
+                        hour,
+                        func.min(DeviceSensorRollupMinute.min_value),
+                        func.max(DeviceSensorRollupMinute.max_value),
+                        func.sum(DeviceSensorRollupMinute.sum_value),
+                        func.sum(DeviceSensorRollupMinute.count),
+                        func.array_agg(
+                            aggregate_order_by(
+                                DeviceSensorRollupMinute.last_value,
+                                DeviceSensorRollupMinute.last_event.desc(),
+                            ),
+                            type_=ARRAY(Float),
+                        )[1],
+                        func.max(DeviceSensorRollupMinute.last_event),
+                    )
+                    .where(
+                        DeviceSensorRollupMinute.bucket_start >= cursor,
+                        DeviceSensorRollupMinute.bucket_start < chunk_end,
+                    )
+                    .group_by(
+                        DeviceSensorRollupMinute.device_id,
+                        DeviceSensorRollupMinute.sensor_id,
+                        hour,
+                    ),
+                )
+            )
+
+        log.info("Rollups recalculados de %s a %s", cursor, chunk_end)
+        cursor = chunk_end
+
+
+async def backfill_rollups(step: timedelta = timedelta(days=1)):
+    """
+    Rellena los rollups del historial que no los tiene (bases migradas desde
+    antes de que existieran). Va de lo más reciente hacia atrás, un tramo por
+    transacción: si se corta, el próximo arranque sigue desde donde quedó.
+    """
+    async with async_engine.connect() as lock_conn:
+        if not await lock_conn.scalar(text(f"SELECT pg_try_advisory_lock({BACKFILL_LOCK_ID})")):
+            return  # Otro worker ya está rellenando
+        await lock_conn.commit()
+
+        try:
+            async with async_engine.connect() as conn:
+                result = await conn.execute(select(func.min(DeviceSensor.event_ts)))
+                min_ts = result.scalar()
+                result = await conn.execute(select(func.min(DeviceSensorRollupMinute.bucket_start)))
+                covered = result.scalar()
+
+            if min_ts is None:
+                return
+            if covered is not None and covered <= truncate(min_ts, 60):
+                return  # El historial ya tiene rollups
+
+            # La hora del bucket más antiguo puede tener lecturas previas a la
+            # ingesta en vivo que la creó: se recalcula entera
+            if covered is None:
+                cursor = truncate(datetime.now(timezone.utc), 3600) + timedelta(hours=1)
+            else:
+                cursor = truncate(covered, 3600) + timedelta(hours=1)
+            start = truncate(min_ts, 3600)
+
+            log.info("Rellenando rollups de %s a %s", start, cursor)
+            while cursor > start:
+                chunk_start = max(cursor - step, start)
+                await rebuild_rollups(chunk_start, cursor, step)
+                cursor = chunk_start
+            log.info("Rollups rellenados")
+        finally:
+            await lock_conn.execute(text(f"SELECT pg_advisory_unlock({BACKFILL_LOCK_ID})"))
+            await lock_conn.commit()
+
+
+def _parse_datetime(value: str) -> datetime:
+    # Sin zona = hora local
+    return datetime.fromisoformat(value).astimezone()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula los rollups de device_sensor")
+    parser.add_argument("--from", dest="start", type=_parse_datetime, default=None)
+    parser.add_argument("--to", dest="end", type=_parse_datetime, default=None)
+    parser.add_argument("--step-hours", type=int, default=24)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(
+        rebuild_rollups(args.start, args.end, timedelta(hours=args.step_hours))
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import logging
+
+from sqlalchemy import select, insert
+from app.db.models import Sensor
+from app.core.config import settings
+from app.db.database import async_engine
+from app.services.mqtt_client import mqtt, WORKER_ID
+
+log = logging.getLogger(__name__)
+
+
+class SensorCatalog:
+    """
+    Catálogo en memoria de la tabla `sensor` (name -> sensor_id).
+
+    Se carga al arrancar y define qué claves del payload MQTT se ingieren.
+    Con varios workers los cambios se anuncian en `<MQTT_LIVE_TOPIC>/sensors`
+    y los demás recargan el catálogo.
+    """
+
+    def __init__(self):
+        self._by_name: dict[str, int] = {}
+        self._lock = asyncio.Lock()
+
+    def resolve(self, name: str) -> int | None:
+        return self._by_name.get(name)
+
+    def names(self) -> list[str]:
+        return list(self._by_name)
+
+    def items(self) -> list[tuple[str, int]]:
+        return list(self._by_name.items())
+
+    def invalidate(self):
+        self._by_name = {}
+
+    def _announce(self):
+        if settings.MQTT_LIVE_TOPIC:
+            mqtt.publish(
+                f"{settings.MQTT_LIVE_TOPIC}/sensors",
+                json.dumps({"origin": WORKER_ID}),
+                command=True,
+                expire=False,
+            )
+
+    async def refresh(self, announce: bool = False):
+        async with self._lock:
+            async with async_engine.connect() as conn:
+                result = await conn.execute(select(Sensor.name, Sensor.sensor_id))
+                # Reemplazo atómico: los lectores nunca ven un dict a medias
+                self._by_name = {name: sensor_id for name, sensor_id in result.all()}
+
+        log.info("Sensores cargados: %s", self._by_name)
+        if announce:
+            self._announce()
+
+    async def register(self, name: str, model: str) -> int:
+        async with self._lock:
+            sensor_id = self._by_name.get(name)
+            if sensor_id is not None:
+                return sensor_id
+
+            async with async_engine.begin() as conn:
+                result = await conn.execute(
+                    select(Sensor.sensor_id).where(Sensor.name == name)
+                )
+                sensor_id = result.scalar()
+
+                if sensor_id is None:
+                    result = await conn.execute(
+                        insert(Sensor)
+                        .values(name=name, model=model)
+                        .returning(Sensor.sensor_id)
+                    )
+                    sensor_id = result.scalar_one()
+
+            self._by_name = {**self._by_name, name: sensor_id}
+
+        log.info("Sensor registrado: %s -> %s", name, sensor_id)
+        self._announce()
+        return sensor_id
+
+
+sensor_catalog = SensorCatalog()
@@ -1,20 +1,229 @@
+import asyncio
+import json
+import logging
+from collections import deque
 from fastapi import WebSocket
-from typing import List
+from typing import Dict, Iterable
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+
+class ClientConnection:
+    """
+    Cola de salida + tarea escritora dedicada para un WebSocket.
+
+    Un cliente lento sólo se atrasa a sí mismo: broadcast() encola sin esperar.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.outbox: deque[tuple[object, str]] = deque()
+        self.ready = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.conflated = 0
+
+        # Suscripción: None = todo
+        self.device_ids: frozenset[str] | None = None
+        self.sensors: frozenset[str] | None = None
+        self.min_interval: float = 0.0
+
+
+def parse_subscription(
+    device_ids: Iterable | str | None,
+    sensors: Iterable | str | None,
+    max_rate: float | None,
+) -> tuple[frozenset[str] | None, frozenset[str] | None, float]:
+    """Normaliza los parámetros de suscripción (query params o mensaje JSON)."""
+
+    def _as_set(values):
+        if values is None or values == "":
+            return None
+        if isinstance(values, (str, int)):
+            values = str(values).split(",")
+        result = frozenset(str(v).strip() for v in values if str(v).strip())
+        return result or None
+
+    min_interval = 1.0 / max_rate if max_rate and max_rate > 0 else 0.0
+    return _as_set(device_ids), _as_set(sensors), min_interval
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(
+        self,
+        queue_size: int,
+        send_timeout: float,
+        slow_client_policy: str = "conflate",
+    ):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_client_policy = slow_client_policy
+
+        # dict -> connect/disconnect O(1)
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        # device_id -> clientes suscritos; la clave None son los suscritos a todo
+        self._subscribers: Dict[str | None, set[ClientConnection]] = {None: set()}
+        self.evicted = 0
+        self._evictions: set[asyncio.Task] = set()
 
-    async def connect(self, websocket: WebSocket):
+    def __len__(self):
+        return len(self.active_connections)
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        device_ids=None,
+        sensors=None,
+        max_rate: float | None = None,
+    ):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket)
+        self.active_connections[websocket] = client
+        self._set_subscription(client, *parse_subscription(device_ids, sensors, max_rate))
+        client.task = asyncio.create_task(self._writer(client))
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        client = self.active_connections.pop(websocket, None)
+        if client is None:
+            return
+
+        self._unindex(client)
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def subscribe(self, websocket: WebSocket, device_ids=None, sensors=None, max_rate: float | None = None):
+        client = self.active_connections.get(websocket)
+        if client is not None:
+            self._set_subscription(client, *parse_subscription(device_ids, sensors, max_rate))
+
+    def send(self, websocket: WebSocket, message: str):
+        client = self.active_connections.get(websocket)
+        if client is not None:
+            # Clave única: los mensajes de control nunca se coalescen
+            self._enqueue(client, message, key=object())
+
+    def _set_subscription(self, client, device_ids, sensors, min_interval):
+        self._unindex(client)
+        client.device_ids = device_ids
+        client.sensors = sensors
+        client.min_interval = min_interval
+
+        for key in device_ids or (None,):
+            self._subscribers.setdefault(key, set()).add(client)
+
+    def _unindex(self, client: ClientConnection):
+        for key in client.device_ids or (None,):
+            group = self._subscribers.get(key)
+            if group is None:
+                continue
+            group.discard(client)
+            if not group and key is not None:
+                del self._subscribers[key]
+
+    async def broadcast(self, device_id, data: dict, raw: str | None = None):
+        device_key = str(device_id)
+        targeted = self._subscribers.get(device_key, ())
+        wildcard = self._subscribers[None]
+        if not targeted and not wildcard:
+            # Nadie escucha este dispositivo: ni siquiera serializamos
+            return
+
+        # Se serializa una vez por cada filtro de sensores distinto
+        rendered: dict[frozenset[str] | None, str | None] = {}
+
+        for group in (targeted, wildcard):
+            for client in list(group):
+                if client.sensors not in rendered:
+                    rendered[client.sensors] = self._render(data, client.sensors, raw)
+
+                message = rendered[client.sensors]
+                if message is not None:
+                    self._enqueue(client, message, device_key)
+
+    @staticmethod
+    def _render(data: dict, sensors: frozenset[str] | None, raw: str | None) -> str | None:
+        if sensors is None:
+            return raw if raw is not None else json.dumps(data)
+
+        filtered = {k: v for k, v in data.items() if k in sensors}
+        if not filtered:
+            return None
+
+        if "device_id" in data:
+            filtered["device_id"] = data["device_id"]
+        return json.dumps(filtered)
+
+    def _enqueue(self, client: ClientConnection, message: str, key: object):
+        if client.min_interval:
+            # Cliente con tasa máxima: se coalescen lecturas intermedias por clave
+            pending = len(client.outbox)
+            client.outbox = deque((k, m) for k, m in client.outbox if k != key)
+            client.conflated += pending - len(client.outbox)
+
+        if len(client.outbox) >= self.queue_size:
+            if self.slow_client_policy != "conflate":
+                log.warning("Cliente atrasado, desconectando...")
+                self._schedule_evict(client)
+                return
+
+            # Latest value wins: nos quedamos con el último mensaje por clave
+            latest = {}
+            for pending_key, pending in client.outbox:
+                latest[pending_key] = pending
+            latest.pop(key, None)
+            client.conflated += len(client.outbox) - len(latest)
+            client.outbox = deque(latest.items())
+
+            if len(client.outbox) >= self.queue_size:
+                self._schedule_evict(client)
+                return
+
+        client.outbox.append((key, message))
+        client.ready.set()
+
+    async def _writer(self, client: ClientConnection):
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+
+                while client.outbox:
+                    _, message = client.outbox.popleft()
+                    await asyncio.wait_for(
+                        client.websocket.send_text(message),
+                        timeout=self.send_timeout,
+                    )
+
+                if client.min_interval:
+                    await asyncio.sleep(client.min_interval)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Timeout o socket muerto: fuera de la lista
+            log.info("Error enviando, cliente desconectado: %r", e)
+            await self._evict(client)
+
+    def _schedule_evict(self, client: ClientConnection):
+        task = asyncio.create_task(self._evict(client))
+        self._evictions.add(task)
+        task.add_done_callback(self._evictions.discard)
+
+    async def _evict(self, client: ClientConnection):
+        if self.active_connections.get(client.websocket) is not client:
+            return
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        self.disconnect(client.websocket)
+        self.evicted += 1
+        try:
+            await asyncio.wait_for(client.websocket.close(code=1013), timeout=self.send_timeout)
+        except Exception:
+            pass
 
 
-manager = ConnectionManager()
+manager = ConnectionManager(
+    queue_size=settings.WS_QUEUE_SIZE,
+    send_timeout=settings.WS_SEND_TIMEOUT,
+    slow_client_policy=settings.WS_SLOW_CLIENT_POLICY,
+)
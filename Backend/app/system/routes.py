@@ -3,57 +3,164 @@ from fastapi import (
     WebSocket,
     WebSocketDisconnect,
     HTTPException,
-    Request,
     Depends,
+    Query,
 )
+from fastapi.responses import StreamingResponse, Response
 
 import json
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Literal
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.websocket import manager
 from app.services.data_sensor_service import DataSensorService
+from app.services.sensor_catalog import sensor_catalog
+from app.services.rollup_service import snap_bucket
+from app.services.export_service import stream_device_sensors, parse_token
+from app.services.columnar import MEDIA_TYPE as COLUMNAR_MEDIA_TYPE
+from app.services.mqtt_service import pipeline_stages, frame_merger
+from app.services.ingest_buffer import sensor_buffer
+from app.services.mqtt_client import mqtt
 from app.system.schemas import (
     ControllerData,
     ControllerDataDevice,
     ControllerResponse,
     ControllerDataUpdate,
+    ControllerBatchRequest,
+    ControllerBatchResponse,
+    ControllerCommandStatus,
     DeviceConfigurationListSchema,
+    SensorSchema,
+    SensorListSchema,
+    SensorCreate,
+    PipelineStageSchema,
+    PipelineStatsSchema,
+    SensorBucketListSchema,
+    SensorPointListSchema,
 )
 from app.db.database import get_db
 from app.system.schemas import DeviceSensorListSchema
 
+log = logging.getLogger(__name__)
+
 router = APIRouter()
 
 @router.websocket("/ws/sensor-readings")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    device_id: str | None = None,
+    sensors: str | None = None,
+    max_rate: float | None = None,
+):
+    # Filtros opcionales: ?device_id=1,2&sensors=temperatura,humedad&max_rate=2
+    await manager.connect(websocket, device_id, sensors, max_rate)
     try:
         while True:
-            # Mantenemos la conexión viva
-            await websocket.receive_text()
-    except WebSocketDisconnect:
+            # Mantenemos la conexión viva y aceptamos cambios de suscripción:
+            # {"action": "subscribe", "device_ids": [1], "sensors": ["luz"], "max_rate": 1}
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except json.JSONDecodeError:
+                continue
+
+            if not isinstance(message, dict):
+                continue
+
+            if message.get("action") == "subscribe":
+                manager.subscribe(
+                    websocket,
+                    message.get("device_ids"),
+                    message.get("sensors"),
+                    message.get("max_rate"),
+                )
+                manager.send(websocket, json.dumps({"subscribed": True}))
+            elif message.get("action") == "unsubscribe":
+                manager.subscribe(websocket)
+                manager.send(websocket, json.dumps({"subscribed": False}))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
         manager.disconnect(websocket)
 
 
 @router.post("/controllers", response_model=ControllerResponse)
-async def activate_controller(data: ControllerData, request: Request):
+async def activate_controller(data: ControllerData):
     topic_control = "invernadero/control"
     payload_json = data.model_dump_json()
 
-    mqtt_client = request.app.state.mqtt
+    log.info("Enviando comando: %s", payload_json)
 
-    try:
-        print(f" [API] Enviando comando: {payload_json}")
+    # Encolar y volver: la conexión compartida publica (y reintenta si el broker cae)
+    mqtt.publish(topic_control, payload_json, command=True)
 
-        await mqtt_client.publish(topic_control, payload_json)
+    return ControllerResponse(
+        success=True,
+        message="Comando enviado correctamente al controlador"
+    )
 
-        return ControllerResponse(
-            success=True,
-            message="Comando enviado correctamente al controlador"
+@router.post("/controllers/batch", response_model=ControllerBatchResponse)
+async def activate_controllers_batch(
+    data: ControllerBatchRequest,
+    db: AsyncSession = Depends(get_db),
+):
+    topic_control = "invernadero/control"
+    data_sensor_service = DataSensorService(db)
+
+    # Resolución + escritura: una sola sentencia, una transacción
+    if data.selector is not None:
+        if data.target == "servo":
+            # Con all=true no hay lista de comandos donde marcar el rechazo
+            raise HTTPException(status_code=403, detail="El servo sólo se cambia con toggle")
+        requested = {(device_id, data.target): data.value for device_id in data.selector.device_ids or []}
+        applied = await data_sensor_service.update_controller_fleet(
+            actuador=data.target,
+            value=data.value,
+            device_ids=None if data.selector.all else data.selector.device_ids,
         )
+    else:
+        requested = {(command.device_id, command.target): command.value for command in data.commands}
+        applied = await data_sensor_service.update_controller_values(
+            [(command.device_id, command.target, command.value) for command in data.commands]
+        )
+
+    log.info("Enviando %d comandos en lote", len(applied))
+    results = []
+    for config in applied:
+        mqtt.publish(
+            topic_control,
+            json.dumps({"target": config.actuador, "value": config.value, "device_id": config.device_id}),
+            command=True,
+        )
+        results.append(ControllerCommandStatus(
+            device_id=config.device_id,
+            target=config.actuador,
+            value=config.value,
+            success=True,
+            message="Comando enviado correctamente al controlador",
+        ))
 
-    except Exception as e:
-        print(f"Error publicando MQTT: {e}")
-        raise HTTPException(status_code=500, detail="Error al conectar con el broker MQTT")
+    found = {(config.device_id, config.actuador) for config in applied}
+    for (device_id, target), value in requested.items():
+        if (device_id, target) not in found:
+            results.append(ControllerCommandStatus(
+                device_id=device_id,
+                target=target,
+                value=value,
+                success=False,
+                message=(
+                    "El servo sólo se cambia con toggle"
+                    if target == "servo"
+                    else "No se encontró la configuración del controlador"
+                ),
+            ))
+
+    return ControllerBatchResponse(
+        success=all(result.success for result in results),
+        results=results,
+    )
 
 @router.get("/controllers/{device_id}/config", response_model=DeviceConfigurationListSchema)
 async def get_controller_configuration(
@@ -76,7 +183,7 @@ async def update_controller(
 ):
     data_sensor_service = DataSensorService(db)
 
-    print(actuador, data.value)
+    log.debug("Actualizando %s=%s (device_id=%s)", actuador, data.value, device_id)
     configuration = await data_sensor_service.update_controller_value(
         device_id=device_id,
         actuador=actuador,
@@ -98,60 +205,224 @@ async def update_controller(
 async def activate_controller_by_device(
     data: ControllerDataDevice,
     device_id: int,
-    request: Request,
     db: AsyncSession = Depends(get_db),
 ):
     topic_control = "invernadero/control"
     payload_dict = data.model_dump()
     data_sensor_service = DataSensorService(db)
-    configuration = await data_sensor_service.read_configuration_by_sensor(
-        device_id=device_id,
-        actuador=data.target
-    )
-    payload_dict["value"] = configuration.value
+
+    # Servo: el cambio de posición se hace en SQL (un UPDATE ... RETURNING)
+    # y se publica el valor anterior, como antes. El resto sale de la caché.
+    if data.target == "servo":
+        toggled = await data_sensor_service.toggle_servo(
+            device_id=device_id,
+            actuador=data.target
+        )
+        value = toggled[0] if toggled else None
+    else:
+        configuration = await data_sensor_service.read_configuration_by_sensor(
+            device_id=device_id,
+            actuador=data.target
+        )
+        value = configuration.value if configuration else None
+
+    if value is None:
+        return ControllerResponse(
+            success=False,
+            message="No se encontró la configuración del controlador"
+        )
+
+    payload_dict["value"] = value
+    # El gateway enruta el comando a la radio que escuchó al dispositivo
+    payload_dict["device_id"] = device_id
     payload_json = json.dumps(payload_dict)
 
-    mqtt_client = request.app.state.mqtt
+    log.info("Enviando comando: %s", payload_json)
 
-    try:
-        print(f" [API] Enviando comando: {payload_json}")
+    # Encolar y volver: la conexión compartida publica (y reintenta si el broker cae)
+    mqtt.publish(topic_control, payload_json, command=True)
 
-        print(data.target, configuration.value, type(configuration.value))
-        if data.target == "servo":
-            movimiento = 0
+    return ControllerResponse(
+        success=True,
+        message="Comando enviado correctamente al controlador"
+    )
 
-            if int(configuration.value) == 90:
-                movimiento = 180
-            else:
-                movimiento = 90
+@router.get("/sensors", response_model=SensorListSchema)
+async def get_sensors():
+    return SensorListSchema(
+        sensors=[
+            SensorSchema(sensor_id=sensor_id, name=name)
+            for name, sensor_id in sensor_catalog.items()
+        ]
+    )
 
-            await data_sensor_service.update_controller_value(
-                device_id=device_id,
-                actuador=data.target,
-                value=movimiento,
-                admin=True
-            )
 
-        await mqtt_client.publish(topic_control, payload_json)
+@router.post("/sensors", response_model=SensorSchema)
+async def register_sensor(data: SensorCreate):
+    sensor_id = await sensor_catalog.register(data.name, data.model)
+    return SensorSchema(sensor_id=sensor_id, name=data.name)
 
-        return ControllerResponse(
-            success=True,
-            message="Comando enviado correctamente al controlador"
-        )
 
-    except Exception as e:
-        print(f"Error publicando MQTT: {e}")
-        raise HTTPException(status_code=500, detail="Error al conectar con el broker MQTT")
+@router.post("/sensors/refresh", response_model=SensorListSchema)
+async def refresh_sensors():
+    await sensor_catalog.refresh(announce=True)
+    return await get_sensors()
 
-@router.get("/data-sensors/{device_id}", response_model=DeviceSensorListSchema)
+
+@router.get(
+    "/data-sensors/{device_id}",
+    response_model=DeviceSensorListSchema | SensorBucketListSchema | SensorPointListSchema,
+)
 async def get_data_sensors(
     device_id: int,
     sensor_id: int | None = None,
+    sensor: str | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    bucket: int | None = Query(None, ge=1, description="Bucket size in seconds"),
+    points: int | None = Query(None, ge=3, le=10000, description="Target number of points"),
+    mode: Literal["raw", "buckets", "lttb"] | None = None,
+    limit: int = Query(20, ge=1, le=100000, description="Max rows in raw mode"),
+    format: Literal["json", "binary"] = "json",
+    dtype: Literal["float32", "float64"] = "float64",
     db: AsyncSession = Depends(get_db),
 ):
+    if sensor is not None:
+        sensor_id = sensor_catalog.resolve(sensor)
+        if sensor_id is None:
+            raise HTTPException(status_code=404, detail=f"Sensor '{sensor}' no encontrado")
+
+    if mode is None:
+        mode = "buckets" if bucket or points else "raw"
+
+    # format=binary: columnas tipadas (ver app/services/columnar.py)
+    binary = format == "binary"
     data_sensor_service = DataSensorService(db)
-    result = await data_sensor_service.read_data_sensors(
+
+    if mode == "raw":
+        if binary:
+            content = await data_sensor_service.read_data_sensors_columnar(
+                device_id=device_id,
+                sensor_id=sensor_id,
+                start=start,
+                end=end,
+                limit=limit,
+                dtype=dtype,
+            )
+            return Response(content=content, media_type=COLUMNAR_MEDIA_TYPE)
+
+        result = await data_sensor_service.read_data_sensors(
+            device_id=device_id,
+            sensor_id=sensor_id,
+            start=start,
+            end=end,
+            limit=limit,
+        )
+        return result
+
+    # Por defecto, últimas 24 horas (fechas sin zona = hora local)
+    end = (end or datetime.now()).astimezone()
+    start = (start or end - timedelta(days=1)).astimezone()
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+
+    if mode == "lttb":
+        if binary:
+            content = await data_sensor_service.read_data_sensor_lttb_columnar(
+                device_id=device_id,
+                sensor_id=sensor_id,
+                start=start,
+                end=end,
+                points=points or 500,
+                dtype=dtype,
+            )
+            return Response(content=content, media_type=COLUMNAR_MEDIA_TYPE)
+
+        result = await data_sensor_service.read_data_sensor_lttb(
+            device_id=device_id,
+            sensor_id=sensor_id,
+            start=start,
+            end=end,
+            points=points or 500,
+        )
+        return result
+
+    if bucket is None:
+        # Redondeamos para que la consulta pueda salir de los rollups
+        bucket = snap_bucket(
+            max(1, math.ceil((end - start).total_seconds() / (points or 500)))
+        )
+
+    if binary:
+        content = await data_sensor_service.read_data_sensor_buckets_columnar(
+            device_id=device_id,
+            sensor_id=sensor_id,
+            start=start,
+            end=end,
+            bucket_seconds=bucket,
+            dtype=dtype,
+        )
+        return Response(
+            content=content,
+            media_type=COLUMNAR_MEDIA_TYPE,
+            headers={"X-Bucket-Seconds": str(bucket)},
+        )
+
+    result = await data_sensor_service.read_data_sensor_buckets(
         device_id=device_id,
-        sensor_id=sensor_id
+        sensor_id=sensor_id,
+        start=start,
+        end=end,
+        bucket_seconds=bucket,
     )
     return result
+
+
+@router.get("/data-sensors/{device_id}/export")
+async def export_data_sensors(
+    device_id: int,
+    sensor_id: int | None = None,
+    sensor: str | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    after: str | None = Query(None, description="Resume token: '<event_ts_us>,<device_sensor_id>' of the last row received"),
+    format: Literal["ndjson", "csv"] = "ndjson",
+    limit: int | None = Query(None, ge=1),
+):
+    if sensor is not None:
+        sensor_id = sensor_catalog.resolve(sensor)
+        if sensor_id is None:
+            raise HTTPException(status_code=404, detail=f"Sensor '{sensor}' no encontrado")
+
+    resume = None
+    if after is not None:
+        try:
+            resume = parse_token(after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Token 'after' inválido")
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_device_sensors(
+            device_id=device_id,
+            sensor_id=sensor_id,
+            start=start,
+            end=end,
+            after=resume,
+            fmt=format,
+            limit=limit,
+        ),
+        media_type=media_type,
+    )
+
+
+@router.get("/pipeline/stats", response_model=PipelineStatsSchema)
+async def get_pipeline_stats():
+    return PipelineStatsSchema(
+        stages=[PipelineStageSchema(**stage.stats()) for stage in pipeline_stages],
+        ingest_buffer_pending=sensor_buffer.pending,
+        **frame_merger.stats(),
+        ws_clients=len(manager),
+        ws_evicted=manager.evicted,
+        **{f"mqtt_{key}": value for key, value in mqtt.stats().items()},
+    )
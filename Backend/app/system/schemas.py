@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, ConfigDict
-from datetime import date, time
+from pydantic import BaseModel, Field, ConfigDict, model_validator
+from datetime import date, time, datetime
 
 class ControllerData(BaseModel):
     target: str = Field(..., description="Name of the controller")
@@ -18,12 +18,69 @@ class ControllerResponse(BaseModel):
     message: str = Field(..., description="Additional information about the operation")
 
 
+class ControllerCommand(BaseModel):
+    device_id: int = Field(..., description="Target device")
+    target: str = Field(..., description="Name of the controller")
+    value: int = Field(..., description="Value to set for the controller")
+
+
+class DeviceSelector(BaseModel):
+    device_ids: list[int] | None = Field(None, description="Devices to command")
+    all: bool = Field(False, description="Command every device with this controller")
+
+
+class ControllerBatchRequest(BaseModel):
+    commands: list[ControllerCommand] = Field(default_factory=list, description="Explicit commands")
+    selector: DeviceSelector | None = Field(None, description="Fleet command: devices to apply target/value to")
+    target: str | None = Field(None, description="Controller for the selector")
+    value: int | None = Field(None, description="Value for the selector")
+
+    @model_validator(mode="after")
+    def check_selector(self):
+        if self.selector is not None:
+            if self.target is None or self.value is None:
+                raise ValueError("selector requires target and value")
+            if not self.selector.all and not self.selector.device_ids:
+                raise ValueError("selector requires device_ids or all=true")
+        elif not self.commands:
+            raise ValueError("commands or selector is required")
+        return self
+
+
+class ControllerCommandStatus(BaseModel):
+    device_id: int
+    target: str
+    value: int
+    success: bool
+    message: str
+
+
+class ControllerBatchResponse(BaseModel):
+    success: bool = Field(..., description="True if every command was applied and published")
+    results: list[ControllerCommandStatus]
+
+
+class SensorSchema(BaseModel):
+    sensor_id: int
+    name: str
+
+
+class SensorListSchema(BaseModel):
+    sensors: list[SensorSchema]
+
+
+class SensorCreate(BaseModel):
+    name: str = Field(..., description="Metric name as sent in the MQTT payload")
+    model: str = Field(..., description="Sensor model")
+
+
 class DeviceSensorSchema(BaseModel):
 
     device_sensor_id: int
     device_id: int
     sensor_id: int
     value: float
+    event_ts: datetime
     event_date: date
     event_time: time
 
@@ -35,6 +92,30 @@ class DeviceSensorListSchema(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class SensorBucketSchema(BaseModel):
+    sensor_id: int
+    bucket_start: datetime
+    min: float
+    max: float
+    avg: float
+    count: int
+
+
+class SensorBucketListSchema(BaseModel):
+    bucket_seconds: int
+    buckets: list[SensorBucketSchema]
+
+
+class SensorPointSchema(BaseModel):
+    sensor_id: int
+    timestamp: datetime
+    value: float
+
+
+class SensorPointListSchema(BaseModel):
+    points: list[SensorPointSchema]
+
+
 class DeviceConfigurationSchema(BaseModel):
     device_configuration_id: int
     device_id: int
@@ -47,3 +128,32 @@ class DeviceConfigurationListSchema(BaseModel):
     device_configurations: list[DeviceConfigurationSchema]
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class PipelineStageSchema(BaseModel):
+    name: str
+    policy: str
+    depth: int
+    maxsize: int
+    spill_depth: int
+    processed: int
+    dropped: int
+    spilled: int
+
+
+class PipelineStatsSchema(BaseModel):
+    stages: list[PipelineStageSchema]
+    ingest_buffer_pending: int
+    pending_frames: int
+    frames_merged: int
+    duplicates_dropped: int
+    ws_clients: int
+    ws_evicted: int
+    mqtt_connected: bool
+    mqtt_outbox: int
+    mqtt_commands: int
+    mqtt_inflight: int
+    mqtt_published: int
+    mqtt_dropped: int
+    mqtt_expired: int
+    mqtt_reconnects: int
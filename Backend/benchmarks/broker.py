@@ -0,0 +1,174 @@
+"""
+Broker MQTT 3.1.1 mínimo para los benchmarks (sólo librería estándar).
+
+No es un broker de producción: sin retained, sin sesiones persistentes, sin
+reintentos de QoS 1 y con QoS máximo 1. Alcanza para medir el backend en
+una máquina sin servicios externos:
+
+    python -m benchmarks.broker --port 18830
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+
+log = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _packet(first_byte: int, body: bytes) -> bytes:
+    return bytes((first_byte,)) + _encode_length(len(body)) + body
+
+
+def _string(data: bytes, offset: int) -> tuple[str, int]:
+    length = int.from_bytes(data[offset:offset + 2], "big")
+    start = offset + 2
+    return data[start:start + length].decode(), start + length
+
+
+class Session:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.subscriptions: dict[str, int] = {}
+        self._packet_ids = itertools.cycle(range(1, 65536))
+
+    def deliver(self, topic: bytes, payload: bytes, qos: int):
+        body = len(topic).to_bytes(2, "big") + topic
+        if qos:
+            body += next(self._packet_ids).to_bytes(2, "big")
+        self.writer.write(_packet((PUBLISH << 4) | (qos << 1), body + payload))
+
+
+class Broker:
+    def __init__(self):
+        self.sessions: set[Session] = set()
+
+    def route(self, topic: str, payload: bytes, qos: int):
+        encoded = topic.encode()
+        for session in self.sessions:
+            granted = None
+            for topic_filter, sub_qos in session.subscriptions.items():
+                if topic_matches(topic_filter, topic):
+                    granted = max(granted or 0, sub_qos)
+            if granted is not None:
+                session.deliver(encoded, payload, min(qos, granted))
+
+    async def _read_packet(self, reader: asyncio.StreamReader) -> tuple[int, int, bytes]:
+        first = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await reader.readexactly(length) if length else b""
+        return first >> 4, first & 0x0F, body
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = Session(writer)
+        try:
+            packet_type, _, body = await self._read_packet(reader)
+            if packet_type != CONNECT:
+                return
+            _, offset = _string(body, 0)
+            if body[offset] != 4:
+                # Sólo MQTT 3.1.1 (las suscripciones compartidas v5 quedan fuera)
+                writer.write(_packet(CONNACK << 4, b"\x00\x01"))
+                return
+            writer.write(_packet(CONNACK << 4, b"\x00\x00"))
+            self.sessions.add(session)
+
+            while True:
+                packet_type, flags, body = await self._read_packet(reader)
+
+                if packet_type == PUBLISH:
+                    qos = (flags >> 1) & 0x03
+                    topic, offset = _string(body, 0)
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                        ack = PUBACK if qos == 1 else PUBREC
+                        writer.write(_packet(ack << 4, packet_id))
+                    self.route(topic, body[offset:], min(qos, 1))
+                    # Contrapresión: el publicador espera si su socket no drena
+                    await writer.drain()
+
+                elif packet_type == PUBREL:
+                    writer.write(_packet(PUBCOMP << 4, body[:2]))
+
+                elif packet_type == SUBSCRIBE:
+                    packet_id, offset, granted = body[:2], 2, bytearray()
+                    while offset < len(body):
+                        topic_filter, offset = _string(body, offset)
+                        qos = min(body[offset], 1)
+                        offset += 1
+                        session.subscriptions[topic_filter] = qos
+                        granted.append(qos)
+                    writer.write(_packet(SUBACK << 4, packet_id + bytes(granted)))
+
+                elif packet_type == UNSUBSCRIBE:
+                    offset = 2
+                    while offset < len(body):
+                        topic_filter, offset = _string(body, offset)
+                        session.subscriptions.pop(topic_filter, None)
+                    writer.write(_packet(UNSUBACK << 4, body[:2]))
+
+                elif packet_type == PINGREQ:
+                    writer.write(_packet(PINGRESP << 4, b""))
+
+                elif packet_type == DISCONNECT:
+                    return
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port)
+        log.info("Broker MQTT escuchando en %s:%s", host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broker MQTT mínimo para benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18830)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(Broker().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,601 @@
+"""
+Benchmarks de punta a punta del backend, sin servicios externos salvo la DB.
+
+Levanta en subprocesos un broker MQTT local (benchmarks.broker) y la app
+(uvicorn app.main:app) contra una base aparte, BENCH_DATABASE_URL (nunca la
+de DATABASE_URL), y mide:
+
+- ingest: mensajes/s sostenidos MQTT -> mqtt_listener -> device_sensor
+- websocket: p50/p99 de latencia ingesta -> /ws/sensor-readings con N clientes
+- queries: latencia de /data-sensors y /controllers a medida que device_sensor
+  crece (10k -> 10M filas por defecto)
+
+La base debe estar vacía (sin dispositivos ni lecturas): se crean las tablas
+si faltan y dispositivos propios que se borran al terminar (--keep los deja;
+--allow-existing-data corre igual sobre una base con datos, p. ej. la de una
+corrida anterior con --keep). El resultado es JSON para comparar corridas:
+
+    cd Backend
+    createdb smartgarden_bench
+    export BENCH_DATABASE_URL=postgresql+asyncpg://.../smartgarden_bench
+    python -m benchmarks.run --out results.json
+    python -m benchmarks.run --scenarios queries --sizes 10000,100000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import aiomqtt
+import httpx
+import websockets
+from dotenv import dotenv_values
+from sqlalchemy import text
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# La app (y este proceso, al importar `app`) toma la base de DATABASE_URL:
+# la reemplazamos por BENCH_DATABASE_URL antes de importar nada de `app`.
+# Los subprocesos heredan el entorno ya cambiado.
+APP_DATABASE_URLS = {
+    url for url in (
+        os.environ.get("DATABASE_URL"),
+        dotenv_values(ROOT / ".env").get("DATABASE_URL"),
+    ) if url
+}
+BENCH_DATABASE_URL = os.environ.get("BENCH_DATABASE_URL", "")
+if BENCH_DATABASE_URL:
+    os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+
+from app.db.database import async_engine  # noqa: E402
+from app.main import create_tables  # noqa: E402
+from app.services.rollup_service import rebuild_rollups  # noqa: E402
+
+SENSOR_TOPIC = "invernadero/sensores"
+SCENARIOS = ("ingest", "websocket", "queries")
+
+# Histogramas de /metrics que se reportan como delta de cada escenario
+METRICS = (
+    "smartgarden_message_parse_seconds",
+    "smartgarden_db_commit_seconds",
+    "smartgarden_rows_per_commit",
+    "smartgarden_broadcast_seconds",
+)
+
+
+def log(message: str):
+    # El JSON va a stdout (o a --out): el progreso va a stderr
+    print(f"[bench] {message}", file=sys.stderr, flush=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def summarize(samples_ms: list[float]) -> dict:
+    if not samples_ms:
+        return {"n": 0}
+
+    ordered = sorted(samples_ms)
+
+    def rank(p: float) -> float:
+        return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)], 3)
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "p50_ms": rank(50),
+        "p90_ms": rank(90),
+        "p99_ms": rank(99),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def parse_metrics(body: str) -> dict[str, float]:
+    values = {}
+    for line in body.splitlines():
+        if line.startswith("#") or "{" in line:
+            continue
+        name, _, value = line.partition(" ")
+        if name.endswith(("_sum", "_count")):
+            values[name] = float(value)
+    return values
+
+
+def metrics_delta(before: dict, after: dict) -> dict:
+    delta = {}
+    for name in METRICS:
+        count = after.get(f"{name}_count", 0) - before.get(f"{name}_count", 0)
+        total = after.get(f"{name}_sum", 0) - before.get(f"{name}_sum", 0)
+        if count:
+            key = name.removeprefix("smartgarden_")
+            delta[key] = {"count": int(count), "mean": round(total / count, 6)}
+    return delta
+
+
+class Stack:
+    """Broker y app en subprocesos, más lo que el harness necesita de ellos."""
+
+    def __init__(self, broker: str | None, verbose: bool):
+        self.verbose = verbose
+        self.processes: list[subprocess.Popen] = []
+        if broker:
+            host, _, port = broker.partition(":")
+            self.broker_host, self.broker_port = host, int(port or 1883)
+            self.external_broker = True
+        else:
+            self.broker_host, self.broker_port = "127.0.0.1", free_port()
+            self.external_broker = False
+        self.app_port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.app_port}"
+
+    def _spawn(self, args: list[str], env: dict | None = None) -> subprocess.Popen:
+        output = None if self.verbose else subprocess.DEVNULL
+        process = subprocess.Popen(
+            [sys.executable, *args], cwd=ROOT, env=env, stdout=output, stderr=output
+        )
+        self.processes.append(process)
+        return process
+
+    async def start(self):
+        if not self.external_broker:
+            self._spawn(["-m", "benchmarks.broker", "--port", str(self.broker_port)])
+            await self._wait_port(self.broker_host, self.broker_port)
+
+        env = {
+            **os.environ,
+            "MQTT_BROKER": self.broker_host,
+            "MQTT_PORT": str(self.broker_port),
+            # Un solo worker y sin logs por mensaje: medimos el camino caliente
+            "MQTT_SHARED_GROUP": "",
+            "MQTT_LIVE_TOPIC": "",
+            "METRICS_DIR": "",
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        }
+        self._spawn(
+            ["-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(self.app_port), "--log-level", "warning", "--no-access-log"],
+            env=env,
+        )
+        await self._wait_ready()
+
+    async def _wait_port(self, host: str, port: int, timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                _, writer = await asyncio.open_connection(host, port)
+                writer.close()
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Nada escucha en {host}:{port}")
+                await asyncio.sleep(0.1)
+
+    async def _wait_ready(self, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient(base_url=self.base_url) as client:
+            while time.monotonic() < deadline:
+                if any(p.poll() is not None for p in self.processes):
+                    break
+                try:
+                    response = await client.get("/system/pipeline/stats")
+                    if response.status_code == 200 and response.json()["mqtt_connected"]:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError("La app no arrancó o no se conectó al broker (probar con --verbose)")
+
+    async def metrics(self) -> dict[str, float]:
+        async with httpx.AsyncClient(base_url=self.base_url) as client:
+            return parse_metrics((await client.get("/metrics")).text)
+
+    def stop(self):
+        # SIGTERM: la app vacía el buffer de ingesta antes de salir
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class Fixture:
+    """Dispositivos de benchmark y acceso directo a la DB."""
+
+    def __init__(self, devices: int):
+        self.device_count = devices
+        self.device_ids: list[int] = []
+        self.sensors: dict[str, int] = {}
+        self.seq = itertools.count(1)
+        # Las filas de relleno van hacia el pasado desde acá: las ventanas
+        # recientes consultadas son las mismas en todos los tamaños
+        self.anchor = datetime.now(timezone.utc).replace(microsecond=0)
+        self.filled_steps = 0
+
+    async def scalar(self, sql: str, **params):
+        async with async_engine.connect() as conn:
+            return (await conn.execute(text(sql), params)).scalar()
+
+    async def setup(self):
+        async with async_engine.begin() as conn:
+            result = await conn.execute(text(
+                "INSERT INTO device(password_device) "
+                "SELECT 'benchmark' FROM generate_series(1, :n) RETURNING device_id"
+            ), {"n": self.device_count})
+            self.device_ids = list(result.scalars())
+            await conn.execute(text(
+                "INSERT INTO device_configuration(device_id, actuador, value) "
+                "SELECT d, c.actuador, c.value FROM unnest(CAST(:ids AS int[])) AS d, "
+                "(VALUES ('bomba', 0), ('servo', 90), ('motor', 0)) AS c(actuador, value)"
+            ), {"ids": self.device_ids})
+            # Base nueva: el catálogo de init.sql, para que haya claves que ingerir
+            await conn.execute(text(
+                "INSERT INTO sensor(model, name) "
+                "SELECT c.model, c.name FROM (VALUES ('DHT22', 'temperatura'), "
+                "('DHT22', 'humedad'), ('LDR', 'luz')) AS c(model, name) "
+                "WHERE NOT EXISTS (SELECT 1 FROM sensor)"
+            ))
+            result = await conn.execute(text("SELECT name, sensor_id FROM sensor ORDER BY sensor_id"))
+            self.sensors = dict(result.all())
+
+    async def cleanup(self):
+        async with async_engine.begin() as conn:
+            for table in ("device_sensor", "device_sensor_rollup_minute",
+                          "device_sensor_rollup_hour", "device_configuration", "device"):
+                await conn.execute(
+                    text(f"DELETE FROM {table} WHERE device_id = ANY(:ids)"),
+                    {"ids": self.device_ids},
+                )
+
+    def payload(self, device_id: int, seq: int) -> str:
+        # seq único: el FrameMerger no lo toma por duplicado y el cliente
+        # WebSocket lo usa para medir la latencia
+        data = {"device_id": device_id, "seq": seq, "ts": datetime.now(timezone.utc).isoformat()}
+        for name in self.sensors:
+            data[name] = round(random.uniform(10, 40), 2)
+        return json.dumps(data)
+
+    async def fill(self, rows: int, interval: float) -> tuple[datetime, datetime]:
+        """Agrega ~`rows` lecturas repartidas entre los dispositivos de benchmark."""
+        series = len(self.device_ids) * len(self.sensors)
+        steps = max(1, math.ceil(rows / series))
+        chunk = max(1, 200_000 // series)
+        first, last = self.filled_steps, self.filled_steps + steps - 1
+
+        for start in range(first, last + 1, chunk):
+            end = min(start + chunk - 1, last)
+            async with async_engine.begin() as conn:
+                await conn.execute(text(
+                    "INSERT INTO device_sensor(device_id, sensor_id, value, event_ts) "
+                    "SELECT d, s, 20 + 10 * sin(g / 500.0) + s, "
+                    "CAST(:anchor AS timestamptz) - g * (CAST(:interval AS float8) * interval '1 second') "
+                    "FROM unnest(CAST(:ids AS int[])) AS d, unnest(CAST(:sensors AS int[])) AS s, "
+                    "generate_series(CAST(:g0 AS int), CAST(:g1 AS int)) AS g"
+                ), {
+                    "anchor": self.anchor,
+                    "interval": interval,
+                    "ids": self.device_ids,
+                    "sensors": list(self.sensors.values()),
+                    "g0": start,
+                    "g1": end,
+                })
+
+        self.filled_steps = last + 1
+        oldest = self.anchor - timedelta(seconds=last * interval)
+        newest = self.anchor - timedelta(seconds=first * interval)
+        return oldest, newest
+
+
+async def publish_paced(client: aiomqtt.Client, fixture: Fixture, messages: int, qos: int,
+                        rate: float, sent: dict | None = None):
+    start = time.perf_counter()
+    for i in range(messages):
+        if rate:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        seq = next(fixture.seq)
+        device_id = fixture.device_ids[i % len(fixture.device_ids)]
+        payload = fixture.payload(device_id, seq)
+        if sent is not None:
+            sent[seq] = time.perf_counter()
+        await client.publish(SENSOR_TOPIC, payload, qos=qos)
+    return time.perf_counter() - start
+
+
+async def bench_ingest(stack: Stack, fixture: Fixture, messages: int, qos: int, rate: float,
+                       timeout: float) -> dict:
+    log(f"ingest: {messages} mensajes (qos={qos}, rate={rate or 'máx'})")
+    last_id = await fixture.scalar("SELECT coalesce(max(device_sensor_id), 0) FROM device_sensor")
+    expected = messages * len(fixture.sensors)
+    before = await stack.metrics()
+
+    async with aiomqtt.Client(stack.broker_host, stack.broker_port) as client:
+        start = time.perf_counter()
+        publish_seconds = await publish_paced(client, fixture, messages, qos, rate)
+
+    # Termina cuando la última fila está commiteada en device_sensor
+    rows = 0
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        rows = await fixture.scalar(
+            "SELECT count(*) FROM device_sensor WHERE device_sensor_id > :last_id AND device_id = ANY(:ids)",
+            last_id=last_id, ids=fixture.device_ids,
+        )
+        if rows >= expected:
+            break
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "messages": messages,
+        "rows_expected": expected,
+        "rows_inserted": rows,
+        "complete": rows >= expected,
+        "publish_seconds": round(publish_seconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "messages_per_second": round(messages * min(1, rows / expected) / elapsed, 1),
+        "rows_per_second": round(rows / elapsed, 1),
+        "server": metrics_delta(before, await stack.metrics()),
+    }
+
+
+async def bench_websocket(stack: Stack, fixture: Fixture, clients: int, messages: int, qos: int,
+                          rate: float, timeout: float) -> dict:
+    log(f"websocket: {clients} clientes, {messages} mensajes a {rate} msg/s")
+    devices = ",".join(str(device_id) for device_id in fixture.device_ids)
+    url = f"ws://127.0.0.1:{stack.app_port}/system/ws/sensor-readings?device_id={devices}"
+
+    sent: dict[int, float] = {}
+    latencies: list[float] = []
+    received = 0
+    expected = messages * clients
+    all_received = asyncio.Event()
+
+    async def reader(ws):
+        nonlocal received
+        async for raw in ws:
+            now = time.perf_counter()
+            seq = json.loads(raw).get("seq")
+            if seq in sent:
+                latencies.append((now - sent[seq]) * 1000)
+                received += 1
+                if received >= expected:
+                    all_received.set()
+
+    before = await stack.metrics()
+    connections = [await websockets.connect(url, max_queue=None) for _ in range(clients)]
+    readers = [asyncio.create_task(reader(ws)) for ws in connections]
+    try:
+        async with aiomqtt.Client(stack.broker_host, stack.broker_port) as client:
+            await publish_paced(client, fixture, messages, qos, rate, sent)
+        try:
+            await asyncio.wait_for(all_received.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        for ws in connections:
+            await ws.close()
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+
+    return {
+        "clients": clients,
+        "messages": messages,
+        "rate": rate,
+        "delivered": received,
+        "expected": expected,
+        # Publicador y clientes comparten proceso con el harness: la latencia
+        # incluye su propio tiempo de event loop
+        "latency": summarize(latencies),
+        "server": metrics_delta(before, await stack.metrics()),
+    }
+
+
+async def time_requests(client: httpx.AsyncClient, method: str, url: str, requests: int,
+                        warmup: int = 5, **kwargs) -> dict:
+    samples = []
+    for i in range(warmup + requests):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            return {"error": f"HTTP {response.status_code}: {response.text[:200]}"}
+        if i >= warmup:
+            samples.append(elapsed)
+    return summarize(samples)
+
+
+async def measure_endpoints(stack: Stack, fixture: Fixture, requests: int) -> dict:
+    device_id = fixture.device_ids[0]
+    sensor_id = next(iter(fixture.sensors.values()))
+    to = fixture.anchor.isoformat()
+
+    def since(**delta) -> str:
+        return (fixture.anchor - timedelta(**delta)).isoformat()
+
+    data = f"/system/data-sensors/{device_id}"
+    endpoints = {
+        "data_sensors_latest": ("GET", data, {"params": {"sensor_id": sensor_id}}),
+        "data_sensors_hour_raw": ("GET", data, {"params": {
+            "sensor_id": sensor_id, "from": since(hours=1), "to": to, "limit": 1000}}),
+        "data_sensors_day_lttb": ("GET", data, {"params": {
+            "sensor_id": sensor_id, "from": since(days=1), "to": to, "points": 500}}),
+        "data_sensors_week_buckets": ("GET", data, {"params": {
+            "sensor_id": sensor_id, "from": since(days=7), "to": to, "bucket": 3600}}),
+        "controllers_config": ("GET", f"/system/controllers/{device_id}/config", {}),
+        "controllers_update": ("PUT", f"/system/controllers/{device_id}/bomba", {"json": {"value": 1}}),
+        "controllers_command": ("POST", f"/system/controllers/{device_id}", {"json": {"target": "bomba"}}),
+    }
+
+    results = {}
+    async with httpx.AsyncClient(base_url=stack.base_url, timeout=60) as client:
+        for name, (method, url, kwargs) in endpoints.items():
+            results[name] = await time_requests(client, method, url, requests, **kwargs)
+    return results
+
+
+async def bench_queries(stack: Stack, fixture: Fixture, sizes: list[int], requests: int,
+                        interval: float) -> list[dict]:
+    results = []
+    for size in sizes:
+        total = await fixture.scalar("SELECT count(*) FROM device_sensor")
+        fill_seconds = 0.0
+        if total < size:
+            log(f"queries: rellenando device_sensor {total} -> {size} filas")
+            start = time.perf_counter()
+            oldest, newest = await fixture.fill(size - total, interval)
+            # Rollups de lo insertado, como los habría dejado la ingesta
+            await rebuild_rollups(oldest, newest + timedelta(seconds=1))
+            async with async_engine.begin() as conn:
+                await conn.execute(text("ANALYZE device_sensor"))
+            fill_seconds = time.perf_counter() - start
+            total = await fixture.scalar("SELECT count(*) FROM device_sensor")
+
+        log(f"queries: midiendo con {total} filas")
+        results.append({
+            "target_rows": size,
+            "table_rows": total,
+            "fill_seconds": round(fill_seconds, 3),
+            "endpoints": await measure_endpoints(stack, fixture, requests),
+        })
+    return results
+
+
+async def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+
+    async with async_engine.connect() as conn:
+        postgres = (await conn.execute(text("SHOW server_version"))).scalar()
+
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "postgres": postgres,
+    }
+
+
+async def has_data() -> bool:
+    async with async_engine.connect() as conn:
+        if (await conn.execute(text("SELECT to_regclass('device')"))).scalar() is None:
+            return False
+        return (await conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM device) OR EXISTS (SELECT 1 FROM device_sensor)"
+        ))).scalar()
+
+
+async def run(args) -> dict:
+    if await has_data() and not args.allow_existing_data:
+        await async_engine.dispose()
+        raise SystemExit(
+            "BENCH_DATABASE_URL apunta a una base con datos: usar una base vacía "
+            "o --allow-existing-data"
+        )
+
+    # Antes de levantar la app: los sensores tienen que existir cuando
+    # cargue su catálogo
+    await create_tables()
+    result = {"meta": await environment(), "args": vars(args)}
+    scenarios = args.scenarios.split(",")
+
+    stack = Stack(args.broker, args.verbose)
+    fixture = Fixture(args.devices)
+    await fixture.setup()
+    try:
+        await stack.start()
+
+        if "ingest" in scenarios:
+            result["ingest"] = await bench_ingest(
+                stack, fixture, args.messages, args.qos, args.rate, args.timeout
+            )
+        if "websocket" in scenarios:
+            result["websocket"] = await bench_websocket(
+                stack, fixture, args.clients, args.ws_messages, args.qos, args.ws_rate, args.timeout
+            )
+        if "queries" in scenarios:
+            sizes = [int(size) for size in args.sizes.split(",")]
+            result["queries"] = await bench_queries(
+                stack, fixture, sizes, args.requests, args.interval
+            )
+    finally:
+        stack.stop()
+        if not args.keep:
+            log("borrando los datos de benchmark")
+            await fixture.cleanup()
+        await async_engine.dispose()
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de punta a punta del backend")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="Escenarios separados por coma: " + ", ".join(SCENARIOS))
+    parser.add_argument("--out", help="Archivo JSON de salida (por defecto stdout)")
+    parser.add_argument("--broker", help="host:port de un broker existente en vez del local")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--qos", type=int, default=1, choices=(0, 1))
+    parser.add_argument("--timeout", type=float, default=120.0,
+                        help="Espera máxima para que termine la ingesta / lleguen los mensajes")
+    # ingest
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=0, help="msg/s del publicador (0 = sin límite)")
+    # websocket
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--ws-messages", type=int, default=2000)
+    parser.add_argument("--ws-rate", type=float, default=200)
+    # queries
+    parser.add_argument("--sizes", default="10000,100000,1000000,10000000",
+                        help="Filas totales de device_sensor en cada medición")
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por endpoint y tamaño")
+    parser.add_argument("--interval", type=float, default=10.0,
+                        help="Segundos entre lecturas de relleno de una misma serie")
+    parser.add_argument("--keep", action="store_true", help="No borrar los datos al terminar")
+    parser.add_argument("--allow-existing-data", action="store_true",
+                        help="Correr aunque la base de benchmark ya tenga dispositivos o lecturas")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar la salida de la app y el broker")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Escenarios desconocidos: {', '.join(sorted(unknown))}")
+
+    if not BENCH_DATABASE_URL:
+        parser.error("Falta BENCH_DATABASE_URL: el benchmark necesita una base propia")
+    if BENCH_DATABASE_URL in APP_DATABASE_URLS:
+        parser.error("BENCH_DATABASE_URL es la misma base que DATABASE_URL")
+
+    result = asyncio.run(run(args))
+    output = json.dumps(result, indent=2, default=str)
+    if args.out:
+        Path(args.out).write_text(output + "\n", encoding="utf-8")
+        log(f"resultados en {args.out}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
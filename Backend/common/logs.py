@@ -0,0 +1,154 @@
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Sólo librería estándar: lo comparten el backend y el gateway, que no
+# carga `app` (ni su configuración ni sus dependencias)
+
+_TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+_listener: QueueListener | None = None
+_handler: "NonBlockingQueueHandler | None" = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro (journald / Loki / jq)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        if record.__dict__.get("sampled"):
+            entry["sampled"] = record.sampled
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """
+    Deja pasar 1 de cada `rate` registros DEBUG por línea de código (las que
+    se repiten por mensaje o por fila). INFO en adelante pasa siempre.
+    """
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._seen: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate == 1:
+            return True
+
+        key = (record.pathname, record.lineno)
+        seen = self._seen.get(key, 0)
+        self._seen[key] = seen + 1
+        if seen % self.rate:
+            return False
+        record.sampled = self.rate
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Entrega el registro al hilo de escritura sin formatearlo ni esperar.
+
+    Con la cola llena se descarta DEBUG/INFO (se cuentan); WARNING en
+    adelante espera lugar para no perder errores.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # El listener está en el mismo proceso: no hace falta copiar ni
+        # formatear acá (eso es justo lo que queremos sacar del event loop)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record)
+            else:
+                self.dropped += 1
+
+
+def _parse_levels(levels: str) -> dict[str, str]:
+    # "app.services.mqtt_service=DEBUG,aiomqtt=WARNING"
+    parsed = {}
+    for item in levels.split(","):
+        if not item.strip():
+            continue
+        name, _, level = item.partition("=")
+        parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def setup_logging(
+    level: str = "INFO",
+    levels: str | dict[str, str] = "",
+    fmt: str = "text",
+    debug_sample_rate: int = 1,
+    queue_size: int = 10000,
+) -> NonBlockingQueueHandler:
+    """
+    Configura el logger raíz: los registros pasan por una cola acotada y un
+    hilo en segundo plano los escribe en stderr.
+
+    - `level`: nivel global; `levels`: niveles por módulo.
+    - `fmt`: "text" o "json".
+    - `debug_sample_rate`: 1 de cada N registros DEBUG por línea de código.
+    """
+    global _listener, _handler
+    shutdown_logging()
+
+    stream = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter(_TEXT_FORMAT))
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    # El muestreo se decide antes de encolar: lo descartado no cuesta nada más
+    handler.addFilter(DebugSampler(debug_sample_rate))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    if isinstance(levels, str):
+        levels = _parse_levels(levels)
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level.upper())
+
+    _listener = QueueListener(handler.queue, stream)
+    _listener.start()
+    _handler = handler
+    return handler
+
+
+def dropped() -> int:
+    """Registros descartados por cola llena desde el arranque."""
+    return _handler.dropped if _handler is not None else 0
+
+
+def shutdown_logging():
+    """Vacía la cola y detiene el hilo de escritura."""
+    global _listener
+    if _listener is not None:
+        # Sin el hilo nadie vaciaría la cola: lo que se registre después va
+        # al handler de último recurso de logging (stderr, WARNING+)
+        logging.getLogger().removeHandler(_handler)
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+
+from gateway.serial_transport import SerialTransport
+
+log = logging.getLogger(__name__)
+
+# Respuestas finales del firmware RAK
+OK = "OK"
+ERRORES = ("AT_ERROR", "AT_PARAM_ERROR", "AT_BUSY_ERROR", "AT_TEST_PARAM_OVERFLOW",
+           "AT_NO_NETWORK_JOINED", "AT_RX_ERROR", "AT_DUTYCYCLE_RESTRICTED", "ERROR")
+# Líneas que imprime el módulo al arrancar: si aparecen fuera de la
+# configuración, la radio se reinició y perdió el modo P2P
+ARRANQUE = ("RAKwireless", "Current Work Mode")
+
+
+class ATError(Exception):
+    def __init__(self, comando: str, respuesta: str):
+        super().__init__(f"{comando} -> {respuesta}")
+        self.comando = comando
+        self.respuesta = respuesta
+
+
+class ATTimeout(ATError):
+    def __init__(self, comando: str, timeout: float):
+        super().__init__(comando, f"sin respuesta en {timeout}s")
+
+
+def es_evento(linea: str) -> bool:
+    # Eventos asíncronos (recepción, fin de TX): nunca son la respuesta a un comando
+    return linea.startswith("+EVT") or "recv=" in linea
+
+
+class ATEngine:
+    """
+    Comandos AT asíncronos sobre un SerialTransport.
+
+    Un comando a la vez: `comando()` escribe y espera su OK/ERROR con timeout.
+    Una tarea despachadora consume todas las líneas del puerto: las que son
+    respuesta del comando en curso se le entregan, el resto (eventos
+    +EVT, tramas) va a `eventos` para el lector de uplinks.
+
+    Si el módulo se reinicia (banner de arranque) se llama `al_reiniciar`
+    para volver a configurarlo.
+    """
+
+    def __init__(self, transporte: SerialTransport, nombre: str = "", timeout: float = 2.0):
+        self.transporte = transporte
+        self.nombre = nombre
+        self.timeout = timeout
+        self.eventos: asyncio.Queue[str] = asyncio.Queue(maxsize=1000)
+        self.al_reiniciar = None
+
+        self._lock = asyncio.Lock()
+        self._respuesta: asyncio.Future | None = None
+        self._lineas: list[str] = []
+        self._despachador: asyncio.Task | None = None
+        self._recuperando: asyncio.Task | None = None
+        self.configurando = False
+
+        self.errores = 0
+        self.timeouts = 0
+        self.reinicios = 0
+
+    def start(self):
+        self._despachador = asyncio.create_task(self._despachar())
+
+    async def close(self):
+        for tarea in (self._despachador, self._recuperando):
+            if tarea is not None:
+                tarea.cancel()
+                try:
+                    await tarea
+                except asyncio.CancelledError:
+                    pass
+
+    async def readline(self) -> str:
+        return await self.eventos.get()
+
+    async def comando(self, comando: str, timeout: float | None = None) -> list[str]:
+        """Envía `comando` y devuelve las líneas intermedias de la respuesta."""
+        timeout = timeout or self.timeout
+        async with self._lock:
+            self._lineas = []
+            self._respuesta = asyncio.get_running_loop().create_future()
+            try:
+                await self.transporte.write(f"{comando}\r\n".encode())
+                final = await asyncio.wait_for(self._respuesta, timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise ATTimeout(comando, timeout) from None
+            finally:
+                self._respuesta = None
+
+            if final != OK:
+                self.errores += 1
+                raise ATError(comando, final)
+            return self._lineas
+
+    async def configurar(self, comandos: list[str], intentos: int = 3):
+        """
+        Aplica la secuencia de comandos; cada uno se reintenta (el módulo puede
+        estar arrancando y no responder todavía).
+        """
+        self.configurando = True
+        try:
+            for comando in comandos:
+                for intento in range(1, intentos + 1):
+                    try:
+                        await self.comando(comando)
+                        break
+                    except ATError as e:
+                        if intento == intentos:
+                            raise
+                        log.warning("[%s] %s, reintentando...", self.nombre, e)
+                        await asyncio.sleep(0.2 * intento)
+        finally:
+            self.configurando = False
+
+    async def _despachar(self):
+        while True:
+            linea = await self.transporte.readline()
+
+            if any(marca in linea for marca in ARRANQUE):
+                self.recuperar(f"reinicio detectado: {linea}")
+                continue
+
+            respuesta = self._respuesta
+            if respuesta is not None and not respuesta.done() and not es_evento(linea):
+                if linea == OK or linea in ERRORES or linea.startswith("AT_"):
+                    respuesta.set_result(linea)
+                else:
+                    self._lineas.append(linea)
+                continue
+
+            if self.eventos.full():
+                self.eventos.get_nowait()
+            self.eventos.put_nowait(linea)
+
+    def recuperar(self, motivo: str):
+        """Reconfigura la radio en segundo plano (si no se está haciendo ya)."""
+        if self.configurando or self.al_reiniciar is None:
+            return
+        if self._recuperando is not None and not self._recuperando.done():
+            return
+
+        self.reinicios += 1
+        log.warning("[%s] %s, reconfigurando...", self.nombre, motivo)
+        self._recuperando = asyncio.create_task(self._recuperar())
+
+    async def _recuperar(self):
+        try:
+            await self.al_reiniciar()
+        except ATError as e:
+            log.error("[%s] No se pudo reconfigurar: %s", self.nombre, e)
@@ -0,0 +1,77 @@
+import struct
+
+# Las tramas de texto empiezan por un carácter imprimible; las binarias por un
+# byte de versión < 0x20, así ambos formatos conviven en la misma red.
+VERSION_MAX = 0x1F
+
+# v1 (little-endian, 11 bytes frente a ~30 del texto):
+#   u8 versión | u16 device_id | u16 seq | i16 temp | u16 hum | u16 luz
+# Punto fijo: temperatura y humedad en centésimas, luz en décimas.
+# El valor centinela indica "sensor sin lectura" y no se publica.
+_V1 = struct.Struct("<BHHhHH")
+CAMPOS_V1 = (
+    # (clave JSON, escala, centinela)
+    ("temperatura", 100, -0x8000),
+    ("humedad", 100, 0xFFFF),
+    ("luz", 10, 0xFFFF),
+)
+VERSION_V1 = 1
+
+
+class CodecError(ValueError):
+    pass
+
+
+def es_binaria(trama: bytes) -> bool:
+    return bool(trama) and trama[0] <= VERSION_MAX
+
+
+def decodificar_binaria(trama: bytes) -> dict:
+    version = trama[0]
+    if version != VERSION_V1:
+        raise CodecError(f"Versión de trama desconocida: {version}")
+    if len(trama) != _V1.size:
+        raise CodecError(f"Largo inválido para v1: {len(trama)} bytes")
+
+    _, device_id, seq, *crudos = _V1.unpack(trama)
+    datos = {"device_id": device_id, "seq": seq}
+    for (clave, escala, centinela), crudo in zip(CAMPOS_V1, crudos):
+        if crudo != centinela:
+            datos[clave] = crudo / escala
+    return datos
+
+
+def codificar_binaria(device_id: int, seq: int, datos: dict) -> bytes:
+    """Referencia del formato para el firmware de los nodos (y pruebas)."""
+    crudos = []
+    for clave, escala, centinela in CAMPOS_V1:
+        valor = datos.get(clave)
+        crudos.append(centinela if valor is None else round(valor * escala))
+    return _V1.pack(VERSION_V1, device_id, seq & 0xFFFF, *crudos)
+
+
+def decodificar_texto(texto: str) -> dict:
+    """
+    Formato antiguo: "temp:25.3,hum:40.0,ldr:512.7".
+    """
+    datos_json = {}
+    for item in texto.split(","):
+        if ":" not in item:
+            continue
+        key, val = item.split(":", 1)
+        key = key.strip().lower()
+        val = val.strip()
+
+        try:
+            val = float(val)
+        except ValueError:
+            pass
+
+        # Asignar claves estandarizadas
+        if "temp" in key:
+            datos_json["temperatura"] = val
+        elif "hum" in key:
+            datos_json["humedad"] = val
+        elif "ldr" in key or "luz" in key:
+            datos_json["luz"] = val
+    return datos_json
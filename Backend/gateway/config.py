@@ -0,0 +1,58 @@
+import json
+import os
+
+# Valores por defecto: un solo RAK en /dev/ttyUSB0, como el gateway original
+DEFAULTS = {
+    "mqtt": {"host": "localhost", "port": 1883},
+    "spool": {"ruta": "gateway_spool.db", "max_bytes": 50 * 1024 * 1024, "retencion": 7 * 86400},
+    "downlink": {"ack_timeout": 3.0, "max_intentos": 5, "duty_cycle": 0.1},
+    # Exportador Prometheus (puerto 0 lo desactiva)
+    "metricas": {"host": "0.0.0.0", "puerto": 9108},
+    # Logs: nivel global, niveles por módulo, "text" o "json", 1 de cada N DEBUG
+    "logs": {"nivel": "INFO", "niveles": {}, "formato": "text", "muestreo_debug": 100},
+    "radios": [
+        {
+            "nombre": "radio0",
+            "puerto": "/dev/ttyUSB0",
+            "baudrate": 115200,
+            "p2p": "923700000:7:125:0:10:14",
+            "precv": 65533,
+            # Sufijo "#id" en los comandos: sólo si el firmware de los nodos lo entiende
+            "ids_comando": False,
+        }
+    ],
+}
+
+RADIO_DEFAULTS = DEFAULTS["radios"][0]
+
+
+def cargar_config(ruta: str | None = None) -> dict:
+    """
+    Lee la configuración JSON del gateway (por defecto `gateway.json`, o la
+    ruta de GATEWAY_CONFIG). Las secciones que falten toman los valores por
+    defecto; cada radio hereda los campos que no defina.
+
+    No escribe nada: el logging se configura con lo que devuelve, así que el
+    llamador informa el origen con `ruta` y `desde_archivo`.
+    """
+    ruta = ruta or os.environ.get("GATEWAY_CONFIG", "gateway.json")
+    archivo = {}
+    desde_archivo = os.path.exists(ruta)
+    if desde_archivo:
+        with open(ruta, encoding="utf-8") as f:
+            archivo = json.load(f)
+
+    config = {"ruta": ruta, "desde_archivo": desde_archivo}
+    for seccion in ("mqtt", "spool", "downlink", "metricas", "logs"):
+        config[seccion] = {**DEFAULTS[seccion], **archivo.get(seccion, {})}
+
+    radios = archivo.get("radios") or DEFAULTS["radios"]
+    config["radios"] = []
+    for i, radio in enumerate(radios):
+        radio = {**RADIO_DEFAULTS, "nombre": f"radio{i}", **radio}
+        config["radios"].append(radio)
+
+    nombres = [r["nombre"] for r in config["radios"]]
+    if len(set(nombres)) != len(nombres):
+        raise ValueError(f"Nombres de radio repetidos: {nombres}")
+    return config
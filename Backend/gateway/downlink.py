@@ -0,0 +1,242 @@
+import asyncio
+import itertools
+import logging
+import math
+import random
+import time
+from typing import Awaitable, Callable
+
+log = logging.getLogger(__name__)
+
+# target MQTT -> letra del comando LoRa
+ACTUADORES = {"bomba": "B", "servo": "S", "motor": "M"}
+LETRAS = {letra: target for target, letra in ACTUADORES.items()}
+
+
+def tiempo_en_aire(largo: int, sf: int = 7, bw_khz: int = 125, cr: int = 1, preambulo: int = 10) -> float:
+    """
+    Time-on-air (s) de un paquete LoRa de `largo` bytes (fórmula de Semtech,
+    header explícito y CRC activo). `cr` es 1..4 para 4/5..4/8.
+    """
+    t_sym = (2 ** sf) / (bw_khz * 1000)
+    de = 1 if t_sym > 0.016 else 0
+    n_payload = 8 + max(
+        math.ceil((8 * largo - 4 * sf + 28 + 16) / (4 * (sf - 2 * de))) * (cr + 4),
+        0,
+    )
+    return (preambulo + 4.25 + n_payload) * t_sym
+
+
+def parametros_p2p(config: str) -> dict:
+    """ "923700000:7:125:0:10:14" (freq:sf:bw:cr:preámbulo:potencia) -> kwargs de tiempo_en_aire."""
+    _, sf, bw, cr, preambulo, _ = (int(parte) for parte in config.split(":"))
+    # En el RAK el code rate va de 0 (4/5) a 3 (4/8)
+    return {"sf": sf, "bw_khz": bw, "cr": cr + 1, "preambulo": preambulo}
+
+
+class Comando:
+    __slots__ = ("id", "clave", "texto", "intentos", "proximo", "enviado")
+
+    def __init__(self, id: int, clave: tuple, texto: str):
+        self.id = id
+        self.clave = clave
+        self.texto = texto
+        self.intentos = 0
+        self.proximo = 0.0          # instante (monotonic) del próximo envío
+        self.enviado: float | None = None
+
+
+class DownlinkScheduler:
+    """
+    Cola de comandos de bajada con confirmación.
+
+    - Un comando pendiente por (device_id, actuador): uno nuevo reemplaza al
+      anterior si todavía no se confirmó (sólo importa el estado final).
+    - Con `con_id` cada comando lleva id ("B:1#12") y el nodo responde
+      "OK:B:1#12" o "IGNORADO:B:1#12". Es opcional por radio: el firmware
+      antiguo no entiende el sufijo. Sin id en la respuesta se empareja por
+      actuador y, si tampoco viene, con el último comando enviado.
+    - Sin respuesta en `ack_timeout` o con IGNORADO se reintenta con backoff
+      exponencial hasta `max_intentos`.
+    - Entre transmisiones se respeta el tiempo en aire y el ciclo de trabajo
+      del canal para no saturar la radio.
+    """
+
+    def __init__(
+        self,
+        enviar: Callable[[str], Awaitable[None]],
+        ack_timeout: float = 3.0,
+        max_intentos: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        duty_cycle: float = 0.1,
+        p2p: dict | None = None,
+        con_id: bool = False,
+    ):
+        self.enviar = enviar
+        self.ack_timeout = ack_timeout
+        self.max_intentos = max_intentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.duty_cycle = duty_cycle
+        self.p2p = p2p or {}
+        self.con_id = con_id
+
+        self._ids = itertools.count(1)
+        self._pendientes: dict[tuple, Comando] = {}
+        self._ultimo: Comando | None = None
+        self._despertar = asyncio.Event()
+        self._libre_en = 0.0        # la radio puede volver a transmitir
+
+        self.enviados = 0
+        self.confirmados = 0
+        self.reintentos = 0
+        self.reemplazados = 0
+        self.descartados = 0
+
+    # --- Entrada ---
+
+    def encolar(self, target: str, valor, device_id=None) -> Comando | None:
+        letra = ACTUADORES.get(target)
+        if letra is None:
+            return None
+
+        clave = (device_id, letra)
+        comando = Comando(next(self._ids), clave, f"{letra}:{valor}")
+        if clave in self._pendientes:
+            self.reemplazados += 1
+            log.info("%s reemplazado por %s", self._pendientes[clave].texto, comando.texto)
+
+        self._pendientes[clave] = comando
+        self._despertar.set()
+        return comando
+
+    def respuesta(self, texto: str) -> bool:
+        """Procesa "OK:..." / "IGNORADO:...". Devuelve True si era una respuesta."""
+        if texto.startswith("OK:"):
+            confirmado = True
+        elif texto.startswith("IGNORADO:"):
+            confirmado = False
+        else:
+            return False
+
+        comando = self._emparejar(texto.split(":", 1)[1].strip())
+        if comando is None:
+            # Respuesta a un comando ya reemplazado o descartado
+            return True
+
+        if confirmado:
+            log.info("Confirmado #%d %s", comando.id, comando.texto)
+            self.confirmados += 1
+            del self._pendientes[comando.clave]
+        else:
+            log.warning("El dispositivo ignoró #%d %s. Reintentando...", comando.id, comando.texto)
+            self._programar_reintento(comando, time.monotonic())
+        self._despertar.set()
+        return True
+
+    def _emparejar(self, cuerpo: str) -> Comando | None:
+        if "#" in cuerpo:
+            try:
+                comando_id = int(cuerpo.rsplit("#", 1)[1])
+            except ValueError:
+                comando_id = None
+            for comando in self._pendientes.values():
+                if comando.id == comando_id:
+                    return comando
+            return None
+
+        letra = cuerpo[:1].upper()
+        if letra in LETRAS:
+            candidatos = [c for c in self._pendientes.values() if c.clave[1] == letra and c.enviado]
+            return max(candidatos, key=lambda c: c.enviado, default=None)
+
+        ultimo = self._ultimo
+        if ultimo is not None and self._pendientes.get(ultimo.clave) is ultimo:
+            return ultimo
+        return None
+
+    # --- Planificación ---
+
+    def _programar_reintento(self, comando: Comando, ahora: float):
+        if comando.intentos >= self.max_intentos:
+            log.error("Descartado #%d %s tras %d intentos", comando.id, comando.texto, comando.intentos)
+            self.descartados += 1
+            del self._pendientes[comando.clave]
+            return
+
+        espera = min(self.backoff_max, self.backoff_base * 2 ** (comando.intentos - 1))
+        comando.proximo = ahora + espera * random.uniform(0.5, 1.0)
+        comando.enviado = None
+
+    def _vencer_acks(self, ahora: float):
+        for comando in list(self._pendientes.values()):
+            if comando.enviado is not None and ahora - comando.enviado >= self.ack_timeout:
+                log.warning("Sin respuesta para #%d %s", comando.id, comando.texto)
+                self._programar_reintento(comando, ahora)
+
+    def _siguiente(self, ahora: float) -> tuple[Comando | None, float]:
+        """Comando listo para enviar, o cuánto esperar hasta el próximo evento."""
+        listo = None
+        espera = math.inf
+        for comando in self._pendientes.values():
+            if comando.enviado is not None:
+                espera = min(espera, comando.enviado + self.ack_timeout - ahora)
+            elif comando.proximo <= ahora:
+                if listo is None or comando.proximo < listo.proximo:
+                    listo = comando
+            else:
+                espera = min(espera, comando.proximo - ahora)
+
+        if listo is not None and self._libre_en > ahora:
+            return None, min(espera, self._libre_en - ahora)
+        return listo, espera
+
+    def _pausa_tras_envio(self, texto: str) -> float:
+        # "B:1#12" viaja en hex dentro de AT+PSEND, pero en el aire va en bytes
+        toa = tiempo_en_aire(len(texto.encode()), **self.p2p)
+        return toa / self.duty_cycle
+
+    async def run(self):
+        log.info("Iniciando planificador de downlink...")
+        while True:
+            ahora = time.monotonic()
+            self._vencer_acks(ahora)
+            comando, espera = self._siguiente(ahora)
+
+            if comando is None:
+                self._despertar.clear()
+                try:
+                    timeout = None if espera == math.inf else max(espera, 0.0)
+                    await asyncio.wait_for(self._despertar.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            comando.intentos += 1
+            if comando.intentos > 1:
+                self.reintentos += 1
+
+            texto = f"{comando.texto}#{comando.id}" if self.con_id else comando.texto
+            try:
+                await self.enviar(texto)
+            except Exception as e:
+                log.error("Error enviando #%d: %s", comando.id, e)
+                self._programar_reintento(comando, time.monotonic())
+                continue
+
+            ahora = time.monotonic()
+            comando.enviado = ahora
+            self._ultimo = comando
+            self._libre_en = ahora + self._pausa_tras_envio(texto)
+            self.enviados += 1
+
+    def stats(self) -> dict:
+        return {
+            "pendientes": len(self._pendientes),
+            "enviados": self.enviados,
+            "confirmados": self.confirmados,
+            "reintentos": self.reintentos,
+            "reemplazados": self.reemplazados,
+            "descartados": self.descartados,
+        }
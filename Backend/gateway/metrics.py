@@ -0,0 +1,94 @@
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _etiquetas(etiquetas: dict) -> str:
+    if not etiquetas:
+        return ""
+    pares = ",".join(
+        f'{clave}="{str(valor).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for clave, valor in etiquetas.items()
+    )
+    return "{" + pares + "}"
+
+
+class Metricas:
+    """
+    Contadores del gateway en formato de texto de Prometheus.
+
+    - `inc()` para lo que se cuenta acá (líneas, tramas).
+    - `fuente()` para contadores que ya llevan otros objetos (reintentos del
+      downlink, fallos del enlace, spool): se leen al momento del scrape.
+    """
+
+    def __init__(self):
+        self._ayuda: dict[str, tuple[str, str]] = {}
+        self._valores: dict[str, dict[tuple, float]] = {}
+        self._fuentes: dict[str, list] = {}
+
+    def registrar(self, nombre: str, ayuda: str, tipo: str = "counter"):
+        self._ayuda[nombre] = (ayuda, tipo)
+        self._valores.setdefault(nombre, {})
+        self._fuentes.setdefault(nombre, [])
+
+    def inc(self, nombre: str, cantidad: float = 1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        serie = self._valores[nombre]
+        serie[clave] = serie.get(clave, 0) + cantidad
+
+    def fuente(self, nombre: str, leer, **etiquetas):
+        self._fuentes[nombre].append((etiquetas, leer))
+
+    def render(self) -> str:
+        lineas = []
+        for nombre, (ayuda, tipo) in self._ayuda.items():
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for clave, valor in self._valores[nombre].items():
+                lineas.append(f"{nombre}{_etiquetas(dict(clave))} {valor}")
+            for etiquetas, leer in self._fuentes[nombre]:
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {leer()}")
+        return "\n".join(lineas) + "\n"
+
+    async def servir(self, host: str, puerto: int):
+        """Exportador HTTP mínimo: cualquier GET devuelve las métricas."""
+
+        async def atender(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                # Sólo necesitamos consumir la cabecera de la petición
+                await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+                cuerpo = self.render().encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    + f"Content-Type: {CONTENT_TYPE}\r\n".encode()
+                    + f"Content-Length: {len(cuerpo)}\r\n".encode()
+                    + b"Connection: close\r\n\r\n"
+                    + cuerpo
+                )
+                await writer.drain()
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        servidor = await asyncio.start_server(atender, host, puerto)
+        log.info("Exportando métricas en http://%s:%s/metrics", host, puerto)
+        async with servidor:
+            await servidor.serve_forever()
+
+
+metricas = Metricas()
+metricas.registrar("gateway_serial_lines_total", "Líneas leídas del puerto serie")
+metricas.registrar("gateway_serial_lines_dropped_total", "Líneas descartadas por cola llena")
+metricas.registrar("gateway_frames_decoded_total", "Tramas de sensores decodificadas")
+metricas.registrar("gateway_frames_invalid_total", "Tramas descartadas por inválidas")
+metricas.registrar("gateway_downlink_retries_total", "Reintentos de comandos downlink")
+metricas.registrar("gateway_downlink_dropped_total", "Comandos downlink abandonados sin confirmación")
+metricas.registrar("gateway_at_resets_total", "Reconfiguraciones de radio tras un reinicio o cuelgue")
+metricas.registrar("gateway_publish_failures_total", "Publicaciones MQTT fallidas")
+metricas.registrar("gateway_spool_replayed_total", "Mensajes reenviados desde el spool")
+metricas.registrar("gateway_spool_pending", "Mensajes esperando en el spool", "gauge")
@@ -0,0 +1,86 @@
+import logging
+
+import serial
+
+from gateway.at_commands import ATEngine, ATTimeout
+from gateway.downlink import DownlinkScheduler, parametros_p2p
+from gateway.serial_transport import SerialTransport
+
+log = logging.getLogger(__name__)
+
+
+class Radio:
+    """Un concentrador RAK: su puerto serie, su transporte y su cola de downlink."""
+
+    def __init__(
+        self,
+        nombre: str,
+        puerto: str,
+        baudrate: int,
+        p2p: str,
+        precv: int,
+        downlink: dict,
+        ids_comando: bool = False,
+    ):
+        self.nombre = nombre
+        self.p2p = p2p
+        self.precv = precv
+        self.puerto = serial.Serial(port=puerto, baudrate=baudrate, timeout=1)
+        self.transporte = SerialTransport(self.puerto)
+        self.at = ATEngine(self.transporte, nombre)
+        self.at.al_reiniciar = self.configurar
+        self.downlink = DownlinkScheduler(
+            self.enviar, p2p=parametros_p2p(p2p), con_id=ids_comando, **downlink
+        )
+
+    async def configurar(self):
+        # Configuración del módulo RAK: cada paso termina cuando responde OK
+        await self.at.configurar([
+            "AT",
+            "AT+NWM=0",
+            f"AT+P2P={self.p2p}",
+            f"AT+PRECV={self.precv}",
+        ])
+        log.info("[%s] Puerto serie configurado (%s, %s).", self.nombre, self.puerto.port, self.p2p)
+
+    def start(self):
+        self.transporte.start()
+        self.at.start()
+
+    async def close(self):
+        await self.at.close()
+        await self.transporte.close()
+
+    async def readline(self) -> str:
+        return await self.at.readline()
+
+    async def enviar(self, comando_lora: str):
+        cmd_at = f"AT+PSEND={comando_lora.encode('utf-8').hex()}"
+        log.debug("[%s] TX %s -> %s", self.nombre, comando_lora, cmd_at)
+        try:
+            await self.at.comando(cmd_at)
+        except ATTimeout:
+            # Un PSEND sin respuesta suele ser una radio reiniciada o colgada
+            self.at.recuperar("PSEND sin respuesta")
+            raise
+
+
+class Enrutador:
+    """
+    Elige la radio para cada comando: la que escuchó por última vez al
+    dispositivo. Los nodos con firmware de texto no mandan device_id y se
+    registran bajo None; si no hay pista se usa la primera radio.
+    """
+
+    def __init__(self, radios: list[Radio]):
+        self.radios = radios
+        self._ultima: dict[object, Radio] = {}
+
+    def escuchado(self, device_id, radio: Radio):
+        self._ultima[device_id] = radio
+
+    def radio_para(self, device_id) -> Radio:
+        radio = self._ultima.get(device_id)
+        if radio is None:
+            radio = self._ultima.get(None, self.radios[0])
+        return radio
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import threading
+
+import serial
+
+log = logging.getLogger(__name__)
+
+
+class SerialTransport:
+    """
+    Puerto serie asíncrono para el módulo RAK.
+
+    - Un hilo lector bloquea en `read()` y despierta en cuanto llegan bytes
+      (sin polling). Corta líneas de forma incremental y las entrega a una
+      cola asyncio con `call_soon_threadsafe`.
+    - Un único escritor (tarea asyncio) serializa todas las escrituras y las
+      ejecuta fuera del event loop.
+    """
+
+    def __init__(self, puerto: serial.Serial, max_lineas: int = 1000):
+        self.puerto = puerto
+        self.lineas: asyncio.Queue[str] = asyncio.Queue(maxsize=max_lineas)
+        self._escrituras: asyncio.Queue = asyncio.Queue()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._hilo: threading.Thread | None = None
+        self._escritor: asyncio.Task | None = None
+        self._activo = False
+        self.leidas = 0
+        self.descartadas = 0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._activo = True
+        self._hilo = threading.Thread(target=self._leer, name="serial-reader", daemon=True)
+        self._hilo.start()
+        self._escritor = asyncio.create_task(self._escribir())
+
+    async def close(self):
+        self._activo = False
+        if self._escritor is not None:
+            self._escritor.cancel()
+            try:
+                await self._escritor
+            except asyncio.CancelledError:
+                pass
+        self.puerto.close()
+        if self._hilo is not None:
+            await asyncio.to_thread(self._hilo.join, 2)
+
+    # --- Lectura ---
+
+    def _leer(self):
+        pendiente = bytearray()
+        while self._activo:
+            try:
+                # Bloquea hasta que haya al menos 1 byte (o timeout del puerto)
+                datos = self.puerto.read(max(1, self.puerto.in_waiting))
+            except (serial.SerialException, OSError, TypeError) as e:
+                if self._activo:
+                    log.error("Error de lectura en %s: %s", self.puerto.port, e)
+                break
+
+            if not datos:
+                continue
+
+            pendiente += datos
+            while True:
+                fin = pendiente.find(b"\n")
+                if fin < 0:
+                    break
+                linea = pendiente[:fin].decode("utf-8", errors="ignore").strip()
+                del pendiente[:fin + 1]
+                if linea:
+                    self._loop.call_soon_threadsafe(self._entregar, linea)
+
+    def _entregar(self, linea: str):
+        self.leidas += 1
+        if self.lineas.full():
+            # Ráfaga que no alcanzamos a procesar: se pierde la más antigua
+            self.lineas.get_nowait()
+            self.descartadas += 1
+        self.lineas.put_nowait(linea)
+
+    async def readline(self) -> str:
+        return await self.lineas.get()
+
+    # --- Escritura ---
+
+    async def write(self, datos: bytes):
+        """Encola una escritura y espera a que el escritor la complete."""
+        hecho = self._loop.create_future()
+        await self._escrituras.put((datos, hecho))
+        await hecho
+
+    async def _escribir(self):
+        while True:
+            datos, hecho = await self._escrituras.get()
+            try:
+                await asyncio.to_thread(self.puerto.write, datos)
+                if not hecho.done():
+                    hecho.set_result(None)
+            except Exception as e:
+                if not hecho.done():
+                    hecho.set_exception(e)
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import sqlite3
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Spool:
+    """
+    Cola persistente (SQLite, sólo append) de mensajes MQTT no publicados.
+
+    El orden lo da el rowid. Se limita por tamaño de los mensajes guardados
+    (`max_bytes`, se descartan los más antiguos) y por antigüedad
+    (`retencion` segundos).
+    """
+
+    def __init__(self, ruta: str, max_bytes: int = 50 * 1024 * 1024, retencion: float = 7 * 86400):
+        self.max_bytes = max_bytes
+        self.retencion = retencion
+        self.descartados = 0
+        self._agregados = 0
+
+        self.db = sqlite3.connect(ruta, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " creado REAL NOT NULL,"
+            " topico TEXT NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        self.pendientes, self.bytes = self.db.execute(
+            "SELECT count(*), coalesce(sum(length(topico) + length(payload)), 0) FROM spool"
+        ).fetchone()
+        self.podar()
+
+    def __len__(self):
+        return self.pendientes
+
+    def agregar(self, topico: str, payload: str):
+        self.db.execute(
+            "INSERT INTO spool (creado, topico, payload) VALUES (?, ?, ?)",
+            (time.time(), topico, payload),
+        )
+        self.pendientes += 1
+        self.bytes += len(topico) + len(payload)
+        self._agregados += 1
+        # Revisar límites cada tanto, no en cada inserción
+        if self._agregados % 100 == 0:
+            self.podar()
+
+    def lote(self, n: int) -> list[tuple[int, str, str]]:
+        return self.db.execute(
+            "SELECT id, topico, payload FROM spool ORDER BY id LIMIT ?", (n,)
+        ).fetchall()
+
+    def _borrar_hasta(self, hasta_id: int) -> int:
+        filas, tamano = self.db.execute(
+            "SELECT count(*), coalesce(sum(length(topico) + length(payload)), 0)"
+            " FROM spool WHERE id <= ?",
+            (hasta_id,),
+        ).fetchone()
+        self.db.execute("DELETE FROM spool WHERE id <= ?", (hasta_id,))
+        self.pendientes -= filas
+        self.bytes -= tamano
+        return filas
+
+    def confirmar(self, hasta_id: int):
+        self._borrar_hasta(hasta_id)
+
+    def podar(self):
+        borrados = 0
+        vencido = self.db.execute(
+            "SELECT max(id) FROM spool WHERE creado < ?", (time.time() - self.retencion,)
+        ).fetchone()[0]
+        if vencido is not None:
+            borrados += self._borrar_hasta(vencido)
+
+        # Las páginas liberadas se reutilizan: el archivo deja de crecer
+        while self.pendientes and self.bytes > self.max_bytes:
+            # De a un 10% de lo pendiente, empezando por lo más antiguo
+            hasta_id = self.db.execute(
+                "SELECT max(id) FROM (SELECT id FROM spool ORDER BY id LIMIT ?)",
+                (max(1, self.pendientes // 10),),
+            ).fetchone()[0]
+            borrados += self._borrar_hasta(hasta_id)
+
+        if borrados:
+            log.warning("Descartados %d mensajes por retención/espacio", borrados)
+            self.descartados += borrados
+
+    def close(self):
+        self.db.close()
+
+
+class EnlaceMQTT:
+    """
+    Publicación con store-and-forward.
+
+    Mientras haya conexión y el spool esté vacío se publica directo; si no,
+    el mensaje va al spool. `tarea_reenviar` lo vacía en lotes al reconectar,
+    así el orden de llegada se conserva.
+
+    Un publish fallido no suelta el cliente: de eso se encarga el bucle de
+    conexión cuando aiomqtt detecta la caída. El reenvío se reintenta con
+    backoff exponencial, o en cuanto llega un cliente nuevo.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        tamano_lote: int = 200,
+        qos: int = 1,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+    ):
+        self.spool = spool
+        self.tamano_lote = tamano_lote
+        # QoS 1: publish() espera el PUBACK, así sólo se borra lo entregado
+        self.qos = qos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cliente = None
+        self._hay_trabajo = asyncio.Event()
+        self._reconectado = asyncio.Event()
+        self.reenviados = 0
+        self.fallos = 0
+
+    def conectar(self, cliente):
+        self.cliente = cliente
+        self._hay_trabajo.set()
+        self._reconectado.set()
+
+    def desconectar(self):
+        self.cliente = None
+
+    async def publicar(self, topico: str, payload: str) -> bool:
+        """True si se publicó directo, False si quedó en el spool."""
+        cliente = self.cliente
+        if cliente is not None and not len(self.spool):
+            try:
+                await cliente.publish(topico, payload, qos=self.qos)
+                return True
+            except Exception as e:
+                log.warning("Error publicando en MQTT: %s", e)
+                self.fallos += 1
+
+        self.spool.agregar(topico, payload)
+        self._hay_trabajo.set()
+        return False
+
+    async def tarea_reenviar(self):
+        log.info("Iniciando reenvío del spool...")
+        espera = self.backoff_base
+        while True:
+            await self._hay_trabajo.wait()
+            cliente = self.cliente
+            if cliente is None or not len(self.spool):
+                self._hay_trabajo.clear()
+                continue
+
+            lote = self.spool.lote(self.tamano_lote)
+            ultimo_id = None
+            fallo = False
+            try:
+                for mensaje_id, topico, payload in lote:
+                    await cliente.publish(topico, payload, qos=self.qos)
+                    ultimo_id = mensaje_id
+            except Exception as e:
+                log.warning("Reenvío interrumpido: %s. Reintentando en %.0fs...", e, espera)
+                self.fallos += 1
+                fallo = True
+            finally:
+                if ultimo_id is not None:
+                    self.spool.confirmar(ultimo_id)
+                    self.reenviados += sum(1 for m in lote if m[0] <= ultimo_id)
+
+            if ultimo_id is not None:
+                log.info("Reenviados hasta #%d, quedan %d", ultimo_id, len(self.spool))
+
+            if not fallo:
+                espera = self.backoff_base
+                continue
+
+            # Si la conexión se cayó de verdad, el bucle de conexión trae un
+            # cliente nuevo y no hace falta esperar todo el backoff
+            self._reconectado.clear()
+            try:
+                await asyncio.wait_for(self._reconectado.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+            espera = min(espera * 2, self.backoff_max)
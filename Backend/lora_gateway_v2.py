@@ -1,9 +1,21 @@
-import serial
 import json
-import time
 import asyncio
+import logging
 import aiomqtt
 import binascii 
+from datetime import datetime, timezone
+
+from common.logs import setup_logging, shutdown_logging
+from gateway.codec import CodecError, es_binaria, decodificar_binaria, decodificar_texto
+from gateway.config import cargar_config
+from gateway.metrics import metricas
+from gateway.radio import Enrutador, Radio
+from gateway.spool import EnlaceMQTT, Spool
+
+TOPICO_SENSORES = "invernadero/sensores"
+TOPICO_CONTROL = "invernadero/control"
+
+log = logging.getLogger("gateway")
 
 # --- FUNCIONES DE AYUDA ---
 
@@ -11,32 +23,39 @@ def hex_to_ascii(hex_str):
     try:
         return bytes.fromhex(hex_str).decode('utf-8', errors='ignore')
     except Exception as e:
-        print(f"[!] Error al decodificar Hex a ASCII: {e}")
+        log.warning("Error al decodificar Hex a ASCII: %s", e)
         return ""
 
-def ascii_to_hex(text):
-    return text.encode('utf-8').hex()
+async def publicar_sensores(enlace, datos_json):
+    # Una trama LoRa = un solo mensaje MQTT con todas las lecturas
+    if not datos_json:
+        return
+
+    # Hora de recepción: si el mensaje pasa por el spool, el backend la usa
+    datos_json["ts"] = datetime.now(timezone.utc).isoformat()
+    payload_final = json.dumps(datos_json)
+    if await enlace.publicar(TOPICO_SENSORES, payload_final):
+        log.debug("MQTT %s: %s", TOPICO_SENSORES, payload_final)
+    else:
+        log.debug("Sin conexión, guardado en el spool (%d pendientes)", len(enlace.spool))
 
 # --- TAREAS ---
 
-async def tarea_leer_lora(puerto, mqtt_client, serial_lock, estado_global):
+async def tarea_leer_lora(radio, enlace, enrutador):
     """
-    Lee LoRa. Si recibe 'IGNORADO', reenvía.
-    Si recibe datos de sensores (temp, hum, ldr juntos), los separa y publica.
+    Lee LoRa de una radio. Las respuestas OK/IGNORADO van a su planificador
+    de downlink. Si recibe datos de sensores, los publica y recuerda que esta
+    radio escuchó al dispositivo.
     """
-    print(" [Tarea] Iniciando lectura LoRa...")
+    log.info("Iniciando lectura LoRa en %s...", radio.nombre)
     while True:
         try:
-            linea = None
+            # 1. Esperar la siguiente línea (el hilo lector despierta al llegar datos)
+            linea = await radio.readline()
 
-            # 1. Leer del puerto Serial (Bloqueo mínimo)
-            async with serial_lock:
-                if puerto.in_waiting > 0:
-                    linea = puerto.readline().decode('utf-8', errors='ignore').strip()
-
-            # 2. Procesar datos fuera del lock
+            # 2. Procesar la línea
             if linea:
-                # print(f"[RAW] {linea}") # Debug
+                log.debug("[%s] RAW %s", radio.nombre, linea)
                 data_hex = ""
 
                 # Extraer la parte Hexadecimal del mensaje RAK
@@ -52,157 +71,165 @@ async def tarea_leer_lora(puerto, mqtt_client, serial_lock, estado_global):
 
                 # Si obtuvimos datos válidos
                 if data_hex:
+                    try:
+                        trama = bytes.fromhex(data_hex)
+                    except ValueError:
+                        metricas.inc("gateway_frames_invalid_total", radio=radio.nombre, motivo="hex")
+                        log.warning("[%s] Trama con hex inválido: %s", radio.nombre, data_hex)
+                        continue
+
+                    # -------------------------------------------------
+                    # CASO A: TRAMA BINARIA (firmware nuevo)
+                    # -------------------------------------------------
+                    if es_binaria(trama):
+                        try:
+                            datos_json = decodificar_binaria(trama)
+                        except CodecError as e:
+                            metricas.inc("gateway_frames_invalid_total", radio=radio.nombre, motivo="binaria")
+                            log.warning("[%s] Trama binaria descartada: %s", radio.nombre, e)
+                            continue
+
+                        metricas.inc("gateway_frames_decoded_total", radio=radio.nombre, formato="binaria")
+
+                        log.debug("[%s] Trama binaria: %s", radio.nombre, datos_json)
+                        enrutador.escuchado(datos_json["device_id"], radio)
+                        await publicar_sensores(enlace, datos_json)
+                        continue
+
                     ascii_data = hex_to_ascii(data_hex)
-                    print(f" >> MENSAJE RECIBIDO: {ascii_data}")
+                    log.debug("[%s] Mensaje recibido: %s", radio.nombre, ascii_data)
 
                     # -------------------------------------------------
-                    # CASO A: MANEJO DE ERRORES (IGNORADO)
+                    # CASO B: RESPUESTA A UN COMANDO (OK / IGNORADO)
                     # -------------------------------------------------
-                    if ascii_data.startswith("IGNORADO:"):
-                        print(f" [ALERTA] El dispositivo ignoró el comando. Reintentando...")
-                        
-                        ultimo_hex = estado_global.get("ultimo_comando_hex")
-                        
-                        if ultimo_hex:
-                            cmd_retry = f"AT+PSEND={ultimo_hex}\r\n"
-                            print(f" [RE-SEND] Reenviando: {estado_global.get('ultima_accion_desc')}")
-                            
-                            async with serial_lock:
-                                puerto.write(cmd_retry.encode())
-                                await asyncio.sleep(0.5) 
-                        else:
-                            print(" [ERROR] Se pidió reenviar, pero no hay comando en memoria.")
+                    if radio.downlink.respuesta(ascii_data):
+                        continue
 
                     # -------------------------------------------------
-                    # CASO B: DATOS DE SENSORES (Formato Nuevo)
+                    # CASO C: DATOS DE SENSORES EN TEXTO (firmware antiguo)
                     # Formato esperado: "temp:25.3,hum:40.0,ldr:512.7"
                     # -------------------------------------------------
-                    elif "," in ascii_data and ":" in ascii_data:
-                        # Separamos por comas primero: ["temp:25.3", "hum:40.0", "ldr:512.7"]
-                        datos_json = {}
-                        items = ascii_data.split(",")
-
-                        for item in items:
-                            if ":" in item:
-                                key, val = item.split(":")
-                                key = key.strip().lower()
-                                val = val.strip()
-
-                                try:
-                                    val = float(val)
-                                except ValueError:
-                                    pass
-
-                                # Asignar claves estandarizadas
-                                if "temp" in key:
-                                    datos_json["temperatura"] = val
-                                elif "hum" in key:
-                                    datos_json["humedad"] = val
-                                elif "ldr" in key or "luz" in key:
-                                    datos_json["luz"] = val
-
-                                if datos_json:
-                                    payload_final = json.dumps(datos_json)
-                                    TOPICO_SENSORES = "invernadero/sensores"
-
-                                    try:
-                                        await mqtt_client.publish(TOPICO_SENSORES, payload_final)
-                                        print(f"    -> [MQTT JSON] {TOPICO_SENSORES}: {payload_final}")
-                                    except Exception as e:
-                                        print(f"    -> [MQTT Error] {e}")
-
-
-            # Ceder control al loop
-            await asyncio.sleep(0.1) 
+                    if "," in ascii_data and ":" in ascii_data:
+                        datos_json = decodificar_texto(ascii_data)
+                        metricas.inc("gateway_frames_decoded_total", radio=radio.nombre, formato="texto")
+                        enrutador.escuchado(None, radio)
+                        await publicar_sensores(enlace, datos_json)
 
         except Exception as e:
-            print(f"Error en lectura LoRa: {e}")
+            log.exception("Error en lectura LoRa (%s): %s", radio.nombre, e)
             await asyncio.sleep(1)
 
-async def tarea_escuchar_mqtt(puerto, mqtt_client, serial_lock, topico_control, estado_global):
+async def tarea_escuchar_mqtt(mqtt_client, topico_control, enrutador):
     """
-    Escucha MQTT, envía a LoRa y GUARDA el comando en 'estado_global'.
+    Escucha MQTT y encola el comando en la radio que escuchó por última vez
+    al dispositivo.
     """
-    print(f" [Tarea] Suscribiéndose a {topico_control}...")
+    log.info("Suscribiéndose a %s...", topico_control)
     await mqtt_client.subscribe(topico_control)
 
     async for message in mqtt_client.messages:
         try:
             payload_str = message.payload.decode()
-            print(f" [MQTT CMD] Recibido: {payload_str}")
+            log.info("Comando recibido: %s", payload_str)
 
             data = json.loads(payload_str)
-            comando_lora = ""
 
             target = data.get("target", "").lower()
             valor = data.get("value", 0)
 
-            if target == "bomba":
-                comando_lora = f"B:{valor}"
-            elif target == "servo":
-                comando_lora = f"S:{valor}"
-            elif target == "motor":
-                comando_lora = f"M:{valor}"
-            
-            if comando_lora:
-                payload_hex = ascii_to_hex(comando_lora)
-                
-                # Guardamos estado para reintentos
-                estado_global["ultimo_comando_hex"] = payload_hex
-                estado_global["ultima_accion_desc"] = comando_lora
-
-                cmd_at = f"AT+PSEND={payload_hex}\r\n"
-
-                async with serial_lock:
-                    print(f" [LoRa TX] Enviando: {comando_lora} -> {cmd_at.strip()}")
-                    puerto.write(cmd_at.encode())
-            else:
-                print(" [Error] JSON desconocido o sin target válido")
+            device_id = data.get("device_id")
+            radio = enrutador.radio_para(device_id)
+
+            # Reintentos, confirmación y ritmo de envío los maneja el planificador
+            comando = radio.downlink.encolar(target, valor, device_id=device_id)
+            if comando is None:
+                log.error("JSON desconocido o sin target válido: %s", payload_str)
 
         except json.JSONDecodeError:
-            print(" [Error] El mensaje MQTT no es un JSON válido")
+            log.error("El mensaje MQTT no es un JSON válido")
         except Exception as e:
-            print(f" [Error Procesando MQTT] {e}")
+            log.exception("Error procesando MQTT: %s", e)
 
 # --- MAIN ---
 
 async def main():
-    # 1. Configuración Serial
-    puerto = serial.Serial(
-        port='/dev/ttyUSB0',
-        baudrate=115200,
-        timeout=1
+    config = cargar_config()
+    # Las líneas por trama van a un hilo aparte: la lectura serie no espera a stdout
+    setup_logging(
+        level=config["logs"]["nivel"],
+        levels=config["logs"]["niveles"],
+        fmt=config["logs"]["formato"],
+        debug_sample_rate=config["logs"]["muestreo_debug"],
     )
-
-    # Configuración inicial del módulo RAK
-    time.sleep(2)
-    puerto.write(b'AT+NWM=0\r\n')
-    time.sleep(2)
-    puerto.write(b'AT+P2P=923700000:7:125:0:10:14\r\n')
-    time.sleep(1)
-    puerto.write(b'at+PRECV=65533\r\n')
-    time.sleep(1)
-    puerto.reset_input_buffer()
-    print(" Puerto serie configurado.")
+    if config["desde_archivo"]:
+        log.info("Configuración cargada de %s", config["ruta"])
+    else:
+        log.info("No existe %s, usando valores por defecto", config["ruta"])
+
+    # 1. Radios (un puerto serie por concentrador)
+    radios = [
+        Radio(downlink=config["downlink"], **radio_config)
+        for radio_config in config["radios"]
+    ]
+
+    # Cada radio lee en su hilo y serializa sus escrituras: no hace falta lock.
+    # La configuración termina en cuanto los módulos responden OK.
+    for radio in radios:
+        radio.start()
+    await asyncio.gather(*(radio.configurar() for radio in radios))
 
     # 2. Objetos compartidos
-    serial_lock = asyncio.Lock()
-    estado_global = {
-        "ultimo_comando_hex": None,
-        "ultima_accion_desc": ""
-    }
-
-    # 3. Conexión MQTT
-    async with aiomqtt.Client("localhost", port=1883) as mqtt_client:
-        print(" Conectado al Broker MQTT.")
-        TOPICO_CONTROL = "invernadero/control" 
-
-        await asyncio.gather(
-            tarea_leer_lora(puerto, mqtt_client, serial_lock, estado_global),
-            tarea_escuchar_mqtt(puerto, mqtt_client, serial_lock, TOPICO_CONTROL, estado_global)
-        )
-
-    puerto.close()
+
+    enrutador = Enrutador(radios)
+    enlace = EnlaceMQTT(Spool(**config["spool"]))
+
+    # Las radios siguen leyendo aunque se caiga el broker: lo que no se puede
+    # publicar queda en el spool
+    tareas = [asyncio.create_task(enlace.tarea_reenviar())]
+
+    # 3. Métricas: los contadores de cada componente se leen al hacer scrape
+    metricas.fuente("gateway_publish_failures_total", lambda: enlace.fallos)
+    metricas.fuente("gateway_spool_replayed_total", lambda: enlace.reenviados)
+    metricas.fuente("gateway_spool_pending", lambda: len(enlace.spool))
+    for radio in radios:
+        metricas.fuente("gateway_serial_lines_total", lambda r=radio: r.transporte.leidas, radio=radio.nombre)
+        metricas.fuente("gateway_serial_lines_dropped_total", lambda r=radio: r.transporte.descartadas, radio=radio.nombre)
+        metricas.fuente("gateway_downlink_retries_total", lambda r=radio: r.downlink.reintentos, radio=radio.nombre)
+        metricas.fuente("gateway_downlink_dropped_total", lambda r=radio: r.downlink.descartados, radio=radio.nombre)
+        metricas.fuente("gateway_at_resets_total", lambda r=radio: r.at.reinicios, radio=radio.nombre)
+    if config["metricas"]["puerto"]:
+        tareas.append(asyncio.create_task(
+            metricas.servir(config["metricas"]["host"], config["metricas"]["puerto"])
+        ))
+    for radio in radios:
+        tareas.append(asyncio.create_task(tarea_leer_lora(radio, enlace, enrutador)))
+        tareas.append(asyncio.create_task(radio.downlink.run()))
+
+    # 4. Conexión MQTT compartida (con reconexión)
+    espera = 1
+    try:
+        while True:
+            try:
+                async with aiomqtt.Client(config["mqtt"]["host"], port=config["mqtt"]["port"]) as mqtt_client:
+                    log.info("Conectado al Broker MQTT.")
+                    espera = 1
+                    enlace.conectar(mqtt_client)
+                    await tarea_escuchar_mqtt(mqtt_client, TOPICO_CONTROL, enrutador)
+            except aiomqtt.MqttError as e:
+                log.warning("Conexión MQTT perdida: %s. Reintentando en %ss...", e, espera)
+            finally:
+                enlace.desconectar()
+
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 30)
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        for radio in radios:
+            await radio.close()
+        enlace.spool.close()
+        shutdown_logging()
 
 if __name__ == "__main__":
     try:
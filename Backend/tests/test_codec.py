@@ -0,0 +1,69 @@
+import pytest
+
+from gateway.codec import (
+    CodecError,
+    codificar_binaria,
+    decodificar_binaria,
+    decodificar_texto,
+    es_binaria,
+)
+
+
+def test_ida_y_vuelta():
+    trama = codificar_binaria(7, 42, {"temperatura": -3.25, "humedad": 61.5, "luz": 512.7})
+
+    assert len(trama) == 11
+    assert es_binaria(trama)
+    assert decodificar_binaria(trama) == {
+        "device_id": 7,
+        "seq": 42,
+        "temperatura": -3.25,
+        "humedad": 61.5,
+        "luz": 512.7,
+    }
+
+
+def test_seq_da_la_vuelta_en_16_bits():
+    assert decodificar_binaria(codificar_binaria(1, 0x10001, {}))["seq"] == 1
+
+
+def test_centinela_omite_sensores_sin_lectura():
+    datos = decodificar_binaria(codificar_binaria(3, 1, {"humedad": 40.0}))
+
+    assert datos == {"device_id": 3, "seq": 1, "humedad": 40.0}
+
+
+def test_cero_no_es_centinela():
+    datos = decodificar_binaria(codificar_binaria(3, 1, {"temperatura": 0.0, "luz": 0.0}))
+
+    assert datos["temperatura"] == 0.0
+    assert datos["luz"] == 0.0
+
+
+def test_version_desconocida():
+    trama = bytes([2]) + codificar_binaria(1, 1, {})[1:]
+
+    with pytest.raises(CodecError):
+        decodificar_binaria(trama)
+
+
+def test_largo_invalido():
+    with pytest.raises(CodecError):
+        decodificar_binaria(codificar_binaria(1, 1, {})[:-1])
+
+
+def test_texto_no_es_binaria():
+    assert not es_binaria(b"temp:25.3,hum:40.0")
+    assert not es_binaria(b"")
+
+
+def test_texto_antiguo():
+    assert decodificar_texto("temp:25.3, hum:40.0,ldr:512.7") == {
+        "temperatura": 25.3,
+        "humedad": 40.0,
+        "luz": 512.7,
+    }
+
+
+def test_texto_ignora_items_malformados():
+    assert decodificar_texto("temp:abc,basura,luz:10") == {"temperatura": "abc", "luz": 10.0}
@@ -0,0 +1,70 @@
+import struct
+
+import pytest
+
+from app.services.columnar import MAGIC, VERSION, encode, series_from_rows
+
+
+def decode(data: bytes):
+    magic, version, dtype_id, _, n_series = struct.unpack_from("<4sBBHI", data)
+    offset = struct.calcsize("<4sBBHI")
+    typecode = {1: "f", 2: "d"}[dtype_id]
+    series = []
+
+    for _ in range(n_series):
+        sensor_id, n_points, n_columns = struct.unpack_from("<IIB", data, offset)
+        offset += struct.calcsize("<IIB")
+        names = []
+        for _ in range(n_columns):
+            length = data[offset]
+            names.append(data[offset + 1:offset + 1 + length].decode("ascii"))
+            offset += 1 + length
+
+        timestamps = list(struct.unpack_from(f"<{n_points}q", data, offset))
+        offset += 8 * n_points
+        columns = {}
+        for name in names:
+            columns[name] = list(struct.unpack_from(f"<{n_points}{typecode}", data, offset))
+            offset += struct.calcsize(typecode) * n_points
+        series.append((sensor_id, timestamps, columns))
+
+    assert offset == len(data)
+    return magic, version, dtype_id, series
+
+
+def test_round_trip_float64():
+    rows = [
+        (1, 1_700_000_000_000_000, 20.5, 40.0),
+        (1, 1_700_000_001_000_000, 21.0, 41.0),
+        (2, 1_700_000_000_500_000, 300.0, 0.0),
+    ]
+
+    data = encode(series_from_rows(rows, ["value", "other"]))
+
+    magic, version, dtype_id, series = decode(data)
+    assert (magic, version, dtype_id) == (MAGIC, VERSION, 2)
+    assert series == [
+        (1, [1_700_000_000_000_000, 1_700_000_001_000_000], {"value": [20.5, 21.0], "other": [40.0, 41.0]}),
+        (2, [1_700_000_000_500_000], {"value": [300.0], "other": [0.0]}),
+    ]
+
+
+def test_float32_halves_value_columns():
+    rows = [(1, i, 0.5, 1.5) for i in range(100)]
+
+    data64 = encode(series_from_rows(rows, ["min", "max"], "float64"), "float64")
+    data32 = encode(series_from_rows(rows, ["min", "max"], "float32"), "float32")
+
+    assert len(data64) - len(data32) == 2 * 4 * 100
+    _, _, dtype_id, series = decode(data32)
+    assert dtype_id == 1
+    assert series[0][2]["max"] == [1.5] * 100
+
+
+def test_empty():
+    assert decode(encode([])) == (MAGIC, VERSION, 2, [])
+
+
+def test_unknown_dtype():
+    with pytest.raises(KeyError):
+        series_from_rows([], ["value"], "int8")
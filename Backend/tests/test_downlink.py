@@ -0,0 +1,144 @@
+import asyncio
+
+from gateway.downlink import DownlinkScheduler, parametros_p2p, tiempo_en_aire
+
+
+def test_tiempo_en_aire():
+    # SF7/125 kHz, 4/5, 10 símbolos de preámbulo: ~36 ms para 10 bytes
+    assert 0.03 < tiempo_en_aire(10) < 0.045
+    assert tiempo_en_aire(10, sf=12) > 20 * tiempo_en_aire(10)
+    assert tiempo_en_aire(50) > tiempo_en_aire(10)
+
+
+def test_parametros_p2p():
+    assert parametros_p2p("923700000:9:125:1:8:14") == {"sf": 9, "bw_khz": 125, "cr": 2, "preambulo": 8}
+
+
+def test_comando_nuevo_reemplaza_al_pendiente():
+    planificador = DownlinkScheduler(enviar=None)
+    planificador.encolar("bomba", 1, device_id=5)
+    ultimo = planificador.encolar("bomba", 0, device_id=5)
+    planificador.encolar("bomba", 1, device_id=6)
+
+    assert planificador.encolar("desconocido", 1) is None
+    assert planificador.reemplazados == 1
+    assert planificador.stats()["pendientes"] == 2
+    assert planificador._pendientes[(5, "B")] is ultimo
+
+
+def correr(planificador: DownlinkScheduler, escenario):
+    async def principal():
+        tarea = asyncio.create_task(planificador.run())
+        try:
+            await escenario()
+        finally:
+            tarea.cancel()
+
+    asyncio.run(principal())
+
+
+async def esperar(condicion, timeout: float = 2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condicion():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condición no alcanzada")
+
+
+def nuevo_planificador(**kwargs):
+    enviados = []
+
+    async def enviar(texto):
+        enviados.append(texto)
+
+    opciones = {"ack_timeout": 0.05, "backoff_base": 0.01, "duty_cycle": 1.0}
+    opciones.update(kwargs)
+    return DownlinkScheduler(enviar, **opciones), enviados
+
+
+def test_sin_id_por_defecto():
+    planificador, enviados = nuevo_planificador(ack_timeout=5)
+    planificador.encolar("bomba", 1)
+    planificador.encolar("servo", 45)
+
+    async def escenario():
+        await esperar(lambda: enviados)
+        assert enviados == ["B:1"]
+        # Firmware antiguo: responde con la letra del actuador
+        assert planificador.respuesta("OK:B:1")
+        assert planificador.stats()["pendientes"] == 1
+
+    correr(planificador, escenario)
+
+
+def test_confirmacion_por_id():
+    planificador, enviados = nuevo_planificador(ack_timeout=5, con_id=True)
+    comando = planificador.encolar("bomba", 1)
+
+    async def escenario():
+        await esperar(lambda: enviados)
+        assert enviados == [f"B:1#{comando.id}"]
+        assert planificador.respuesta(f"OK:B:1#{comando.id}")
+        assert planificador.stats()["pendientes"] == 0
+        assert planificador.confirmados == 1
+
+    correr(planificador, escenario)
+
+
+def test_confirmacion_de_firmware_sin_id():
+    planificador, enviados = nuevo_planificador(ack_timeout=5)
+    planificador.encolar("servo", 90)
+
+    async def escenario():
+        await esperar(lambda: enviados)
+        # Sin id ni letra: se empareja con el último comando enviado
+        assert planificador.respuesta("OK:")
+        assert planificador.confirmados == 1
+
+    correr(planificador, escenario)
+
+
+def test_texto_que_no_es_respuesta():
+    planificador, _ = nuevo_planificador()
+    assert not planificador.respuesta("temp:20")
+
+
+def test_reintenta_sin_respuesta_y_descarta():
+    planificador, enviados = nuevo_planificador(max_intentos=3)
+    planificador.encolar("motor", 1)
+
+    async def escenario():
+        await esperar(lambda: planificador.descartados == 1)
+        assert len(enviados) == 3
+        assert planificador.reintentos == 2
+        assert planificador.stats()["pendientes"] == 0
+
+    correr(planificador, escenario)
+
+
+def test_ignorado_reintenta():
+    planificador, enviados = nuevo_planificador(ack_timeout=5, con_id=True)
+    comando = planificador.encolar("bomba", 1)
+
+    async def escenario():
+        await esperar(lambda: len(enviados) == 1)
+        planificador.respuesta(f"IGNORADO:B:1#{comando.id}")
+        await esperar(lambda: len(enviados) == 2)
+        planificador.respuesta(f"OK:B:1#{comando.id}")
+        assert planificador.confirmados == 1
+
+    correr(planificador, escenario)
+
+
+def test_respeta_el_ciclo_de_trabajo():
+    planificador, enviados = nuevo_planificador(ack_timeout=5, duty_cycle=0.01)
+    planificador.encolar("bomba", 1)
+    planificador.encolar("servo", 1)
+
+    async def escenario():
+        await esperar(lambda: enviados)
+        # ~36 ms en el aire al 1%: la radio queda ocupada ~3.6 s
+        await asyncio.sleep(0.2)
+        assert len(enviados) == 1
+
+    correr(planificador, escenario)
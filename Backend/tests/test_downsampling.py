@@ -0,0 +1,33 @@
+import math
+
+from app.services.downsampling import lttb
+
+
+def test_returns_input_when_under_threshold():
+    points = [(float(i), float(i)) for i in range(10)]
+
+    assert lttb(points, 10) == points
+    assert lttb(points, 50) == points
+    assert lttb(points, 2) == points
+
+
+def test_keeps_ends_and_threshold():
+    points = [(float(i), math.sin(i / 10)) for i in range(1000)]
+
+    sampled = lttb(points, 100)
+
+    assert len(sampled) == 100
+    assert sampled[0] == points[0]
+    assert sampled[-1] == points[-1]
+    assert [x for x, _ in sampled] == sorted(x for x, _ in sampled)
+
+
+def test_keeps_spikes():
+    points = [(float(i), 0.0) for i in range(1000)]
+    points[400] = (400.0, 100.0)
+    points[700] = (700.0, -100.0)
+
+    sampled = lttb(points, 20)
+
+    assert (400.0, 100.0) in sampled
+    assert (700.0, -100.0) in sampled
@@ -0,0 +1,123 @@
+import asyncio
+
+from app.services.frame_merger import FrameMerger
+
+CATALOG = ["temperatura", "humedad", "luz"]
+
+
+def make_merger(window: float = 0.05, catalog=CATALOG):
+    emitted = []
+
+    async def emit(device_id, data):
+        emitted.append((device_id, dict(data)))
+
+    merger = FrameMerger(emit, expected_keys=lambda: catalog, window=window, dedup_ttl=60)
+    return merger, emitted
+
+
+def test_complete_frame_is_emitted_at_once():
+    async def scenario():
+        merger, emitted = make_merger()
+        await merger.add(1, {"seq": 1, "temperatura": 20, "humedad": 40, "luz": 5})
+        assert emitted == [(1, {"seq": 1, "temperatura": 20, "humedad": 40, "luz": 5})]
+
+    asyncio.run(scenario())
+
+
+def test_partials_are_merged():
+    async def scenario():
+        merger, emitted = make_merger()
+        await merger.add(1, {"seq": 1, "temperatura": 20})
+        await merger.add(1, {"seq": 1, "humedad": 40})
+        assert emitted == []
+        await merger.add(1, {"seq": 1, "luz": 5})
+        assert emitted == [(1, {"seq": 1, "temperatura": 20, "humedad": 40, "luz": 5})]
+        assert merger.merged == 2
+
+    asyncio.run(scenario())
+
+
+def test_incomplete_frame_is_emitted_when_window_expires():
+    async def scenario():
+        merger, emitted = make_merger()
+        await merger.add(1, {"temperatura": 20})
+        await asyncio.sleep(0.1)
+        assert emitted == [(1, {"temperatura": 20})]
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_frame_id_is_dropped():
+    async def scenario():
+        merger, emitted = make_merger()
+        frame = {"seq": 9, "temperatura": 20, "humedad": 40, "luz": 5}
+        await merger.add(1, frame)
+        await merger.add(1, dict(frame))
+        # Mismo seq en otro dispositivo: no es duplicado
+        await merger.add(2, dict(frame))
+        assert len(emitted) == 2
+        assert merger.duplicates == 1
+
+    asyncio.run(scenario())
+
+
+def test_resent_frame_with_new_ts_is_a_duplicate():
+    async def scenario():
+        merger, emitted = make_merger()
+        frame = {"seq": 9, "temperatura": 20, "humedad": 40, "luz": 5}
+        await merger.add(1, {**frame, "ts": "2026-01-01T00:00:00+00:00"})
+        # El gateway vuelve a sellar el reenvío con la hora actual
+        await merger.add(1, {**frame, "ts": "2026-01-01T00:00:02+00:00"})
+        assert len(emitted) == 1
+        assert merger.duplicates == 1
+
+    asyncio.run(scenario())
+
+
+def test_seq_restart_after_reboot_is_not_a_duplicate():
+    async def scenario():
+        merger, emitted = make_merger()
+        await merger.add(1, {"seq": 1, "temperatura": 20, "humedad": 40, "luz": 5})
+        await merger.add(1, {"seq": 1, "temperatura": 23, "humedad": 38, "luz": 9})
+        assert len(emitted) == 2
+        assert merger.duplicates == 0
+
+    asyncio.run(scenario())
+
+
+def test_device_without_every_catalog_sensor_does_not_wait():
+    async def scenario():
+        merger, emitted = make_merger(catalog=CATALOG + ["suelo"])
+        await merger.add(1, {"seq": 1, "temperatura": 20, "humedad": 40, "luz": 5})
+        assert emitted == []
+        await asyncio.sleep(0.1)
+        assert len(emitted) == 1
+
+        # Ya sabemos qué manda este nodo
+        await merger.add(1, {"seq": 2, "temperatura": 21, "humedad": 41, "luz": 6})
+        assert len(emitted) == 2
+
+    asyncio.run(scenario())
+
+
+def test_repeated_partial_without_frame_id_is_dropped():
+    async def scenario():
+        merger, emitted = make_merger()
+        await merger.add(1, {"temperatura": 20, "humedad": 40, "luz": 5})
+        await merger.add(1, {"humedad": 40})
+        assert len(emitted) == 1
+        assert merger.duplicates == 1
+
+    asyncio.run(scenario())
+
+
+def test_flush_releases_pending_frames():
+    async def scenario():
+        merger, emitted = make_merger(window=10)
+        await merger.add(1, {"temperatura": 20})
+        await merger.add(2, {"seq": 3, "luz": 5})
+        await merger.flush()
+        assert sorted(device_id for device_id, _ in emitted) == [1, 2]
+        assert merger.stats()["pending_frames"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+from gateway.spool import EnlaceMQTT, Spool
+
+
+def test_orden_y_confirmacion(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    for i in range(5):
+        spool.agregar("t", f"m{i}")
+
+    lote = spool.lote(3)
+    assert [payload for _, _, payload in lote] == ["m0", "m1", "m2"]
+
+    spool.confirmar(lote[-1][0])
+    assert len(spool) == 2
+    assert [payload for _, _, payload in spool.lote(10)] == ["m3", "m4"]
+    assert spool.bytes == 2 * len("tm3")
+
+
+def test_sobrevive_a_reinicios(tmp_path):
+    ruta = str(tmp_path / "spool.db")
+    spool = Spool(ruta)
+    spool.agregar("a/b", "hola")
+    spool.close()
+
+    spool = Spool(ruta)
+    assert len(spool) == 1
+    assert spool.bytes == len("a/b") + len("hola")
+    assert spool.lote(1)[0][1:] == ("a/b", "hola")
+
+
+def test_limite_de_tamano_descarta_lo_mas_antiguo(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"), max_bytes=100)
+    for i in range(20):
+        spool.agregar("t", f"{i:09d}")
+    spool.podar()
+
+    assert spool.bytes <= 100
+    assert spool.descartados == 20 - len(spool)
+    assert spool.lote(100)[-1][2] == f"{19:09d}"
+
+
+def test_retencion(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"), retencion=60)
+    spool.agregar("t", "viejo")
+    spool.db.execute("UPDATE spool SET creado = ?", (time.time() - 120,))
+    spool.agregar("t", "nuevo")
+    spool.podar()
+
+    assert [payload for _, _, payload in spool.lote(10)] == ["nuevo"]
+
+
+class ClienteFalso:
+    def __init__(self, fallar: int = 0):
+        self.publicados = []
+        self.fallar = fallar
+
+    async def publish(self, topico, payload, qos=0):
+        if self.fallar:
+            self.fallar -= 1
+            raise ConnectionError("sin conexión")
+        self.publicados.append(payload)
+
+
+def test_enlace_sin_conexion_guarda_y_reenvia_en_orden(tmp_path):
+    async def escenario():
+        enlace = EnlaceMQTT(Spool(str(tmp_path / "spool.db")), tamano_lote=2)
+        assert not await enlace.publicar("t", "1")
+        assert not await enlace.publicar("t", "2")
+
+        cliente = ClienteFalso()
+        tarea = asyncio.create_task(enlace.tarea_reenviar())
+        enlace.conectar(cliente)
+        # Con spool pendiente, lo nuevo va detrás para no desordenar
+        assert not await enlace.publicar("t", "3")
+        for _ in range(50):
+            if not len(enlace.spool):
+                break
+            await asyncio.sleep(0.01)
+        tarea.cancel()
+
+        assert cliente.publicados == ["1", "2", "3"]
+        assert enlace.reenviados == 3
+        assert await enlace.publicar("t", "4")
+        assert cliente.publicados[-1] == "4"
+
+    asyncio.run(escenario())
+
+
+def test_enlace_reintenta_sin_soltar_el_cliente(tmp_path):
+    async def escenario():
+        enlace = EnlaceMQTT(Spool(str(tmp_path / "spool.db")), backoff_base=0.01)
+        cliente = ClienteFalso(fallar=3)
+        enlace.conectar(cliente)
+        tarea = asyncio.create_task(enlace.tarea_reenviar())
+
+        # Falla el envío directo y los dos primeros reenvíos
+        assert not await enlace.publicar("t", "1")
+        assert enlace.cliente is cliente
+        assert not await enlace.publicar("t", "2")
+        for _ in range(100):
+            if not len(enlace.spool):
+                break
+            await asyncio.sleep(0.01)
+        tarea.cancel()
+
+        assert cliente.publicados == ["1", "2"]
+        assert enlace.fallos == 3
+        assert enlace.cliente is cliente
+
+    asyncio.run(escenario())
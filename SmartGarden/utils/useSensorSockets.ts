@@ -2,7 +2,8 @@ import { useState, useEffect, useRef } from 'react';
 import { IP, SensorData } from './types';
 
 
-const WS_URL = `ws://${IP}:8000/system/ws/sensor-readings`;
+// Sólo nos interesa el dispositivo que muestra la app
+const WS_URL = `ws://${IP}:8000/system/ws/sensor-readings?device_id=1`;
 
 export function useSensorSocket() {
   const [data, setData] = useState<SensorData | null>(null);